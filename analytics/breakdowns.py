@@ -0,0 +1,109 @@
+"""Top-k rankings per group and the transaction breakdowns built on them."""
+
+import threading
+
+import polars as pl
+
+BREAKDOWN_KEYS = ["code_departement", "nom_commune", "type_local", "is_outlier"]
+DEFAULT_TOP_K = 3
+MAX_CACHED_SELECTIONS = 64
+
+
+def top_k_per_group(data, group_columns, value_column, k, tie_columns=None):
+    """
+    Rows holding the k largest value_column of each group, with their rank.
+
+    One sort orders the rows by group, then value (descending) and
+    tie_columns (ascending), so results are stable; the rank is the row
+    number within the group, and the output is already in group and rank
+    order.
+    """
+    tie_columns = tie_columns or []
+    return (
+        data.sort(
+            group_columns + [value_column] + tie_columns,
+            descending=[False] * len(group_columns)
+            + [True]
+            + [False] * len(tie_columns),
+        )
+        .with_columns(
+            (pl.int_range(pl.len(), dtype=pl.UInt32).over(group_columns) + 1).alias(
+                "rank"
+            )
+        )
+        .filter(pl.col("rank") <= k)
+    )
+
+
+class TransactionBreakdowns:
+    """
+    Type distribution, top types per commune and top communes for any filter.
+
+    The transactions are counted once per department, commune, type and
+    outlier flag; every filter state then derives all breakdowns from that
+    small table and caches them, so the widgets of a page share one result.
+    """
+
+    def __init__(self, data):
+        keys = [col for col in BREAKDOWN_KEYS if col in data.columns]
+        self.counts = data.group_by(keys).agg(pl.len().alias("transaction_count"))
+        if "is_outlier" not in keys:
+            self.counts = self.counts.with_columns(pl.lit(False).alias("is_outlier"))
+        self._cache = {}
+        # Shared by every session thread with the processor
+        self._cache_lock = threading.Lock()
+
+    def get(
+        self,
+        departments=None,
+        types=None,
+        include_outliers=False,
+        k=DEFAULT_TOP_K,
+    ):
+        """
+        Return a dict of DataFrames for the selection.
+
+        type_distribution: transactions per type. top_types_by_commune: the
+        k most sold types of each commune with their rank. top_communes:
+        transactions per commune, most active first.
+        """
+        key = (
+            tuple(sorted(departments or [])),
+            tuple(sorted(types or [])),
+            bool(include_outliers),
+            k,
+        )
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        counts = self.counts
+        if departments:
+            counts = counts.filter(pl.col("code_departement").is_in(departments))
+        if types:
+            counts = counts.filter(pl.col("type_local").is_in(types))
+        if not include_outliers:
+            counts = counts.filter(~pl.col("is_outlier"))
+        by_commune_type = counts.group_by(["nom_commune", "type_local"]).agg(
+            pl.sum("transaction_count")
+        )
+        breakdowns = {
+            "type_distribution": by_commune_type.group_by("type_local")
+            .agg(pl.sum("transaction_count").alias("count"))
+            .sort(["count", "type_local"], descending=[True, False]),
+            "top_types_by_commune": top_k_per_group(
+                by_commune_type,
+                ["nom_commune"],
+                "transaction_count",
+                k,
+                tie_columns=["type_local"],
+            ),
+            "top_communes": by_commune_type.group_by("nom_commune")
+            .agg(pl.sum("transaction_count"))
+            .sort(["transaction_count", "nom_commune"], descending=[True, False]),
+        }
+        with self._cache_lock:
+            if len(self._cache) >= MAX_CACHED_SELECTIONS:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = breakdowns
+        return breakdowns
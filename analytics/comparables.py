@@ -0,0 +1,354 @@
+"""Comparable-sales search and weighted price estimates."""
+
+import numpy as np
+import polars as pl
+
+from analytics.spatial_index import SpatialIndex
+
+DEFAULT_K = 10
+DEFAULT_MAX_DISTANCE_KM = 5.0
+DEFAULT_SURFACE_TOLERANCE = 0.3  # ±30 % of the target surface
+DEFAULT_ROOMS_TOLERANCE = 1
+DEFAULT_MAX_AGE_YEARS = 3
+# Queries scored together by find_batch; bounds the (query, candidate) pairs held
+BATCH_CHUNK_QUERIES = 256
+# DVF repeats a sale on one row per disposition; one row per sold lot is kept
+SALE_KEY = ["id_mutation", "id_parcelle", "lot1_numero"]
+
+COMPARABLE_COLUMNS = [
+    "id_mutation",
+    "date_mutation",
+    "type_local",
+    "valeur_fonciere",
+    "surface_reelle_bati",
+    "nombre_pieces_principales",
+    "price_per_sqm",
+    "adresse_numero",
+    "adresse_nom_voie",
+    "nom_commune",
+    "code_postal",
+    "latitude",
+    "longitude",
+]
+
+
+class ComparablesEngine:
+    """
+    Answer "what did similar properties nearby sell for?".
+
+    One spatial index is built per type_local so the type prefilter costs
+    nothing; surface, room count and sale age are then checked on the
+    candidates returned by the index. Sale age is measured against the most
+    recent sale in the data, not today's date. Repeated rows of a sale are
+    dropped, as in PriceIndexEngine, so no sale is counted twice.
+    """
+
+    def __init__(self, data):
+        columns = [col for col in COMPARABLE_COLUMNS if col in data.columns]
+        sale_key = [col for col in SALE_KEY if col in data.columns]
+        self.sales = (
+            data.filter(
+                pl.col("latitude").is_not_null() & pl.col("longitude").is_not_null()
+            )
+            .unique(subset=sale_key, keep="first", maintain_order=True)
+            .select(columns)
+        )
+
+        self.surface = self.sales["surface_reelle_bati"].to_numpy()
+        self.rooms = (
+            self.sales["nombre_pieces_principales"].fill_null(-1).to_numpy()
+            if "nombre_pieces_principales" in self.sales.columns
+            else np.full(self.sales.height, -1)
+        )
+        self.price_per_sqm = self.sales["price_per_sqm"].to_numpy()
+        self.id_mutation = (
+            self.sales["id_mutation"].to_numpy()
+            if "id_mutation" in self.sales.columns
+            else None
+        )
+        sale_days = self.sales["date_mutation"].cast(pl.Int32).to_numpy()
+        self.age_years = (sale_days.max() - sale_days) / 365.25
+        self.reference_date = self.sales["date_mutation"].max()
+
+        latitude = self.sales["latitude"].to_numpy()
+        longitude = self.sales["longitude"].to_numpy()
+        types = self.sales["type_local"].to_numpy()
+        self.indexes = {}
+        for type_name in np.unique(types):
+            positions = np.flatnonzero(types == type_name)
+            self.indexes[type_name] = (
+                positions,
+                SpatialIndex(latitude[positions], longitude[positions]),
+            )
+        print(
+            f"Comparables engine ready with {self.sales.height} sales "
+            f"over {len(self.indexes)} property types."
+        )
+
+    def _candidate_mask(
+        self,
+        positions,
+        surface,
+        rooms,
+        surface_tolerance,
+        rooms_tolerance,
+        max_age,
+        exclude_id_mutation=None,
+    ):
+        mask = np.ones(len(positions), dtype=bool)
+        if exclude_id_mutation is not None and self.id_mutation is not None:
+            mask &= self.id_mutation[positions] != exclude_id_mutation
+        if surface:
+            candidate_surface = self.surface[positions]
+            mask &= np.abs(candidate_surface - surface) <= surface_tolerance * surface
+        if rooms is not None and rooms_tolerance is not None:
+            candidate_rooms = self.rooms[positions]
+            mask &= (candidate_rooms >= 0) & (
+                np.abs(candidate_rooms - rooms) <= rooms_tolerance
+            )
+        if max_age is not None:
+            mask &= self.age_years[positions] <= max_age
+        return mask
+
+    def _search(
+        self,
+        latitude,
+        longitude,
+        type_local,
+        surface,
+        rooms,
+        k,
+        max_distance_km,
+        surface_tolerance,
+        rooms_tolerance,
+        max_age_years,
+        exclude_id_mutation=None,
+    ):
+        if type_local not in self.indexes:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        type_positions, index = self.indexes[type_local]
+        mask = self._candidate_mask(
+            type_positions,
+            surface,
+            rooms,
+            surface_tolerance,
+            rooms_tolerance,
+            max_age_years,
+            exclude_id_mutation,
+        )
+        local_positions, distances = index.nearest(
+            latitude,
+            longitude,
+            k,
+            max_radius_m=max_distance_km * 1000 if max_distance_km else None,
+            mask=mask,
+        )
+        return type_positions[local_positions], distances
+
+    def _estimate(self, positions, distances, surface):
+        """Weighted price per m²: closer, more similar and more recent sales count more."""
+        if len(positions) == 0:
+            return None, None
+        weights = 1.0 / (1.0 + distances / 500.0)
+        if surface:
+            weights *= np.exp(-np.abs(np.log(self.surface[positions] / surface)))
+        weights *= np.exp(-self.age_years[positions] / DEFAULT_MAX_AGE_YEARS)
+        estimate = float(np.average(self.price_per_sqm[positions], weights=weights))
+        return estimate, weights
+
+    def find(
+        self,
+        latitude,
+        longitude,
+        type_local,
+        surface=None,
+        rooms=None,
+        k=DEFAULT_K,
+        max_distance_km=DEFAULT_MAX_DISTANCE_KM,
+        surface_tolerance=DEFAULT_SURFACE_TOLERANCE,
+        rooms_tolerance=DEFAULT_ROOMS_TOLERANCE,
+        max_age_years=DEFAULT_MAX_AGE_YEARS,
+        exclude_id_mutation=None,
+    ):
+        """
+        Return the k nearest similar recent sales and the weighted estimate.
+
+        The result is a (comparables DataFrame, estimate dict) tuple; the
+        DataFrame carries 'distance_m' and 'weight' columns. A sale being
+        valued passes its exclude_id_mutation so it is not its own comparable.
+        """
+        positions, distances = self._search(
+            latitude,
+            longitude,
+            type_local,
+            surface,
+            rooms,
+            k,
+            max_distance_km,
+            surface_tolerance,
+            rooms_tolerance,
+            max_age_years,
+            exclude_id_mutation,
+        )
+        estimate, weights = self._estimate(positions, distances, surface)
+        comparables = self.sales[positions].with_columns(
+            [
+                pl.Series("distance_m", distances.round(0)),
+                pl.Series(
+                    "weight",
+                    weights if weights is not None else np.empty(0),
+                    dtype=pl.Float64,
+                ),
+            ]
+        )
+        summary = {
+            "comparable_count": len(positions),
+            "estimated_price_per_sqm": estimate,
+            "estimated_value": estimate * surface
+            if estimate is not None and surface
+            else None,
+            "median_distance_m": float(np.median(distances))
+            if len(distances)
+            else None,
+        }
+        return comparables, summary
+
+    def find_batch(
+        self,
+        queries,
+        k=DEFAULT_K,
+        max_distance_km=DEFAULT_MAX_DISTANCE_KM,
+        surface_tolerance=DEFAULT_SURFACE_TOLERANCE,
+        rooms_tolerance=DEFAULT_ROOMS_TOLERANCE,
+        max_age_years=DEFAULT_MAX_AGE_YEARS,
+    ):
+        """
+        Estimate many properties at once, with the same results as find().
+
+        queries is a DataFrame with 'latitude', 'longitude', 'type_local' and
+        optionally 'surface_reelle_bati', 'nombre_pieces_principales' and
+        'id_mutation' (a sale is then not its own comparable) columns. Returns
+        the queries with comparable_count, estimated_price_per_sqm,
+        estimated_value and median_distance_m appended.
+
+        Queries of a type are scored chunk by chunk as arrays of
+        (query, candidate) pairs: every candidate within max_distance_km is
+        filtered, ranked and weighted in numpy, without a loop over queries.
+        """
+        if not max_distance_km or max_distance_km <= 0:
+            raise ValueError("find_batch needs a positive max_distance_km")
+        n_queries = queries.height
+        counts = np.zeros(n_queries, dtype=np.int64)
+        estimates = np.full(n_queries, np.nan)
+        median_distances = np.full(n_queries, np.nan)
+
+        def column(name, fill):
+            if name not in queries.columns:
+                return np.full(n_queries, fill)
+            return queries[name].cast(pl.Float64).fill_null(fill).to_numpy()
+
+        latitude = column("latitude", np.nan)
+        longitude = column("longitude", np.nan)
+        surface = column("surface_reelle_bati", 0.0)
+        rooms = column("nombre_pieces_principales", -1.0)
+        types = queries["type_local"].to_numpy()
+        exclude = (
+            queries["id_mutation"].to_numpy()
+            if "id_mutation" in queries.columns and self.id_mutation is not None
+            else None
+        )
+
+        for type_name, (type_positions, index) in self.indexes.items():
+            type_queries = np.flatnonzero(types == type_name)
+            for start in range(0, len(type_queries), BATCH_CHUNK_QUERIES):
+                chunk = type_queries[start : start + BATCH_CHUNK_QUERIES]
+                local_query, local_positions, distances = index.pairs_within(
+                    latitude[chunk], longitude[chunk], max_distance_km * 1000
+                )
+                query_idx = chunk[local_query]
+                positions = type_positions[local_positions]
+
+                # Same filters as _candidate_mask, per pair
+                query_surface = surface[query_idx]
+                keep = (query_surface <= 0) | (
+                    np.abs(self.surface[positions] - query_surface)
+                    <= surface_tolerance * query_surface
+                )
+                if rooms_tolerance is not None:
+                    query_rooms = rooms[query_idx]
+                    candidate_rooms = self.rooms[positions]
+                    keep &= (query_rooms < 0) | (
+                        (candidate_rooms >= 0)
+                        & (np.abs(candidate_rooms - query_rooms) <= rooms_tolerance)
+                    )
+                if max_age_years is not None:
+                    keep &= self.age_years[positions] <= max_age_years
+                if exclude is not None:
+                    keep &= self.id_mutation[positions] != exclude[query_idx]
+                query_idx = query_idx[keep]
+                positions = positions[keep]
+                distances = distances[keep]
+
+                # k nearest per query: sort by (query, distance), rank in group
+                order = np.lexsort((distances, query_idx))
+                query_idx = query_idx[order]
+                positions = positions[order]
+                distances = distances[order]
+                group_ids, group_starts, group_sizes = np.unique(
+                    query_idx, return_index=True, return_counts=True
+                )
+                rank = np.arange(len(query_idx)) - np.repeat(group_starts, group_sizes)
+                nearest = rank < k
+                query_idx = query_idx[nearest]
+                positions = positions[nearest]
+                distances = distances[nearest]
+                if not len(query_idx):
+                    continue
+
+                # Same weights as _estimate
+                weights = 1.0 / (1.0 + distances / 500.0)
+                query_surface = surface[query_idx]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    surface_weight = np.exp(
+                        -np.abs(np.log(self.surface[positions] / query_surface))
+                    )
+                weights *= np.where(query_surface > 0, surface_weight, 1.0)
+                weights *= np.exp(-self.age_years[positions] / DEFAULT_MAX_AGE_YEARS)
+
+                group_ids, group_starts, group_sizes = np.unique(
+                    query_idx, return_index=True, return_counts=True
+                )
+                weight_sums = np.add.reduceat(weights, group_starts)
+                counts[group_ids] = group_sizes
+                estimates[group_ids] = (
+                    np.add.reduceat(
+                        weights * self.price_per_sqm[positions], group_starts
+                    )
+                    / weight_sums
+                )
+                # Distances are sorted within each group
+                median_distances[group_ids] = (
+                    distances[group_starts + (group_sizes - 1) // 2]
+                    + distances[group_starts + group_sizes // 2]
+                ) / 2
+
+        return queries.with_columns(
+            [
+                pl.Series("comparable_count", counts, dtype=pl.Int64),
+                pl.Series(
+                    "estimated_price_per_sqm", estimates, dtype=pl.Float64
+                ).fill_nan(None),
+                pl.Series(
+                    "median_distance_m", median_distances, dtype=pl.Float64
+                ).fill_nan(None),
+            ]
+        ).with_columns(
+            (
+                pl.col("estimated_price_per_sqm")
+                * pl.when(pl.col("surface_reelle_bati") > 0).then(
+                    pl.col("surface_reelle_bati")
+                )
+                if "surface_reelle_bati" in queries.columns
+                else pl.lit(None, dtype=pl.Float64)
+            ).alias("estimated_value")
+        )
@@ -0,0 +1,313 @@
+"""Distribution summaries (quartiles, whiskers, capped outliers, histograms) per group."""
+
+import polars as pl
+
+from analytics.monthly_cube import sketch_bucket, sketch_bucket_value
+from analytics.price_index import month_id
+
+MAX_OUTLIER_POINTS = 50  # Per box, most extreme first
+WHISKER_IQR = 1.5
+DEFAULT_HISTOGRAM_BIN_WIDTH = 250
+DISTRIBUTION_KEYS = ["code_departement", "type_local", "is_outlier", "month_id"]
+SUMMARY_COLUMNS = [
+    "count",
+    "mean",
+    "q1",
+    "median",
+    "q3",
+    "lower_whisker",
+    "upper_whisker",
+    "outliers",
+]
+
+
+def _with_whiskers(quartiles):
+    iqr = pl.col("q3") - pl.col("q1")
+    return quartiles.with_columns(
+        [
+            (pl.col("q1") - WHISKER_IQR * iqr).alias("lower_fence"),
+            (pl.col("q3") + WHISKER_IQR * iqr).alias("upper_fence"),
+        ]
+    )
+
+
+def _capped_outliers(values, group_columns, value_column, fences, max_outliers):
+    """Values beyond the fences, at most max_outliers per group, most extreme first."""
+    return (
+        values.join(fences, on=group_columns, nulls_equal=True)
+        .filter(
+            (pl.col(value_column) < pl.col("lower_fence"))
+            | (pl.col(value_column) > pl.col("upper_fence"))
+        )
+        .with_columns(
+            (
+                (pl.col(value_column) - pl.col("median")).abs()
+                / (pl.col("q3") - pl.col("q1")).clip(lower_bound=1e-9)
+            ).alias("extremeness")
+        )
+        .sort("extremeness", descending=True)
+        .group_by(group_columns, maintain_order=True)
+        .agg(pl.col(value_column).head(max_outliers).alias("outliers"))
+    )
+
+
+def summarize_distribution(
+    data, group_columns, value_column="price_per_sqm", max_outliers=MAX_OUTLIER_POINTS
+):
+    """
+    Exact box-plot summary of value_column per group.
+
+    Returns group_columns plus count, mean, q1, median, q3, the Tukey
+    whiskers (most extreme values within 1.5 IQR of the quartiles) and a
+    capped list of the values beyond them.
+    """
+    values = data.select(group_columns + [value_column]).filter(
+        pl.col(value_column).is_not_null()
+    )
+    if values.is_empty():
+        return pl.DataFrame()
+    value = pl.col(value_column)
+    quartiles = _with_whiskers(
+        values.group_by(group_columns).agg(
+            [
+                pl.len().alias("count"),
+                value.mean().alias("mean"),
+                value.quantile(0.25, interpolation="linear").alias("q1"),
+                value.median().alias("median"),
+                value.quantile(0.75, interpolation="linear").alias("q3"),
+            ]
+        )
+    )
+    whiskers = (
+        values.join(quartiles, on=group_columns, nulls_equal=True)
+        .group_by(group_columns)
+        .agg(
+            [
+                value.filter(value >= pl.col("lower_fence"))
+                .min()
+                .alias("lower_whisker"),
+                value.filter(value <= pl.col("upper_fence"))
+                .max()
+                .alias("upper_whisker"),
+            ]
+        )
+    )
+    outliers = _capped_outliers(
+        values, group_columns, value_column, quartiles, max_outliers
+    )
+    return (
+        quartiles.join(whiskers, on=group_columns, nulls_equal=True)
+        .join(outliers, on=group_columns, how="left", nulls_equal=True)
+        .with_columns(pl.col("outliers").fill_null([]))
+        .select(group_columns + SUMMARY_COLUMNS)
+        .sort(group_columns)
+    )
+
+
+class DistributionStore:
+    """
+    Mergeable price-per-m² distributions per department, type, outlier flag and month.
+
+    Each cell keeps log-bucket sketch counts (the monthly cube's 1 %
+    buckets) and its MAX_OUTLIER_POINTS lowest and highest prices. Any
+    union of cells (several departments, a year, all types…) is summarised
+    by summing bucket counts, so charts need a few hundred numbers per box
+    instead of the raw transactions.
+    """
+
+    def __init__(self, data):
+        cells = data.filter(
+            pl.col("price_per_sqm").is_not_null()
+            & (pl.col("price_per_sqm") > 0)
+            & pl.col("date_mutation").is_not_null()
+        ).with_columns(
+            [
+                month_id().alias("month_id"),
+                (
+                    pl.col("is_outlier")
+                    if "is_outlier" in data.columns
+                    else pl.lit(False).alias("is_outlier")
+                ),
+            ]
+        )
+        self.sketches = (
+            cells.with_columns(sketch_bucket().alias("bucket"))
+            .group_by(DISTRIBUTION_KEYS + ["bucket"])
+            .agg(
+                [
+                    pl.len().cast(pl.Int64).alias("count"),
+                    pl.sum("price_per_sqm").alias("sum_price_per_sqm"),
+                ]
+            )
+        )
+        ordered = cells.select(DISTRIBUTION_KEYS + ["price_per_sqm"]).sort(
+            "price_per_sqm"
+        )
+        self.extremes = pl.concat(
+            [
+                ordered.group_by(DISTRIBUTION_KEYS, maintain_order=True).head(
+                    MAX_OUTLIER_POINTS
+                ),
+                ordered.group_by(DISTRIBUTION_KEYS, maintain_order=True).tail(
+                    MAX_OUTLIER_POINTS
+                ),
+            ]
+        ).unique(maintain_order=True)
+        print(
+            f"Distribution store built with {self.sketches.height} sketch buckets "
+            f"and {self.extremes.height} extreme values."
+        )
+
+    def _select(self, frame, departments, types, include_outliers, months):
+        if departments:
+            frame = frame.filter(pl.col("code_departement").is_in(departments))
+        if types:
+            frame = frame.filter(pl.col("type_local").is_in(types))
+        if not include_outliers:
+            frame = frame.filter(~pl.col("is_outlier"))
+        if months is not None:
+            frame = frame.filter(pl.col("month_id").is_between(months[0], months[1]))
+        return frame.with_columns(
+            [
+                (pl.col("month_id") // 12).alias("year"),
+                (pl.col("month_id") % 12 + 1).alias("month"),
+            ]
+        )
+
+    def summary(
+        self,
+        by,
+        departments=None,
+        types=None,
+        include_outliers=False,
+        months=None,
+        max_outliers=MAX_OUTLIER_POINTS,
+    ):
+        """
+        Box-plot summary per group (same columns as summarize_distribution).
+
+        by lists grouping columns among type_local, code_departement,
+        is_outlier, month_id, year and month; months is an optional
+        inclusive (first, last) month_id range. Quartiles and whiskers are
+        within the sketch accuracy, counts and means are exact.
+        """
+        sketches = self._select(
+            self.sketches, departments, types, include_outliers, months
+        )
+        if sketches.is_empty():
+            return pl.DataFrame()
+        merged = (
+            sketches.group_by(by + ["bucket"])
+            .agg([pl.sum("count"), pl.sum("sum_price_per_sqm")])
+            .sort(by + ["bucket"])
+            .with_columns(
+                [
+                    pl.col("count").cum_sum().over(by).alias("cumulative"),
+                    pl.col("count").sum().over(by).alias("total"),
+                    sketch_bucket_value().alias("value"),
+                ]
+            )
+        )
+
+        def quantile(q):
+            return (
+                pl.col("value")
+                .filter(pl.col("cumulative") >= q * pl.col("total"))
+                .first()
+            )
+
+        quartiles = _with_whiskers(
+            merged.group_by(by).agg(
+                [
+                    pl.sum("count").alias("count"),
+                    (pl.sum("sum_price_per_sqm") / pl.sum("count")).alias("mean"),
+                    quantile(0.25).alias("q1"),
+                    quantile(0.5).alias("median"),
+                    quantile(0.75).alias("q3"),
+                ]
+            )
+        )
+        whiskers = (
+            merged.join(quartiles, on=by, nulls_equal=True)
+            .group_by(by)
+            .agg(
+                [
+                    pl.col("value")
+                    .filter(pl.col("value") >= pl.col("lower_fence"))
+                    .min()
+                    .alias("lower_whisker"),
+                    pl.col("value")
+                    .filter(pl.col("value") <= pl.col("upper_fence"))
+                    .max()
+                    .alias("upper_whisker"),
+                ]
+            )
+        )
+        extremes = self._select(
+            self.extremes, departments, types, include_outliers, months
+        )
+        outliers = _capped_outliers(
+            extremes, by, "price_per_sqm", quartiles, max_outliers
+        )
+        return (
+            quartiles.join(whiskers, on=by, nulls_equal=True)
+            .join(outliers, on=by, how="left", nulls_equal=True)
+            .with_columns(pl.col("outliers").fill_null([]))
+            .select(by + SUMMARY_COLUMNS)
+            .sort(by)
+        )
+
+    def quantiles(
+        self, qs, departments=None, types=None, include_outliers=False, months=None
+    ):
+        """
+        Price per m² quantiles of the whole selection, within the sketch accuracy.
+
+        Returns one value per q in qs, or Nones when the selection is empty.
+        """
+        sketches = self._select(
+            self.sketches, departments, types, include_outliers, months
+        )
+        if sketches.is_empty():
+            return [None] * len(qs)
+        merged = (
+            sketches.group_by("bucket")
+            .agg(pl.sum("count"))
+            .sort("bucket")
+            .with_columns(
+                [
+                    pl.col("count").cum_sum().alias("cumulative"),
+                    sketch_bucket_value().alias("value"),
+                ]
+            )
+        )
+        total = merged["count"].sum()
+        return [
+            merged.filter(pl.col("cumulative") >= q * total)["value"][0] for q in qs
+        ]
+
+    def histogram(
+        self,
+        by,
+        departments=None,
+        types=None,
+        include_outliers=False,
+        months=None,
+        bin_width=DEFAULT_HISTOGRAM_BIN_WIDTH,
+    ):
+        """Counts per fixed-width price bin (bin_start, bin_end) and group."""
+        sketches = self._select(
+            self.sketches, departments, types, include_outliers, months
+        )
+        if sketches.is_empty():
+            return pl.DataFrame()
+        return (
+            sketches.with_columns(
+                (sketch_bucket_value() // bin_width * bin_width).alias("bin_start")
+            )
+            .group_by(by + ["bin_start"])
+            .agg(pl.sum("count"))
+            .with_columns((pl.col("bin_start") + bin_width).alias("bin_end"))
+            .select(by + ["bin_start", "bin_end", "count"])
+            .sort(by + ["bin_start"])
+        )
@@ -0,0 +1,205 @@
+"""Precomputed filter options and per-value row bitmaps for the sidebar filters."""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import polars as pl
+
+# Low-cardinality dimensions get one packed bitmap per value; communes are
+# too many for that and keep their row positions instead
+BITMAP_DIMENSIONS = ["code_departement", "type_local", "year"]
+POSITION_DIMENSIONS = ["code_commune"]
+MAX_CACHED_SELECTIONS = 4
+
+
+def _group_positions(data, column):
+    """Map each non-null value of column to the sorted positions of its rows."""
+    groups = (
+        data.select(pl.col(column))
+        .with_row_index("position")
+        .filter(pl.col(column).is_not_null())
+        .group_by(column)
+        .agg(pl.col("position"))
+    )
+    return {
+        value: np.asarray(positions, dtype=np.int64)
+        for value, positions in groups.iter_rows()
+    }
+
+
+class FilterIndex:
+    """
+    Filter options and row bitmaps of a frame, built once at load time.
+
+    options holds the sorted values of each dimension (department, type,
+    year, commune) so widgets never scan the frame. A filter state resolves
+    to a row mask by OR-ing the bitmaps of the selected values within a
+    dimension and AND-ing across dimensions; a dimension whose selection is
+    empty or covers every value is skipped, as in apply_filters. select()
+    returns the frame itself when nothing is filtered out, and caches the
+    last few selected frames.
+    """
+
+    def __init__(self, data):
+        self.row_count = data.height
+        self._row_bytes = (self.row_count + 7) // 8
+        columns = data.columns
+        if "date_mutation" in columns:
+            data = data.with_columns(pl.col("date_mutation").dt.year().alias("year"))
+            columns = data.columns
+
+        self.options = {}
+        self._bitmaps = {}
+        # Columns with nulls: selecting every value still drops those rows
+        self._has_nulls = {
+            column
+            for column in BITMAP_DIMENSIONS + POSITION_DIMENSIONS
+            if column in columns and data[column].null_count()
+        }
+        for column in BITMAP_DIMENSIONS:
+            if column not in columns:
+                continue
+            groups = _group_positions(data, column)
+            self.options[column] = sorted(groups)
+            self._bitmaps[column] = {
+                value: self._pack(positions) for value, positions in groups.items()
+            }
+        self._positions = {}
+        for column in POSITION_DIMENSIONS:
+            if column not in columns:
+                continue
+            self._positions[column] = _group_positions(data, column)
+            self.options[column] = sorted(self._positions[column])
+
+        self.commune_names = {}
+        if "code_commune" in columns and "nom_commune" in columns:
+            self.commune_names = dict(
+                data.select(["code_commune", "nom_commune"])
+                .drop_nulls("code_commune")
+                .unique("code_commune", keep="first")
+                .iter_rows()
+            )
+        self._inliers = (
+            self._pack(
+                np.flatnonzero((~data["is_outlier"]).fill_null(False).to_numpy())
+            )
+            if "is_outlier" in columns
+            else None
+        )
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _pack(self, positions):
+        bits = np.zeros(self.row_count, dtype=bool)
+        bits[positions] = True
+        return np.packbits(bits)
+
+    def _dimension_bits(self, column, values):
+        """Packed OR of the rows of values, or None when column is not filtered."""
+        if not values:
+            return None
+        values = set(values)
+        covers_all = column not in self._has_nulls
+        if column in self._bitmaps:
+            if covers_all and values.issuperset(self._bitmaps[column]):
+                return None
+            bitmaps = [
+                self._bitmaps[column][v] for v in values if v in self._bitmaps[column]
+            ]
+            if not bitmaps:
+                return np.zeros(self._row_bytes, dtype=np.uint8)
+            return np.bitwise_or.reduce(bitmaps)
+        if column in self._positions:
+            if covers_all and values.issuperset(self._positions[column]):
+                return None
+            positions = [
+                self._positions[column][v]
+                for v in values
+                if v in self._positions[column]
+            ]
+            return self._pack(
+                np.concatenate(positions) if positions else np.empty(0, np.int64)
+            )
+        return None  # Dimension absent from the data: not filtered
+
+    def _bits(self, departments, types, years, communes, include_outliers):
+        """Packed selection bitmap, or None when every row is selected."""
+        selected = None
+        for column, values in (
+            ("code_departement", departments),
+            ("type_local", types),
+            ("year", years),
+            ("code_commune", communes),
+        ):
+            bits = self._dimension_bits(column, values)
+            if bits is not None:
+                selected = bits if selected is None else selected & bits
+        if not include_outliers and self._inliers is not None:
+            selected = self._inliers if selected is None else selected & self._inliers
+        return selected
+
+    def mask(
+        self,
+        departments=None,
+        types=None,
+        years=None,
+        communes=None,
+        include_outliers=False,
+    ):
+        """Boolean array over the rows, True where the row passes the filters."""
+        bits = self._bits(departments, types, years, communes, include_outliers)
+        if bits is None:
+            return np.ones(self.row_count, dtype=bool)
+        return np.unpackbits(bits, count=self.row_count).astype(bool)
+
+    def count(
+        self,
+        departments=None,
+        types=None,
+        years=None,
+        communes=None,
+        include_outliers=False,
+    ):
+        """Number of rows passing the filters, without building a frame."""
+        bits = self._bits(departments, types, years, communes, include_outliers)
+        if bits is None:
+            return self.row_count
+        # Bitmaps are only ever OR-ed and AND-ed, so padding bits stay unset
+        return int(np.bitwise_count(bits).sum())
+
+    def select(
+        self,
+        data,
+        departments=None,
+        types=None,
+        years=None,
+        communes=None,
+        include_outliers=False,
+    ):
+        """
+        Rows of data passing the filters; data must be the indexed frame.
+
+        Returns data itself when no row is filtered out.
+        """
+        key = tuple(
+            tuple(sorted(values)) if values else None
+            for values in (departments, types, years, communes)
+        ) + (include_outliers,)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        bits = self._bits(departments, types, years, communes, include_outliers)
+        if bits is None:
+            selection = data
+        else:
+            selection = data.filter(
+                pl.Series(np.unpackbits(bits, count=self.row_count).astype(bool))
+            )
+        with self._cache_lock:
+            self._cache[key] = selection
+            while len(self._cache) > MAX_CACHED_SELECTIONS:
+                self._cache.popitem(last=False)
+        return selection
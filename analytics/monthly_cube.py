@@ -0,0 +1,125 @@
+"""Monthly aggregate cube per commune and property type, with mergeable price sketches."""
+
+import math
+
+import polars as pl
+
+from analytics.price_index import month_id
+
+CUBE_KEYS = ["code_departement", "code_commune", "nom_commune", "type_local"]
+# DDSketch-style log buckets: any quantile read from merged buckets is
+# within SKETCH_RELATIVE_ACCURACY of the exact value.
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+SKETCH_LOG_GAMMA = math.log(SKETCH_GAMMA)
+
+
+def sketch_bucket(column="price_per_sqm"):
+    """Expression mapping a positive value to its sketch bucket."""
+    return (pl.col(column).log() / SKETCH_LOG_GAMMA).ceil().cast(pl.Int32)
+
+
+def sketch_bucket_value(column="bucket"):
+    """Expression mapping a sketch bucket back to its representative value."""
+    return 2 * (pl.col(column) * SKETCH_LOG_GAMMA).exp() / (SKETCH_GAMMA + 1)
+
+
+def sketch_quantiles(sketches, group_columns, quantiles):
+    """
+    Read quantiles from bucket counts.
+
+    sketches has group_columns plus 'bucket' and 'count' columns; buckets of
+    the same group are merged by summing their counts. quantiles maps an
+    output column name to a quantile in [0, 1].
+    """
+    return (
+        sketches.group_by(group_columns + ["bucket"])
+        .agg(pl.col("count").sum())
+        .sort(group_columns + ["bucket"])
+        .with_columns(
+            [
+                pl.col("count").cum_sum().over(group_columns).alias("cumulative"),
+                pl.col("count").sum().over(group_columns).alias("total"),
+            ]
+        )
+        .group_by(group_columns)
+        .agg(
+            [
+                pl.col("bucket")
+                .filter(pl.col("cumulative") >= quantile * pl.col("total"))
+                .first()
+                .alias(name)
+                for name, quantile in quantiles.items()
+            ]
+        )
+        .with_columns([sketch_bucket_value(name).alias(name) for name in quantiles])
+    )
+
+
+class MonthlyCube:
+    """
+    Sales aggregated per department, commune, type and month.
+
+    totals holds counts and sums (so means combine exactly across cells);
+    sketches holds price-per-m² bucket counts (so medians and other
+    quantiles combine within the sketch accuracy). update() folds in new
+    sales by re-aggregating the partial cube, never the raw rows.
+    """
+
+    def __init__(self):
+        self.totals = pl.DataFrame()
+        self.sketches = pl.DataFrame()
+        self.version = 0  # Bumped by every update, for caches built on the cube
+
+    @property
+    def months(self):
+        if self.totals.is_empty():
+            return []
+        return sorted(self.totals["month_id"].unique().to_list())
+
+    def update(self, data):
+        """Fold new sales into the cube and return the sorted month ids they touched."""
+        sales = data.filter(
+            pl.col("price_per_sqm").is_not_null()
+            & (pl.col("price_per_sqm") > 0)
+            & pl.col("date_mutation").is_not_null()
+            & pl.col("code_commune").is_not_null()
+        ).with_columns(month_id().alias("month_id"))
+        if sales.is_empty():
+            return []
+
+        cell_keys = CUBE_KEYS + ["month_id"]
+        new_totals = sales.group_by(cell_keys).agg(
+            [
+                pl.len().cast(pl.Int64).alias("transaction_count"),
+                pl.sum("price_per_sqm").alias("sum_price_per_sqm"),
+                pl.sum("valeur_fonciere").alias("sum_valeur_fonciere"),
+                pl.sum("surface_reelle_bati").alias("sum_surface"),
+            ]
+        )
+        new_sketches = (
+            sales.with_columns(sketch_bucket().alias("bucket"))
+            .group_by(cell_keys + ["bucket"])
+            .agg(pl.len().cast(pl.Int64).alias("count"))
+        )
+        if self.totals.is_empty():
+            self.totals, self.sketches = new_totals, new_sketches
+        else:
+            self.totals = (
+                pl.concat([self.totals, new_totals])
+                .group_by(cell_keys)
+                .agg(pl.all().sum())
+            )
+            self.sketches = (
+                pl.concat([self.sketches, new_sketches])
+                .group_by(cell_keys + ["bucket"])
+                .agg(pl.col("count").sum())
+            )
+        self.totals = self.totals.sort(cell_keys)
+        self.version += 1
+        touched_months = sorted(new_totals["month_id"].unique().to_list())
+        print(
+            f"Monthly cube updated with {sales.height} sales "
+            f"over {len(touched_months)} months, shape: {self.totals.shape}"
+        )
+        return touched_months
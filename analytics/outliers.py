@@ -0,0 +1,165 @@
+"""Robust per-commune and per-type price outlier bounds."""
+
+import polars as pl
+
+OUTLIER_KEYS = ["code_departement", "code_commune", "type_local"]
+FALLBACK_KEYS = ["code_departement", "type_local"]
+OUTLIER_MAD_THRESHOLD = 3.0  # Robust z-score of log price per m²
+MIN_OUTLIER_GROUP_SALES = (
+    20  # Distinct sales; smaller communes use their department's bounds
+)
+MIN_LOG_MAD = 0.05  # Keeps bounds open for groups of near-identical prices
+MAD_SCALE = 1.4826
+BOUND_COLUMNS = ["lower_price_per_sqm", "upper_price_per_sqm"]
+
+
+def _group_stats(lf, keys):
+    """
+    Sale count, median and robust scale of log price per m² per group.
+
+    A DVF mutation repeats on one row per lot or disposition, often with
+    the same inflated per-row price, so each mutation is reduced to its
+    median log price first: one bulk sale counts once and cannot set the
+    median or the spread of its group alone.
+    """
+    log_price = pl.col("log_price")
+    return (
+        lf.filter(pl.col("price_per_sqm") > 0)
+        .group_by(keys + ["sale_id"])
+        .agg(pl.col("price_per_sqm").log().median().alias("log_price"))
+        .group_by(keys)
+        .agg(
+            [
+                pl.len().alias("group_sales"),
+                log_price.median().alias("log_median"),
+                (log_price - log_price.median()).abs().median().alias("log_mad"),
+            ]
+        )
+        .with_columns(
+            (MAD_SCALE * pl.max_horizontal("log_mad", pl.lit(MIN_LOG_MAD))).alias(
+                "log_scale"
+            )
+        )
+    )
+
+
+def _bounds(stats, keys, threshold):
+    return stats.select(
+        keys
+        + [
+            "group_sales",
+            pl.col("log_median").exp().alias("median_price_per_sqm"),
+            (pl.col("log_median") - threshold * pl.col("log_scale"))
+            .exp()
+            .alias("lower_price_per_sqm"),
+            (pl.col("log_median") + threshold * pl.col("log_scale"))
+            .exp()
+            .alias("upper_price_per_sqm"),
+        ]
+    )
+
+
+def outlier_bounds_lazy(
+    data,
+    threshold=OUTLIER_MAD_THRESHOLD,
+    min_group_sales=MIN_OUTLIER_GROUP_SALES,
+):
+    """
+    LazyFrame of price per m² bounds: median ± threshold robust deviations of log price.
+
+    One row per commune and type with at least min_group_sales distinct
+    sales (bound_level "commune"), plus one row per department and type
+    with code_commune null (bound_level "departement") used for every
+    other row. A commune keeps its own median, but its spread is capped at
+    its department's, so prices in the commune cannot widen its own range.
+    """
+    lf = data.lazy()
+    # Rows without a mutation id count as sales of their own
+    row_id = pl.format("row-{}", pl.int_range(pl.len()))
+    sale_id = (
+        pl.coalesce("id_mutation", row_id)
+        if "id_mutation" in lf.collect_schema().names()
+        else row_id
+    )
+    lf = lf.with_columns(sale_id.alias("sale_id"))
+    department_stats = _group_stats(lf, FALLBACK_KEYS)
+    commune_stats = (
+        _group_stats(lf, OUTLIER_KEYS)
+        .filter(
+            pl.col("code_commune").is_not_null()
+            & (pl.col("group_sales") >= min_group_sales)
+        )
+        .join(
+            department_stats.select(
+                FALLBACK_KEYS + [pl.col("log_scale").alias("department_log_scale")]
+            ),
+            on=FALLBACK_KEYS,
+            how="left",
+        )
+        .with_columns(
+            pl.min_horizontal("log_scale", "department_log_scale").alias("log_scale")
+        )
+    )
+    return pl.concat(
+        [
+            _bounds(commune_stats, OUTLIER_KEYS, threshold).with_columns(
+                pl.lit("commune").alias("bound_level")
+            ),
+            _bounds(department_stats, FALLBACK_KEYS, threshold).with_columns(
+                [
+                    pl.lit(None, dtype=pl.String).alias("code_commune"),
+                    pl.lit("departement").alias("bound_level"),
+                ]
+            ),
+        ],
+        how="diagonal_relaxed",
+    )
+
+
+def compute_outlier_bounds(data, **kwargs):
+    """Collected outlier_bounds_lazy, sorted by group."""
+    return outlier_bounds_lazy(data, **kwargs).collect().sort(OUTLIER_KEYS)
+
+
+def flag_outliers(data, bounds):
+    """
+    Add an 'is_outlier' column to data (DataFrame or LazyFrame).
+
+    A row is flagged when its price per m² falls outside its commune's
+    bounds (or its department's when the commune has too few sales). Rows
+    keep their order; rows without any applicable bound are never flagged.
+    """
+    bounds = bounds.lazy() if isinstance(data, pl.LazyFrame) else bounds
+    commune_bounds = bounds.filter(pl.col("bound_level") == "commune").select(
+        OUTLIER_KEYS + BOUND_COLUMNS
+    )
+    department_bounds = bounds.filter(pl.col("bound_level") == "departement").select(
+        FALLBACK_KEYS + BOUND_COLUMNS
+    )
+    return (
+        data.join(commune_bounds, on=OUTLIER_KEYS, how="left", maintain_order="left")
+        .join(
+            department_bounds,
+            on=FALLBACK_KEYS,
+            how="left",
+            suffix="_fallback",
+            maintain_order="left",
+        )
+        # Department bounds only stand in for communes with too few sales;
+        # commune spreads are already capped in outlier_bounds_lazy
+        .with_columns(
+            [
+                pl.coalesce(name, f"{name}_fallback").alias(name)
+                for name in BOUND_COLUMNS
+            ]
+        )
+        .with_columns(
+            (
+                (pl.col("price_per_sqm") < pl.col("lower_price_per_sqm"))
+                | (pl.col("price_per_sqm") > pl.col("upper_price_per_sqm"))
+            )
+            .fill_null(False)
+            .alias("is_outlier")
+        )
+        .drop(BOUND_COLUMNS + [f"{name}_fallback" for name in BOUND_COLUMNS])
+    )
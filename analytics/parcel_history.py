@@ -0,0 +1,189 @@
+"""Sales history of each parcel and lot: holding periods, resale gains, turnover."""
+
+import polars as pl
+
+PROPERTY_KEY = ["id_parcelle", "lot1_numero", "type_local"]
+HISTORY_COLUMNS = [
+    "id_mutation",
+    "date_mutation",
+    "valeur_fonciere",
+    "surface_reelle_bati",
+    "price_per_sqm",
+    "code_departement",
+    "code_commune",
+    "nom_commune",
+    "is_outlier",
+]
+MIN_HOLDING_DAYS = 30  # Shorter gaps are usually corrections of the same sale
+
+
+class ParcelHistory:
+    """
+    Ordered sales of every property, a property being a parcel, lot and type.
+
+    Sales are sorted once by property and date; a dict maps each property
+    key to its (start, stop) slice of the sorted frame, so the history of a
+    property is a dict lookup plus a slice. Rows repeated within a mutation
+    are kept once.
+    """
+
+    def __init__(self, data):
+        columns = [col for col in PROPERTY_KEY + HISTORY_COLUMNS if col in data.columns]
+        self.sales = (
+            data.filter(pl.col("id_parcelle").is_not_null())
+            .select(columns)
+            .unique(
+                subset=["id_mutation"] + PROPERTY_KEY,
+                keep="first",
+                maintain_order=True,
+            )
+            .sort(PROPERTY_KEY + ["date_mutation", "id_mutation"], nulls_last=True)
+        )
+        runs = (
+            self.sales.with_row_index("row_nr")
+            .group_by(PROPERTY_KEY, maintain_order=True)
+            .agg(
+                [
+                    pl.col("row_nr").first().alias("start"),
+                    pl.len().alias("sale_count"),
+                ]
+            )
+        )
+        self.slices = {
+            (parcel, lot, type_local): (start, start + count)
+            for parcel, lot, type_local, start, count in runs.iter_rows()
+        }
+        self.parcel_keys = {}
+        for key in self.slices:
+            self.parcel_keys.setdefault(key[0], []).append(key)
+        self._resales = None
+        print(
+            f"Parcel history indexed {self.sales.height} sales "
+            f"of {len(self.slices)} properties."
+        )
+
+    def history(self, id_parcelle, lot1_numero=None, type_local=None):
+        """
+        Sales of one property, oldest first.
+
+        With type_local None every property of the parcel and lot is
+        returned; with lot1_numero also None, every lot of the parcel.
+        """
+        if type_local is not None:
+            start, stop = self.slices.get(
+                (id_parcelle, lot1_numero, type_local), (0, 0)
+            )
+            return self.sales[start:stop]
+        keys = [
+            key
+            for key in self.parcel_keys.get(id_parcelle, [])
+            if lot1_numero is None or key[1] == lot1_numero
+        ]
+        if not keys:
+            return self.sales.clear()
+        return pl.concat([self.sales[slice(*self.slices[key])] for key in keys]).sort(
+            ["date_mutation", "id_mutation"]
+        )
+
+    def sale_count(self, id_parcelle, lot1_numero, type_local):
+        """Number of recorded sales of a property (O(1))."""
+        start, stop = self.slices.get((id_parcelle, lot1_numero, type_local), (0, 0))
+        return stop - start
+
+    def resales(self, departments=None, types=None):
+        """
+        Consecutive sale pairs of the same property.
+
+        Each row is a resale with its holding period and gain; pairs less
+        than MIN_HOLDING_DAYS apart are dropped, and gains involving a sale
+        flagged as a price outlier are left null.
+        """
+        if self._resales is None:
+            previous = {
+                col: pl.col(col).shift(1).over(PROPERTY_KEY)
+                for col in ["id_mutation", "date_mutation", "valeur_fonciere"]
+            }
+            has_outliers = "is_outlier" in self.sales.columns
+            if has_outliers:
+                previous["is_outlier"] = (
+                    pl.col("is_outlier").shift(1).over(PROPERTY_KEY)
+                )
+            resales = self.sales.with_columns(
+                [expr.alias(f"previous_{col}") for col, expr in previous.items()]
+            ).filter(
+                pl.col("previous_id_mutation").is_not_null()
+                & (pl.col("id_mutation") != pl.col("previous_id_mutation"))
+            )
+            holding_days = (
+                pl.col("date_mutation") - pl.col("previous_date_mutation")
+            ).dt.total_days()
+            reliable = pl.lit(True)
+            if has_outliers:
+                reliable = ~(pl.col("is_outlier") | pl.col("previous_is_outlier"))
+            gain = pl.col("valeur_fonciere") / pl.col("previous_valeur_fonciere") - 1
+            self._resales = (
+                resales.with_columns(holding_days.alias("holding_days"))
+                .filter(pl.col("holding_days") >= MIN_HOLDING_DAYS)
+                .with_columns(
+                    [
+                        (pl.col("holding_days") / 365.25).alias("holding_years"),
+                        pl.when(reliable).then(gain).alias("resale_gain"),
+                    ]
+                )
+                .with_columns(
+                    (
+                        (pl.col("resale_gain") + 1).pow(1 / pl.col("holding_years")) - 1
+                    ).alias("annualized_gain")
+                )
+            )
+        resales = self._resales
+        if departments:
+            resales = resales.filter(pl.col("code_departement").is_in(departments))
+        if types:
+            resales = resales.filter(pl.col("type_local").is_in(types))
+        return resales
+
+    def turnover(self, by="code_commune", departments=None, types=None):
+        """
+        Resale activity per group: properties, resales, turnover and gains.
+
+        turnover_rate is resales per property per year over the period
+        covered by the data.
+        """
+        sales = self.sales
+        resales = self.resales(departments, types)
+        if departments:
+            sales = sales.filter(pl.col("code_departement").is_in(departments))
+        if types:
+            sales = sales.filter(pl.col("type_local").is_in(types))
+        if sales.is_empty():
+            return pl.DataFrame()
+        covered_years = max(
+            (sales["date_mutation"].max() - sales["date_mutation"].min()).days / 365.25,
+            1.0,
+        )
+        group_columns = [by, "nom_commune"] if by == "code_commune" else [by]
+        properties = sales.group_by(group_columns).agg(
+            [
+                pl.len().alias("sales"),
+                pl.struct(PROPERTY_KEY).n_unique().alias("properties"),
+            ]
+        )
+        resale_stats = resales.group_by(group_columns).agg(
+            [
+                pl.len().alias("resales"),
+                pl.median("holding_years").alias("median_holding_years"),
+                pl.median("resale_gain").alias("median_resale_gain"),
+                pl.median("annualized_gain").alias("median_annualized_gain"),
+            ]
+        )
+        return (
+            properties.join(resale_stats, on=group_columns, how="left")
+            .with_columns(pl.col("resales").fill_null(0))
+            .with_columns(
+                (pl.col("resales") / pl.col("properties") / covered_years).alias(
+                    "turnover_rate"
+                )
+            )
+            .sort("resales", descending=True)
+        )
@@ -0,0 +1,193 @@
+"""Multi-resolution square-grid aggregation of price per square metre."""
+
+import math
+
+import polars as pl
+
+GRID_CELL_SIZES_M = [250, 500, 1000, 2000, 5000]
+PRICE_BIN_WIDTH = 50  # €/m² per histogram bin
+REFERENCE_LATITUDE = 43.5  # Centre of Occitanie, keeps cell ids stable
+METERS_PER_DEGREE_LAT = 111_320.0
+METERS_PER_DEGREE_LON = METERS_PER_DEGREE_LAT * math.cos(
+    math.radians(REFERENCE_LATITUDE)
+)
+
+GRID_KEY_COLUMNS = ["cell_size", "cell_x", "cell_y"]
+GRID_SLICE_COLUMNS = ["code_departement", "type_local", "year", "is_outlier"]
+GRID_QUANTILES = {
+    "p10_price_per_sqm": 0.10,
+    "p25_price_per_sqm": 0.25,
+    "median_price_per_sqm": 0.50,
+    "p75_price_per_sqm": 0.75,
+    "p90_price_per_sqm": 0.90,
+}
+
+
+def build_price_grid(data, cell_sizes=None, bin_width=PRICE_BIN_WIDTH):
+    """
+    Build price-per-m² histograms for every grid cell at every cell size.
+
+    Each row holds the number of sales of one cell, department, type, year
+    and outlier flag falling into one price bin. Histograms merge by summing,
+    so any slice of types, years, departments or the outlier toggle can be
+    summarised without the raw rows.
+    """
+    if cell_sizes is None:
+        cell_sizes = GRID_CELL_SIZES_M
+    if data is None or data.is_empty():
+        return pl.DataFrame()
+
+    located = (
+        data.lazy()
+        .filter(
+            pl.col("latitude").is_not_null()
+            & pl.col("longitude").is_not_null()
+            & pl.col("price_per_sqm").is_not_null()
+        )
+        .select(
+            [
+                pl.col("code_departement"),
+                pl.col("type_local"),
+                pl.col("date_mutation").dt.year().alias("year"),
+                (
+                    pl.col("is_outlier")
+                    if "is_outlier" in data.columns
+                    else pl.lit(False).alias("is_outlier")
+                ),
+                (pl.col("longitude") * METERS_PER_DEGREE_LON).alias("x_m"),
+                (pl.col("latitude") * METERS_PER_DEGREE_LAT).alias("y_m"),
+                (pl.col("price_per_sqm") // bin_width).cast(pl.Int32).alias("bin"),
+            ]
+        )
+    )
+
+    levels = [
+        located.with_columns(
+            [
+                pl.lit(size, dtype=pl.Int32).alias("cell_size"),
+                (pl.col("x_m") // size).cast(pl.Int32).alias("cell_x"),
+                (pl.col("y_m") // size).cast(pl.Int32).alias("cell_y"),
+            ]
+        )
+        .group_by(GRID_KEY_COLUMNS + GRID_SLICE_COLUMNS + ["bin"])
+        .agg(pl.len().cast(pl.UInt32).alias("count"))
+        for size in cell_sizes
+    ]
+    try:
+        grid = pl.concat(pl.collect_all(levels))
+    except Exception as e:
+        print(f"Error building price grid: {e}")
+        return pl.DataFrame()
+
+    print(f"Built price grid for cell sizes {cell_sizes}, shape: {grid.shape}")
+    return grid
+
+
+def summarize_price_grid(
+    grid,
+    cell_size,
+    departments=None,
+    types=None,
+    years=None,
+    min_count=1,
+    bin_width=PRICE_BIN_WIDTH,
+    include_outliers=False,
+):
+    """
+    Merge the histograms of a slice and return one row per cell.
+
+    Returns the cell centre, the transaction count and the price-per-m²
+    quantiles, accurate to the histogram bin width. years=None keeps every
+    year; an empty list keeps none.
+    """
+    if grid is None or grid.is_empty():
+        return pl.DataFrame()
+
+    slice_filter = pl.col("cell_size") == cell_size
+    if departments:
+        slice_filter &= pl.col("code_departement").is_in(departments)
+    if types:
+        slice_filter &= pl.col("type_local").is_in(types)
+    if years is not None:
+        slice_filter &= pl.col("year").is_in(years)
+    if not include_outliers:
+        slice_filter &= ~pl.col("is_outlier")
+
+    cell_columns = ["cell_x", "cell_y"]
+    return (
+        grid.lazy()
+        .filter(slice_filter)
+        .group_by(cell_columns + ["bin"])
+        .agg(pl.col("count").sum())
+        .sort(cell_columns + ["bin"])
+        .with_columns(
+            [
+                pl.col("count").cum_sum().over(cell_columns).alias("cumulative"),
+                pl.col("count").sum().over(cell_columns).alias("total"),
+            ]
+        )
+        .filter(pl.col("total") >= min_count)
+        .group_by(cell_columns)
+        .agg(
+            [pl.col("count").sum().alias("transaction_count")]
+            + [
+                (
+                    (
+                        pl.col("bin")
+                        .filter(pl.col("cumulative") >= quantile * pl.col("total"))
+                        .first()
+                        + 0.5
+                    )
+                    * bin_width
+                ).alias(name)
+                for name, quantile in GRID_QUANTILES.items()
+            ]
+        )
+        .with_columns(
+            [
+                pl.format("{}_{}", "cell_x", "cell_y").alias("cell_id"),
+                ((pl.col("cell_y") + 0.5) * cell_size / METERS_PER_DEGREE_LAT).alias(
+                    "latitude"
+                ),
+                ((pl.col("cell_x") + 0.5) * cell_size / METERS_PER_DEGREE_LON).alias(
+                    "longitude"
+                ),
+            ]
+        )
+        .collect()
+    )
+
+
+def price_grid_geojson(cells, cell_size):
+    """Build a GeoJSON FeatureCollection of the cell squares, keyed by 'cell_id'."""
+    features = []
+    if cells is None or cells.is_empty():
+        return {"type": "FeatureCollection", "features": features}
+
+    for cell_id, cell_x, cell_y in cells.select(
+        ["cell_id", "cell_x", "cell_y"]
+    ).iter_rows():
+        west = cell_x * cell_size / METERS_PER_DEGREE_LON
+        east = (cell_x + 1) * cell_size / METERS_PER_DEGREE_LON
+        south = cell_y * cell_size / METERS_PER_DEGREE_LAT
+        north = (cell_y + 1) * cell_size / METERS_PER_DEGREE_LAT
+        features.append(
+            {
+                "type": "Feature",
+                "id": cell_id,
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [
+                            [west, south],
+                            [east, south],
+                            [east, north],
+                            [west, north],
+                            [west, south],
+                        ]
+                    ],
+                },
+                "properties": {},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
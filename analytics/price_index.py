@@ -0,0 +1,336 @@
+"""Quality-adjusted hedonic and repeat-sales price indices."""
+
+import numpy as np
+import polars as pl
+
+ALL_TYPES = "Tous"
+INDEX_LEVELS = {"department": "code_departement", "commune": "code_commune"}
+# Maison is the reference type of the hedonic type dummies
+HEDONIC_TYPE_DUMMIES = [
+    "Appartement",
+    "Dépendance",
+    "Local industriel. commercial ou assimilé",
+]
+HEDONIC_FEATURES = ["log_surface", "rooms", "rooms_missing"] + [
+    f"is_{type_name}" for type_name in HEDONIC_TYPE_DUMMIES
+]
+RIDGE = 1e-4  # Relative to the mean diagonal; only anchors unidentified columns
+MIN_PERIOD_SALES = 3
+MIN_PERIOD_PAIRS = 1
+MIN_GROUP_SALES = 30
+
+
+def month_id(date_column="date_mutation"):
+    """Expression numbering months continuously (year * 12 + month - 1)."""
+    return (
+        pl.col(date_column).dt.year().cast(pl.Int32) * 12
+        + pl.col(date_column).dt.month().cast(pl.Int32)
+        - 1
+    )
+
+
+class _NormalEquations:
+    """
+    Per-group X'X and X'y of a least-squares problem with growing period columns.
+
+    Columns are laid out as [fixed features | one dummy per period]. Normal
+    equations are additive over rows, so new sales are folded in without
+    revisiting old ones, and a new period only pads the matrices.
+    """
+
+    def __init__(self, n_features):
+        self.n_features = n_features
+        self.periods = []  # Month ids in column order (insertion order)
+        self.period_columns = {}
+        self.keys = {}
+        self.xtx = np.zeros((0, n_features, n_features))
+        self.xty = np.zeros((0, n_features))
+        self.period_counts = np.zeros((0, 0), dtype=np.int64)
+
+    def _ensure_periods(self, months):
+        new_periods = [m for m in np.unique(months) if m not in self.period_columns]
+        if not new_periods:
+            return
+        for month in new_periods:
+            self.period_columns[month] = len(self.periods)
+            self.periods.append(int(month))
+        pad = len(new_periods)
+        self.xtx = np.pad(self.xtx, ((0, 0), (0, pad), (0, pad)))
+        self.xty = np.pad(self.xty, ((0, 0), (0, pad)))
+        self.period_counts = np.pad(self.period_counts, ((0, 0), (0, pad)))
+
+    def _ensure_groups(self, group_keys):
+        new_keys = [key for key in dict.fromkeys(group_keys) if key not in self.keys]
+        if not new_keys:
+            return
+        for key in new_keys:
+            self.keys[key] = len(self.keys)
+        pad = len(new_keys)
+        self.xtx = np.pad(self.xtx, ((0, pad), (0, 0), (0, 0)))
+        self.xty = np.pad(self.xty, ((0, pad), (0, 0)))
+        self.period_counts = np.pad(self.period_counts, ((0, pad), (0, 0)))
+
+    def accumulate(self, group_keys, features, period_weights, y, touched_months):
+        """
+        Fold rows into their groups.
+
+        period_weights is a list of (month_ids, weight) pairs placing each
+        row's period dummies: a single (+1) for hedonic rows, a (-1, +1)
+        pair for repeat sales. touched_months lists the months each row
+        counts towards.
+        """
+        if len(y) == 0:
+            return
+        self._ensure_periods(np.concatenate([months for months, _ in period_weights]))
+        self._ensure_groups(group_keys)
+
+        n_rows = len(y)
+        design = np.zeros((n_rows, self.n_features + len(self.periods)))
+        design[:, : self.n_features] = features
+        rows = np.arange(n_rows)
+        column_of = np.vectorize(self.period_columns.__getitem__, otypes=[np.int64])
+        for months, weight in period_weights:
+            design[rows, self.n_features + column_of(months)] += weight
+
+        group_idx = np.fromiter(
+            (self.keys[key] for key in group_keys), dtype=np.int64, count=n_rows
+        )
+        order = np.argsort(group_idx, kind="stable")
+        boundaries = np.flatnonzero(np.diff(group_idx[order])) + 1
+        for chunk in np.split(order, boundaries):
+            group = group_idx[chunk[0]]
+            x_chunk = design[chunk]
+            self.xtx[group] += x_chunk.T @ x_chunk
+            self.xty[group] += x_chunk.T @ y[chunk]
+
+        for months in touched_months:
+            np.add.at(self.period_counts, (group_idx, column_of(months)), 1)
+
+    def solve(self):
+        """Ridge-anchored solution of every group's normal equations in one batch."""
+        size = self.xtx.shape[1]
+        if len(self.keys) == 0 or size == 0:
+            return np.zeros((len(self.keys), size))
+        diagonal = np.einsum("gii->gi", self.xtx)
+        scale = np.maximum(diagonal.mean(axis=1), 1.0)
+        penalty = RIDGE * scale[:, None, None] * np.eye(size)[None, :, :]
+        return np.linalg.solve(self.xtx + penalty, self.xty[:, :, None])[:, :, 0]
+
+
+def _hedonic_features(sales):
+    rooms = sales["nombre_pieces_principales"].to_numpy().astype(np.float64)
+    rooms_missing = ~np.isfinite(rooms) | (rooms <= 0)
+    types = sales["type_local"].to_numpy()
+    return np.column_stack(
+        [
+            np.log(sales["surface_reelle_bati"].to_numpy()),
+            np.where(rooms_missing, 0.0, rooms),
+            rooms_missing.astype(np.float64),
+        ]
+        + [
+            (types == type_name).astype(np.float64)
+            for type_name in HEDONIC_TYPE_DUMMIES
+        ]
+    )
+
+
+def _group_keys(sales, level_column, level, split_by_type):
+    codes = sales[level_column].to_list()
+    if split_by_type:
+        return [
+            (level, code, type_name)
+            for code, type_name in zip(codes, sales["type_local"].to_list())
+        ]
+    return [(level, code, ALL_TYPES) for code in codes]
+
+
+class PriceIndexEngine:
+    """
+    Hedonic (time-dummy) and repeat-sales indices per department and commune,
+    for each property type and for all types together.
+
+    Both models are linear least squares whose normal equations are stored
+    per group; update() folds in new sales only, and the indices are refreshed
+    by one batched solve over all groups.
+    """
+
+    def __init__(self):
+        self.hedonic = _NormalEquations(len(HEDONIC_FEATURES))
+        self.repeat_sales = _NormalEquations(0)
+        self.group_sales = {}
+        self.last_sales = pl.DataFrame()
+        self._indices = None
+
+    def update(self, data):
+        """Fold new sales into the indices. Rows must not have been seen before."""
+        sales = (
+            data.filter(
+                pl.col("price_per_sqm").is_not_null()
+                & pl.col("date_mutation").is_not_null()
+            )
+            .unique(
+                subset=["id_mutation", "id_parcelle", "lot1_numero"],
+                keep="first",
+                maintain_order=True,
+            )
+            .with_columns(
+                [
+                    month_id().alias("month_id"),
+                    pl.col("price_per_sqm").log().alias("log_price_per_sqm"),
+                ]
+            )
+        )
+        if sales.is_empty():
+            return self
+
+        features = _hedonic_features(sales)
+        months = sales["month_id"].to_numpy()
+        log_price = sales["log_price_per_sqm"].to_numpy()
+        for level, level_column in INDEX_LEVELS.items():
+            for split_by_type in (True, False):
+                keys = _group_keys(sales, level_column, level, split_by_type)
+                self.hedonic.accumulate(
+                    keys, features, [(months, 1.0)], log_price, [months]
+                )
+                for key in keys:
+                    self.group_sales[key] = self.group_sales.get(key, 0) + 1
+
+        self._update_repeat_sales(sales)
+        self._indices = None
+        print(f"Price indices updated with {sales.height} sales.")
+        return self
+
+    def _update_repeat_sales(self, sales):
+        """Pair each sale with the previous sale of the same parcel and lot."""
+        resale_key = ["id_parcelle", "lot1_numero", "type_local"]
+        columns = resale_key + [
+            "id_mutation",
+            "code_departement",
+            "code_commune",
+            "month_id",
+            "log_price_per_sqm",
+        ]
+        history = pl.concat(
+            [
+                self.last_sales,
+                sales.filter(pl.col("id_parcelle").is_not_null()).select(columns),
+            ],
+            how="diagonal_relaxed",
+        ).sort(
+            resale_key + ["month_id", "id_mutation"],
+            nulls_last=True,
+            maintain_order=True,
+        )
+        pairs = (
+            history.with_columns(
+                [
+                    pl.col("month_id").shift(1).over(resale_key).alias("first_month"),
+                    pl.col("log_price_per_sqm")
+                    .shift(1)
+                    .over(resale_key)
+                    .alias("first_log_price"),
+                    pl.col("id_mutation").shift(1).over(resale_key).alias("first_id"),
+                ]
+            )
+            .filter(
+                pl.col("first_month").is_not_null()
+                & (pl.col("month_id") > pl.col("first_month"))
+                & (pl.col("id_mutation") != pl.col("first_id"))
+            )
+            # Only pairs whose second sale is new; older pairs were counted before
+            .join(sales.select("id_mutation").unique(), on="id_mutation", how="semi")
+        )
+        self.last_sales = history.group_by(resale_key, maintain_order=True).last()
+
+        if pairs.is_empty():
+            return
+        first_months = pairs["first_month"].to_numpy()
+        second_months = pairs["month_id"].to_numpy()
+        log_change = (
+            pairs["log_price_per_sqm"].to_numpy() - pairs["first_log_price"].to_numpy()
+        )
+        no_features = np.zeros((pairs.height, 0))
+        for level, level_column in INDEX_LEVELS.items():
+            for split_by_type in (True, False):
+                self.repeat_sales.accumulate(
+                    _group_keys(pairs, level_column, level, split_by_type),
+                    no_features,
+                    [(first_months, -1.0), (second_months, 1.0)],
+                    log_change,
+                    [first_months, second_months],
+                )
+
+    def _index_frame(self, equations, n_features, min_period_count, name):
+        coefficients = equations.solve()
+        if coefficients.size == 0:
+            return pl.DataFrame()
+        period_order = np.argsort(equations.periods)
+        period_coefficients = coefficients[:, n_features:][:, period_order]
+        counts = equations.period_counts[:, period_order]
+        observed = counts >= min_period_count
+        # Base 100 at each group's first observed month
+        first_observed = np.argmax(observed, axis=1)
+        base = period_coefficients[np.arange(len(counts)), first_observed]
+        index = 100 * np.exp(period_coefficients - base[:, None])
+        index[~observed] = np.nan
+
+        keys = list(equations.keys)
+        months = np.asarray(equations.periods)[period_order]
+        return pl.DataFrame(
+            {
+                "level": np.repeat([key[0] for key in keys], len(months)),
+                "code": np.repeat([key[1] for key in keys], len(months)),
+                "type_local": np.repeat([key[2] for key in keys], len(months)),
+                "month_id": np.tile(months, len(keys)),
+                name: index.ravel(),
+                f"{name}_count": counts.ravel(),
+            }
+        ).with_columns(pl.col(name).fill_nan(None))
+
+    def get_indices(
+        self, level=None, codes=None, types=None, min_group_sales=MIN_GROUP_SALES
+    ):
+        """
+        Return both indices per group and month (base 100 at the group's first month).
+
+        Groups with fewer than min_group_sales sales are left out.
+        """
+        if self._indices is None:
+            hedonic = self._index_frame(
+                self.hedonic, len(HEDONIC_FEATURES), MIN_PERIOD_SALES, "hedonic_index"
+            )
+            if hedonic.is_empty():
+                return hedonic
+            repeat_sales = self._index_frame(
+                self.repeat_sales, 0, MIN_PERIOD_PAIRS, "repeat_sales_index"
+            )
+            group_sales = pl.DataFrame(
+                {
+                    "level": [key[0] for key in self.group_sales],
+                    "code": [key[1] for key in self.group_sales],
+                    "type_local": [key[2] for key in self.group_sales],
+                    "group_sales": list(self.group_sales.values()),
+                }
+            )
+            indices = hedonic.join(group_sales, on=["level", "code", "type_local"])
+            if not repeat_sales.is_empty():
+                indices = indices.join(
+                    repeat_sales,
+                    on=["level", "code", "type_local", "month_id"],
+                    how="left",
+                )
+            self._indices = indices.with_columns(
+                [
+                    (pl.col("month_id") // 12).alias("year"),
+                    (pl.col("month_id") % 12 + 1).alias("month"),
+                ]
+            ).sort(["level", "code", "type_local", "month_id"])
+
+        indices = self._indices.filter(pl.col("group_sales") >= min_group_sales)
+        if level is not None:
+            indices = indices.filter(pl.col("level") == level)
+        if codes:
+            indices = indices.filter(pl.col("code").is_in(codes))
+        if types:
+            indices = indices.filter(pl.col("type_local").is_in(types))
+        return indices
@@ -0,0 +1,117 @@
+"""Declarative page aggregations fused into one lazy collect_all."""
+
+import polars as pl
+
+from analytics.price_index import month_id
+
+# Columns pages group by without storing them; added once per plan if used
+DERIVED_COLUMNS = {
+    "year": pl.col("date_mutation").dt.year(),
+    "month": pl.col("date_mutation").dt.month(),
+    "month_id": month_id(),
+}
+
+
+class AnalysisPlan:
+    """
+    Aggregations a page needs, declared up front and run together.
+
+    Specs with the same grouping and row filter are fused into one
+    group_by whose aggregation list is the union of theirs (identical
+    expressions are computed once); derived columns are added once to the
+    shared scan, and all fused queries run in a single pl.collect_all so
+    polars can share the scan between them.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.specs = {}
+
+    def aggregate(self, name, by, aggs, where=None, sort=None, descending=False):
+        """
+        Declare the aggregation name: aggs (named expressions) per by columns.
+
+        where filters rows before grouping; by=[] aggregates to one row.
+        Returns the plan so declarations can be chained.
+        """
+        self.specs[name] = {
+            "by": list(by),
+            "aggs": list(aggs),
+            "where": where,
+            "sort": sort,
+            "descending": descending,
+        }
+        return self
+
+    def _fused_queries(self):
+        """Group specs by (by, where); split a group when output names clash."""
+        queries = []
+        for name, spec in self.specs.items():
+            key = (tuple(spec["by"]), str(spec["where"]))
+            for query in queries:
+                if query["key"] != key:
+                    continue
+                clash = any(
+                    output in query["aggs"] and str(query["aggs"][output]) != str(expr)
+                    for output, expr in self._named(spec["aggs"])
+                )
+                if not clash:
+                    break
+            else:
+                query = {"key": key, "by": spec["by"], "where": spec["where"]}
+                query["aggs"] = {}
+                query["specs"] = []
+                queries.append(query)
+            query["aggs"].update(self._named(spec["aggs"]))
+            query["specs"].append(name)
+        return queries
+
+    @staticmethod
+    def _named(aggs):
+        return [(expr.meta.output_name(), expr) for expr in aggs]
+
+    def _derived(self, queries):
+        referenced = set()
+        for query in queries:
+            referenced.update(query["by"])
+            expressions = list(query["aggs"].values())
+            if query["where"] is not None:
+                expressions.append(query["where"])
+            for expr in expressions:
+                referenced.update(expr.meta.root_names())
+        return [
+            expr.alias(column)
+            for column, expr in DERIVED_COLUMNS.items()
+            if column in referenced and column not in self.data.columns
+        ]
+
+    def collect(self):
+        """Run the plan and return a dict of DataFrames keyed by spec name."""
+        if not self.specs:
+            return {}
+        queries = self._fused_queries()
+        base = self.data.lazy()
+        derived = self._derived(queries)
+        if derived:
+            base = base.with_columns(derived)
+
+        lazy_frames = []
+        for query in queries:
+            lf = base if query["where"] is None else base.filter(query["where"])
+            aggs = list(query["aggs"].values())
+            lazy_frames.append(
+                lf.group_by(query["by"]).agg(aggs) if query["by"] else lf.select(aggs)
+            )
+        frames = pl.collect_all(lazy_frames)
+
+        results = {}
+        for query, frame in zip(queries, frames):
+            for name in query["specs"]:
+                spec = self.specs[name]
+                result = frame.select(
+                    spec["by"] + [output for output, _ in self._named(spec["aggs"])]
+                )
+                if spec["sort"]:
+                    result = result.sort(spec["sort"], descending=spec["descending"])
+                results[name] = result
+        return results
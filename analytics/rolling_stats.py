@@ -0,0 +1,181 @@
+"""Rolling-window statistics per commune and type over the monthly cube."""
+
+import polars as pl
+
+from analytics.monthly_cube import CUBE_KEYS, sketch_quantiles
+from analytics.price_index import ALL_TYPES
+
+DEFAULT_WINDOW_MONTHS = 12
+ROLLING_QUANTILES = {
+    "rolling_p25_price_per_sqm": 0.25,
+    "rolling_median_price_per_sqm": 0.50,
+    "rolling_p75_price_per_sqm": 0.75,
+}
+
+
+def _with_all_types(frame):
+    """Append an ALL_TYPES copy of every row so type rollups come out of the same pass."""
+    return pl.concat([frame, frame.with_columns(pl.lit(ALL_TYPES).alias("type_local"))])
+
+
+class RollingStatsEngine:
+    """
+    Trailing-window counts, means and sketch medians per commune and type.
+
+    Each monthly cube cell is replicated into the windows that contain it,
+    so every window is computed in one grouped pass. refresh() only
+    recomputes the windows ending on or after the earliest touched month,
+    which for appended months means just the new windows.
+
+    covered_months counts the months of each window present in the cube:
+    the first windows of the data and those spanning a gap in the source
+    are incomplete, and get() leaves them out by default.
+    """
+
+    def __init__(self, cube, window_months=DEFAULT_WINDOW_MONTHS):
+        self.cube = cube
+        self.window_months = window_months
+        self.results = pl.DataFrame()
+
+    def refresh(self, touched_months=None):
+        """Recompute the windows affected by the touched months (all if None)."""
+        months = self.cube.months
+        if not months:
+            return self
+        first_touched = min(touched_months) if touched_months else months[0]
+        window_ends = [month for month in months if month >= first_touched]
+        if not window_ends:
+            return self
+
+        group_columns = CUBE_KEYS + ["window_end"]
+        earliest_cell = window_ends[0] - self.window_months + 1
+
+        def assign_windows(frame):
+            return (
+                _with_all_types(frame.filter(pl.col("month_id") >= earliest_cell))
+                .with_columns(
+                    pl.int_ranges(
+                        pl.col("month_id"), pl.col("month_id") + self.window_months
+                    ).alias("window_end")
+                )
+                .explode("window_end")
+                .filter(pl.col("window_end").is_in(window_ends))
+            )
+
+        totals = (
+            assign_windows(self.cube.totals)
+            .group_by(group_columns)
+            .agg(
+                [
+                    pl.sum("transaction_count").alias("rolling_count"),
+                    pl.sum("sum_price_per_sqm"),
+                    pl.sum("sum_valeur_fonciere"),
+                ]
+            )
+            .with_columns(
+                [
+                    (pl.col("sum_price_per_sqm") / pl.col("rolling_count")).alias(
+                        "rolling_mean_price_per_sqm"
+                    ),
+                    (pl.col("sum_valeur_fonciere") / pl.col("rolling_count")).alias(
+                        "rolling_mean_price"
+                    ),
+                ]
+            )
+            .drop(["sum_price_per_sqm", "sum_valeur_fonciere"])
+        )
+        quantiles = sketch_quantiles(
+            assign_windows(self.cube.sketches), group_columns, ROLLING_QUANTILES
+        )
+        # Months absent from the whole cube are gaps in the source data
+        cube_months = set(months)
+        coverage = pl.DataFrame(
+            {
+                "window_end": window_ends,
+                "covered_months": [
+                    sum(
+                        month in cube_months
+                        for month in range(end - self.window_months + 1, end + 1)
+                    )
+                    for end in window_ends
+                ],
+            },
+            schema_overrides={"window_end": totals.schema["window_end"]},
+        )
+        new_results = (
+            totals.join(quantiles, on=group_columns)
+            .join(coverage, on="window_end")
+            .rename({"window_end": "month_id"})
+        )
+
+        if self.results.is_empty():
+            self.results = new_results
+        else:
+            self.results = pl.concat(
+                [
+                    self.results.filter(pl.col("month_id") < first_touched),
+                    new_results.select(self.results.columns),
+                ]
+            )
+        self.results = self.results.sort(CUBE_KEYS + ["month_id"])
+        print(
+            f"Rolling {self.window_months}-month stats refreshed for "
+            f"{len(window_ends)} windows, shape: {self.results.shape}"
+        )
+        return self
+
+    def get(self, departments=None, communes=None, types=None, complete_only=True):
+        """
+        Return the rolling statistics with year-over-year changes.
+
+        yoy columns compare each window with the window ending twelve
+        months earlier for the same commune and type, and are null unless
+        both windows cover window_months months. complete_only=False keeps
+        the incomplete windows too.
+        """
+        results = self.results
+        if results.is_empty():
+            return results
+        if departments:
+            results = results.filter(pl.col("code_departement").is_in(departments))
+        if communes:
+            results = results.filter(pl.col("code_commune").is_in(communes))
+        if types:
+            results = results.filter(pl.col("type_local").is_in(types))
+
+        previous_year = results.select(
+            CUBE_KEYS
+            + [
+                (pl.col("month_id") + 12).alias("month_id"),
+                pl.col("rolling_count").alias("previous_count"),
+                pl.col("rolling_median_price_per_sqm").alias("previous_median"),
+                pl.col("covered_months").alias("previous_covered"),
+            ]
+        )
+        both_complete = (pl.col("covered_months") == self.window_months) & (
+            pl.col("previous_covered") == self.window_months
+        )
+        results = (
+            results.join(previous_year, on=CUBE_KEYS + ["month_id"], how="left")
+            .with_columns(
+                [
+                    pl.when(both_complete)
+                    .then(
+                        pl.col("rolling_median_price_per_sqm")
+                        / pl.col("previous_median")
+                        - 1
+                    )
+                    .alias("yoy_median_change"),
+                    pl.when(both_complete)
+                    .then(pl.col("rolling_count") / pl.col("previous_count") - 1)
+                    .alias("yoy_count_change"),
+                    (pl.col("month_id") // 12).alias("year"),
+                    (pl.col("month_id") % 12 + 1).alias("month"),
+                ]
+            )
+            .drop(["previous_count", "previous_median", "previous_covered"])
+            .sort(CUBE_KEYS + ["month_id"])
+        )
+        if complete_only:
+            results = results.filter(pl.col("covered_months") == self.window_months)
+        return results
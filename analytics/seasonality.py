@@ -0,0 +1,280 @@
+"""Batch seasonal decomposition and short-horizon forecasts over the monthly cube."""
+
+import numpy as np
+import polars as pl
+
+from analytics.monthly_cube import CUBE_KEYS
+from analytics.price_index import ALL_TYPES
+
+SERIES = ["volume", "price"]
+DEFAULT_HORIZON_MONTHS = 6
+TREND_FIT_MONTHS = 12  # Trailing trend points extrapolated by the forecast
+MIN_SEASONAL_SALES = 60
+FORECAST_Z = 1.959964  # Two-sided 95 %
+DEPARTMENT_LABEL = "Ensemble du département {}"
+# Centred 2×12 moving average: half weight on the two end months
+_TREND_KERNEL = np.r_[0.5, np.ones(11), 0.5] / 12
+
+
+def _moving_average(values, mask):
+    """Centred 2×12 moving average along axis 1, ignoring masked-out months."""
+    weighted = np.where(mask, values, 0.0)
+
+    def convolve(rows):
+        return np.apply_along_axis(np.convolve, 1, rows, _TREND_KERNEL, mode="same")
+
+    total_weight = convolve(mask.astype(np.float64))
+    trend = convolve(weighted) / np.where(total_weight > 0, total_weight, np.nan)
+    # The window is only complete six months away from either end
+    trend[:, :6] = np.nan
+    trend[:, -6:] = np.nan
+    trend[total_weight < 0.5] = np.nan
+    return trend
+
+
+def _seasonal_indices(detrended, calendar_month):
+    """Mean detrended value per calendar month, centred to sum to zero."""
+    n_groups = detrended.shape[0]
+    sums = np.zeros((n_groups, 12))
+    counts = np.zeros((n_groups, 12))
+    valid = np.isfinite(detrended)
+    for month in range(12):
+        columns = calendar_month == month
+        sums[:, month] = np.where(valid[:, columns], detrended[:, columns], 0).sum(1)
+        counts[:, month] = valid[:, columns].sum(1)
+    indices = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+    return indices - indices.mean(axis=1, keepdims=True)
+
+
+def _linear_tail(trend, n_points):
+    """Slope and last value of each row's last n_points finite trend values."""
+    n_groups, n_months = trend.shape
+    positions = np.arange(n_months)
+    finite = np.isfinite(trend)
+    # Rank finite points from the end, keep the last n_points of each row
+    rank_from_end = np.cumsum(finite[:, ::-1], axis=1)[:, ::-1]
+    tail = finite & (rank_from_end <= n_points)
+    weight = tail.astype(np.float64)
+    values = np.where(tail, trend, 0.0)
+    n = weight.sum(1)
+    mean_t = (weight * positions).sum(1) / np.maximum(n, 1)
+    mean_y = values.sum(1) / np.maximum(n, 1)
+    centred_t = np.where(tail, positions - mean_t[:, None], 0.0)
+    slope = (centred_t * (values - mean_y[:, None])).sum(1) / np.maximum(
+        (centred_t**2).sum(1), 1e-12
+    )
+    last_position = np.where(
+        finite.any(1), n_months - 1 - np.argmax(finite[:, ::-1], 1), 0
+    )
+    last_value = mean_y + slope * (last_position - mean_t)
+    slope[n < 2] = np.nan
+    return slope, last_value, last_position
+
+
+class SeasonalityEngine:
+    """
+    Trend / seasonal / residual decomposition of monthly volume and price,
+    with short-horizon forecasts, for every commune and type at once.
+
+    Groups are laid out as rows of a groups × months matrix built from the
+    cube, so the moving averages, seasonal indices and forecasts are array
+    operations over all groups. Volume is decomposed additively, price on
+    the log of the monthly mean price per m² (so its seasonal part is a
+    percentage). Department-level rows (code_commune null) and the
+    ALL_TYPES rollup are included. Results are cached per cube version.
+    """
+
+    def __init__(self, cube, horizon_months=DEFAULT_HORIZON_MONTHS):
+        self.cube = cube
+        self.horizon_months = horizon_months
+        self._cache_version = None
+        self.decomposition = pl.DataFrame()
+        self.forecast = pl.DataFrame()
+
+    def _group_matrix(self):
+        cells = self.cube.totals.select(
+            CUBE_KEYS + ["month_id", "transaction_count", "sum_price_per_sqm"]
+        )
+        department_cells = cells.with_columns(
+            [
+                pl.lit(None, dtype=pl.String).alias("code_commune"),
+                pl.format(DEPARTMENT_LABEL, "code_departement").alias("nom_commune"),
+            ]
+        )
+        cells = pl.concat([cells, department_cells])
+        cells = pl.concat(
+            [cells, cells.with_columns(pl.lit(ALL_TYPES).alias("type_local"))]
+        )
+        cells = cells.group_by(CUBE_KEYS + ["month_id"]).agg(
+            [pl.sum("transaction_count"), pl.sum("sum_price_per_sqm")]
+        )
+        groups = (
+            cells.group_by(CUBE_KEYS)
+            .agg(pl.sum("transaction_count").alias("group_sales"))
+            .filter(pl.col("group_sales") >= MIN_SEASONAL_SALES)
+            .sort(CUBE_KEYS, nulls_last=False)
+            .with_row_index("group_idx")
+        )
+        first_month, last_month = self.cube.months[0], self.cube.months[-1]
+        n_months = last_month - first_month + 1
+        cells = cells.join(
+            groups.select(CUBE_KEYS + ["group_idx"]), on=CUBE_KEYS, nulls_equal=True
+        )
+
+        volume = np.zeros((groups.height, n_months))
+        price_sum = np.zeros((groups.height, n_months))
+        rows = cells["group_idx"].to_numpy()
+        columns = cells["month_id"].to_numpy() - first_month
+        volume[rows, columns] = cells["transaction_count"].to_numpy()
+        price_sum[rows, columns] = cells["sum_price_per_sqm"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_price = np.log(price_sum / volume)
+        return groups, first_month, volume, log_price
+
+    def _decompose(self, values, mask, calendar_month):
+        trend = _moving_average(values, mask)
+        seasonal_index = _seasonal_indices(
+            np.where(mask, values - trend, np.nan), calendar_month
+        )
+        seasonal = seasonal_index[:, calendar_month]
+        residual = np.where(mask, values - trend - seasonal, np.nan)
+        return trend, seasonal_index, seasonal, residual
+
+    def _forecast(self, trend, seasonal_index, residual, first_month, n_months):
+        slope, last_value, last_position = _linear_tail(trend, TREND_FIT_MONTHS)
+        steps = np.arange(1, self.horizon_months + 1)
+        target_position = n_months - 1 + steps
+        forecast_trend = last_value[:, None] + slope[:, None] * (
+            target_position[None, :] - last_position[:, None]
+        )
+        target_calendar = (first_month + target_position) % 12
+        point = forecast_trend + seasonal_index[:, target_calendar]
+        observed = np.isfinite(residual)
+        residual_std = np.sqrt(
+            np.where(observed, residual**2, 0).sum(1) / np.maximum(observed.sum(1), 1)
+        )
+        # Uncertainty widens with the distance from the last trend point
+        distance = target_position[None, :] - last_position[:, None]
+        spread = (
+            FORECAST_Z
+            * residual_std[:, None]
+            * np.sqrt(1 + distance / TREND_FIT_MONTHS)
+        )
+        return point, point - spread, point + spread, first_month + target_position
+
+    def refresh(self):
+        """Recompute the decomposition and forecasts if the cube changed."""
+        if self._cache_version == self.cube.version:
+            return self
+        self._cache_version = self.cube.version
+        if not self.cube.months:
+            self.decomposition, self.forecast = pl.DataFrame(), pl.DataFrame()
+            return self
+
+        groups, first_month, volume, log_price = self._group_matrix()
+        n_groups, n_months = volume.shape
+        month_ids = first_month + np.arange(n_months)
+        calendar_month = month_ids % 12
+        # Months absent from the whole cube are gaps in the source data, not
+        # months without sales
+        covered = np.isin(month_ids, self.cube.months)
+
+        decomposition_frames, forecast_frames = [], []
+        for series, values, mask, transform in (
+            (
+                "volume",
+                volume,
+                np.broadcast_to(covered, volume.shape),
+                lambda x: np.maximum(x, 0),
+            ),
+            ("price", log_price, np.isfinite(log_price), np.exp),
+        ):
+            trend, seasonal_index, seasonal, residual = self._decompose(
+                values, mask, calendar_month
+            )
+            decomposition_frames.append(
+                pl.DataFrame(
+                    {
+                        "group_idx": np.repeat(
+                            np.arange(n_groups, dtype=np.uint32), n_months
+                        ),
+                        "month_id": np.tile(month_ids, n_groups).astype(np.int32),
+                        "series": series,
+                        "observed": np.where(mask, values, np.nan).ravel(),
+                        "trend": trend.ravel(),
+                        "seasonal": seasonal.ravel(),
+                        "residual": residual.ravel(),
+                    }
+                )
+            )
+            point, lower, upper, target_months = self._forecast(
+                trend, seasonal_index, residual, first_month, n_months
+            )
+            forecast_frames.append(
+                pl.DataFrame(
+                    {
+                        "group_idx": np.repeat(
+                            np.arange(n_groups, dtype=np.uint32), len(target_months)
+                        ),
+                        "month_id": np.tile(target_months, n_groups).astype(np.int32),
+                        "series": series,
+                        "forecast": transform(point).ravel(),
+                        "lower": transform(lower).ravel(),
+                        "upper": transform(upper).ravel(),
+                    }
+                )
+            )
+
+        keys = groups.select(["group_idx"] + CUBE_KEYS)
+        self.decomposition = (
+            pl.concat(decomposition_frames)
+            .join(keys, on="group_idx")
+            .drop("group_idx")
+            .with_columns(pl.col(pl.Float64).fill_nan(None))
+        )
+        self.forecast = (
+            pl.concat(forecast_frames)
+            .join(keys, on="group_idx")
+            .drop("group_idx")
+            .with_columns(pl.col(pl.Float64).fill_nan(None))
+        )
+        print(
+            f"Seasonality decomposed for {n_groups} groups over {n_months} months, "
+            f"{self.horizon_months}-month forecasts."
+        )
+        return self
+
+    def get(self, departments=None, communes=None, types=None, series=None):
+        """
+        Return (decomposition, forecast) rows for the selected groups.
+
+        Pass communes=[None] for the department-level rows. Price values are
+        log price per m² in the decomposition and €/m² in the forecast.
+        """
+        self.refresh()
+        frames = []
+        for frame in (self.decomposition, self.forecast):
+            if frame.is_empty():
+                frames.append(frame)
+                continue
+            if departments:
+                frame = frame.filter(pl.col("code_departement").is_in(departments))
+            if communes:
+                codes = [code for code in communes if code is not None]
+                condition = pl.col("code_commune").is_in(codes)
+                if None in communes:
+                    condition = condition | pl.col("code_commune").is_null()
+                frame = frame.filter(condition)
+            if types:
+                frame = frame.filter(pl.col("type_local").is_in(types))
+            if series:
+                frame = frame.filter(pl.col("series").is_in(series))
+            frames.append(
+                frame.with_columns(
+                    [
+                        (pl.col("month_id") // 12).alias("year"),
+                        (pl.col("month_id") % 12 + 1).alias("month"),
+                    ]
+                ).sort(CUBE_KEYS + ["series", "month_id"], nulls_last=False)
+            )
+        return frames[0], frames[1]
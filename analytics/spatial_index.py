@@ -0,0 +1,264 @@
+"""Grid-bucket spatial index over transaction coordinates."""
+
+import math
+
+import numpy as np
+
+from analytics.price_grid import METERS_PER_DEGREE_LAT, REFERENCE_LATITUDE
+
+DEFAULT_BUCKET_SIZE_M = 500
+EARTH_RADIUS_M = 6_371_000.0
+_CELL_KEY_OFFSET = 1 << 20  # Keeps cell keys positive for negative cell coordinates
+
+
+def project_to_meters(lat, lon, reference_latitude=REFERENCE_LATITUDE):
+    """
+    Project latitude/longitude to a local metric plane.
+
+    East-west distances are exact at reference_latitude only; the default
+    is the price grid's, so grid cells stay stable.
+    """
+    meters_per_degree_lon = METERS_PER_DEGREE_LAT * math.cos(
+        math.radians(reference_latitude)
+    )
+    x_m = np.asarray(lon, dtype=np.float64) * meters_per_degree_lon
+    y_m = np.asarray(lat, dtype=np.float64) * METERS_PER_DEGREE_LAT
+    return x_m, y_m
+
+
+def meters_to_lonlat(x_m, y_m, reference_latitude=REFERENCE_LATITUDE):
+    """Inverse of project_to_meters, returning (lon, lat)."""
+    meters_per_degree_lon = METERS_PER_DEGREE_LAT * math.cos(
+        math.radians(reference_latitude)
+    )
+    return (
+        np.asarray(x_m, dtype=np.float64) / meters_per_degree_lon,
+        np.asarray(y_m, dtype=np.float64) / METERS_PER_DEGREE_LAT,
+    )
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres, vectorised over numpy arrays."""
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2)
+    )
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class SpatialIndex:
+    """
+    Index points by square bucket so that radius, box and nearest-neighbour
+    queries only look at the buckets they overlap.
+
+    Points are sorted by bucket key once; a bucket lookup is a binary search
+    in that sorted key array. Query results are positions in the arrays the
+    index was built from.
+
+    Buckets use a plane projected at the mean latitude of the points, and
+    the candidates they return are measured with haversine distances, so
+    distances stay exact for any department.
+    """
+
+    def __init__(self, lat, lon, bucket_size_m=DEFAULT_BUCKET_SIZE_M):
+        self.bucket_size_m = bucket_size_m
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        located = np.isfinite(lat) & np.isfinite(lon)
+        self.reference_latitude = (
+            float(lat[located].mean()) if located.any() else REFERENCE_LATITUDE
+        )
+        self.max_abs_latitude = (
+            float(np.abs(lat[located]).max()) if located.any() else 0.0
+        )
+        x_m, y_m = self.project(lat, lon)
+        valid = np.isfinite(x_m) & np.isfinite(y_m)
+        positions = np.flatnonzero(valid)
+        keys = self._cell_keys(
+            np.floor(x_m[valid] / bucket_size_m).astype(np.int64),
+            np.floor(y_m[valid] / bucket_size_m).astype(np.int64),
+        )
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.positions = positions[order]
+        self.x_m = x_m[self.positions]
+        self.y_m = y_m[self.positions]
+        self.lat = lat[self.positions]
+        self.lon = lon[self.positions]
+        if len(self.positions):
+            self.bounds = (
+                self.x_m.min(),
+                self.y_m.min(),
+                self.x_m.max(),
+                self.y_m.max(),
+            )
+        else:
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def project(self, lat, lon):
+        """Project latitude/longitude to the plane of this index."""
+        return project_to_meters(lat, lon, self.reference_latitude)
+
+    def _radius_box(self, lat, lon, radius_m):
+        """Projected box holding every point within radius_m of (lat, lon)."""
+        center_x, center_y = self.project(lat, lon)
+        # Projected x distances shrink the true ones poleward of the reference
+        # latitude by cos(reference) / cos(latitude); widen x to the worst case
+        max_latitude = min(max(self.max_abs_latitude, abs(lat)), 89.0)
+        x_radius = (
+            radius_m
+            * math.cos(math.radians(self.reference_latitude))
+            / math.cos(math.radians(max_latitude))
+        )
+        return (
+            center_x - x_radius,
+            center_y - radius_m,
+            center_x + x_radius,
+            center_y + radius_m,
+        )
+
+    @staticmethod
+    def _cell_keys(cell_x, cell_y):
+        return (cell_x + _CELL_KEY_OFFSET) * (2 * _CELL_KEY_OFFSET) + (
+            cell_y + _CELL_KEY_OFFSET
+        )
+
+    def _slots_in_box(self, min_x, min_y, max_x, max_y):
+        """Slots (indexes into the sorted arrays) of every bucket overlapping a box."""
+        if not len(self.positions):
+            return np.empty(0, dtype=np.int64)
+        if self._covers_all(min_x, min_y, max_x, max_y):
+            return np.arange(len(self.positions))
+        # Clamp to the indexed extent so huge boxes do not enumerate empty buckets
+        min_x, min_y = max(min_x, self.bounds[0]), max(min_y, self.bounds[1])
+        max_x, max_y = min(max_x, self.bounds[2]), min(max_y, self.bounds[3])
+        if min_x > max_x or min_y > max_y:
+            return np.empty(0, dtype=np.int64)
+        size = self.bucket_size_m
+        cells_x = np.arange(np.floor(min_x / size), np.floor(max_x / size) + 1)
+        cells_y = np.arange(np.floor(min_y / size), np.floor(max_y / size) + 1)
+        grid_x, grid_y = np.meshgrid(cells_x, cells_y, indexing="ij")
+        keys = self._cell_keys(
+            grid_x.ravel().astype(np.int64), grid_y.ravel().astype(np.int64)
+        )
+        starts = np.searchsorted(self.keys, keys, side="left")
+        stops = np.searchsorted(self.keys, keys, side="right")
+        lengths = stops - starts
+        # Expand each [start, stop) run without a Python-level loop
+        run_offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return run_offsets + np.arange(lengths.sum())
+
+    def _covers_all(self, min_x, min_y, max_x, max_y):
+        return (
+            min_x <= self.bounds[0]
+            and min_y <= self.bounds[1]
+            and max_x >= self.bounds[2]
+            and max_y >= self.bounds[3]
+        )
+
+    def query_box(self, min_lat, min_lon, max_lat, max_lon):
+        """Positions of the points inside a latitude/longitude box."""
+        min_x, min_y = self.project(min_lat, min_lon)
+        max_x, max_y = self.project(max_lat, max_lon)
+        slots = self._slots_in_box(min_x, min_y, max_x, max_y)
+        x_m, y_m = self.x_m[slots], self.y_m[slots]
+        inside = (x_m >= min_x) & (x_m <= max_x) & (y_m >= min_y) & (y_m <= max_y)
+        return self.positions[slots[inside]]
+
+    def query_radius(self, lat, lon, radius_m, return_distance=False):
+        """Positions of the points within radius_m metres of (lat, lon)."""
+        slots = self._slots_in_box(*self._radius_box(lat, lon, radius_m))
+        distances = haversine_m(lat, lon, self.lat[slots], self.lon[slots])
+        inside = distances <= radius_m
+        if return_distance:
+            return self.positions[slots[inside]], distances[inside]
+        return self.positions[slots[inside]]
+
+    def pairs_within(self, lats, lons, radius_m):
+        """
+        Every (query, point) pair closer than radius_m, for many queries at once.
+
+        Returns (query_idx, positions, distances) arrays: query_idx indexes
+        lats/lons, positions the original points. Buckets are enumerated for
+        all queries together, so there is no per-query Python loop; memory
+        grows with the number of pairs, so callers chunk large query sets.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        empty = (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),)
+        valid = np.flatnonzero(np.isfinite(lats) & np.isfinite(lons))
+        if not len(self.positions) or not len(valid):
+            return empty
+        lats, lons = lats[valid], lons[valid]
+        max_latitude = min(max(self.max_abs_latitude, np.abs(lats).max()), 89.0)
+        x_radius = (
+            radius_m
+            * math.cos(math.radians(self.reference_latitude))
+            / math.cos(math.radians(max_latitude))
+        )
+        size = self.bucket_size_m
+        center_x, center_y = self.project(lats, lons)
+        first_x = np.floor((center_x - x_radius) / size).astype(np.int64)
+        first_y = np.floor((center_y - radius_m) / size).astype(np.int64)
+        # Same bucket span for every query: the widest any of them needs
+        span_x = int(np.ceil(2 * x_radius / size)) + 1
+        span_y = int(np.ceil(2 * radius_m / size)) + 1
+        offset_x, offset_y = np.meshgrid(
+            np.arange(span_x), np.arange(span_y), indexing="ij"
+        )
+        keys = self._cell_keys(
+            (first_x[:, None] + offset_x.ravel()).ravel(),
+            (first_y[:, None] + offset_y.ravel()).ravel(),
+        )
+        starts = np.searchsorted(self.keys, keys, side="left")
+        lengths = np.searchsorted(self.keys, keys, side="right") - starts
+        run_offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        slots = run_offsets + np.arange(lengths.sum())
+        query_idx = np.repeat(np.repeat(np.arange(len(lats)), span_x * span_y), lengths)
+
+        distances = haversine_m(
+            lats[query_idx], lons[query_idx], self.lat[slots], self.lon[slots]
+        )
+        inside = distances <= radius_m
+        return (
+            valid[query_idx[inside]],
+            self.positions[slots[inside]],
+            distances[inside],
+        )
+
+    def nearest(self, lat, lon, k, max_radius_m=None, mask=None):
+        """
+        Positions and distances of the k nearest points, closest first.
+
+        mask is an optional boolean array over the original points; only
+        points where it is True are returned. The search radius doubles
+        until k points are found or max_radius_m is exceeded.
+        """
+        radius_m = self.bucket_size_m
+        while True:
+            positions, distances = self.query_radius(
+                lat, lon, radius_m, return_distance=True
+            )
+            if mask is not None:
+                keep = mask[positions]
+                positions, distances = positions[keep], distances[keep]
+            exhausted = (
+                max_radius_m is not None and radius_m >= max_radius_m
+            ) or self._covers_all(*self._radius_box(lat, lon, radius_m))
+            if len(positions) >= k or exhausted:
+                break
+            radius_m *= 2
+            if max_radius_m is not None:
+                radius_m = min(radius_m, max_radius_m)
+
+        if max_radius_m is not None:
+            within = distances <= max_radius_m
+            positions, distances = positions[within], distances[within]
+        order = np.argsort(distances, kind="stable")[:k]
+        return positions[order], distances[order]
@@ -0,0 +1,177 @@
+"""Transactions inside user-drawn polygons or distance rings around a point."""
+
+import numpy as np
+import polars as pl
+
+from analytics.spatial_index import project_to_meters
+
+
+def geojson_polygons(geojson):
+    """
+    Extract the polygons of a GeoJSON object as lists of (lon, lat) rings.
+
+    Accepts a FeatureCollection, a Feature or a bare Polygon/MultiPolygon
+    geometry; other geometry types are ignored.
+    """
+    if geojson is None:
+        return []
+    geojson_type = geojson.get("type")
+    if geojson_type == "FeatureCollection":
+        return [
+            polygon
+            for feature in geojson.get("features", [])
+            for polygon in geojson_polygons(feature)
+        ]
+    if geojson_type == "Feature":
+        return geojson_polygons(geojson.get("geometry"))
+    if geojson_type == "Polygon":
+        return [geojson["coordinates"]]
+    if geojson_type == "MultiPolygon":
+        return list(geojson["coordinates"])
+    return []
+
+
+def _points_in_ring(x, y, ring):
+    """Even-odd ray casting of many points against one ring, vectorised over points."""
+    ring = np.asarray(ring, dtype=np.float64)
+    inside = np.zeros(len(x), dtype=bool)
+    x1, y1 = ring[:-1, 0], ring[:-1, 1]
+    x2, y2 = ring[1:, 0], ring[1:, 1]
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        crosses = (ay > y) != (by > y)
+        if not crosses.any():
+            continue
+        x_cross = ax + (y[crosses] - ay) * (bx - ax) / (by - ay)
+        inside[np.flatnonzero(crosses)[x[crosses] < x_cross]] ^= True
+    return inside
+
+
+def points_in_polygon(latitude, longitude, polygon):
+    """Mask of the points inside a polygon (exterior ring minus its holes)."""
+    inside = _points_in_ring(longitude, latitude, polygon[0])
+    for hole in polygon[1:]:
+        inside &= ~_points_in_ring(longitude, latitude, hole)
+    return inside
+
+
+def query_polygon(data, index, geojson):
+    """
+    Return the rows of data inside the polygons of a GeoJSON object.
+
+    index is a SpatialIndex built on data (see RealEstateData.get_spatial_index);
+    each polygon first narrows the search to its bounding box through the
+    index, and only those candidates are tested point-in-polygon.
+    """
+    latitude = data["latitude"].to_numpy()
+    longitude = data["longitude"].to_numpy()
+    selected = []
+    for polygon in geojson_polygons(geojson):
+        exterior = np.asarray(polygon[0], dtype=np.float64)
+        candidates = index.query_box(
+            exterior[:, 1].min(),
+            exterior[:, 0].min(),
+            exterior[:, 1].max(),
+            exterior[:, 0].max(),
+        )
+        inside = points_in_polygon(latitude[candidates], longitude[candidates], polygon)
+        selected.append(candidates[inside])
+
+    if not selected:
+        return data.clear()
+    return data[np.unique(np.concatenate(selected))]
+
+
+def postal_code_index(data):
+    """Map each postal code to the positions of its rows in data."""
+    positions = (
+        data.select(pl.col("code_postal"))
+        .with_row_index("position")
+        .filter(pl.col("code_postal").is_not_null())
+        .group_by("code_postal")
+        .agg(pl.col("position"))
+    )
+    return {
+        code: np.asarray(rows, dtype=np.int64) for code, rows in positions.iter_rows()
+    }
+
+
+def query_postal_code(data, postal_code_index, postal_code):
+    """Return the located rows of data with a postal code."""
+    positions = postal_code_index.get(postal_code)
+    if positions is None:
+        return data.clear()
+    return data[positions].filter(
+        pl.col("latitude").is_not_null() & pl.col("longitude").is_not_null()
+    )
+
+
+def query_radius(data, index, latitude, longitude, radius_km):
+    """Return the rows of data within radius_km of a point, with 'distance_km'."""
+    if radius_km <= 0:
+        return data.clear()
+    positions, distances_m = index.query_radius(
+        latitude, longitude, radius_km * 1000, return_distance=True
+    )
+    return (
+        data[positions]
+        .with_columns(pl.Series("distance_km", (distances_m / 1000).round(3)))
+        .sort("distance_km")
+    )
+
+
+def query_rings(data, index, latitude, longitude, radii_km):
+    """
+    Return the rows of data within the largest radius of a point.
+
+    Each row gets a 'distance_km' column and a 'ring' label such as
+    "1-2 km" naming the innermost ring containing it.
+    """
+    radii_km = sorted(r for r in radii_km if r > 0)
+    if not radii_km:
+        return data.clear()
+    positions, distances_m = index.query_radius(
+        latitude, longitude, radii_km[-1] * 1000, return_distance=True
+    )
+    edges = np.asarray([0.0] + radii_km)
+    ring_idx = np.searchsorted(edges, distances_m / 1000, side="left") - 1
+    ring_idx = np.clip(ring_idx, 0, len(radii_km) - 1)
+    labels = [f"{edges[i]:g}-{edges[i + 1]:g} km" for i in range(len(radii_km))]
+    return (
+        data[positions]
+        .with_columns(
+            [
+                pl.Series("distance_km", (distances_m / 1000).round(3)),
+                pl.Series("ring", [labels[i] for i in ring_idx], dtype=pl.String),
+            ]
+        )
+        .with_columns(pl.col("ring").cast(pl.Enum(labels)))
+        .sort("distance_km")
+    )
+
+
+def summarize_selection(rows, by=None):
+    """Aggregate statistics of a selection, optionally per group column(s)."""
+    if rows is None or rows.is_empty():
+        return pl.DataFrame()
+    aggregations = [
+        pl.len().alias("transaction_count"),
+        pl.median("price_per_sqm").alias("median_price_per_sqm"),
+        pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
+        pl.median("valeur_fonciere").alias("median_price"),
+        pl.median("surface_reelle_bati").alias("median_surface"),
+    ]
+    if by is None:
+        return rows.select(aggregations)
+    return rows.group_by(by).agg(aggregations).sort(by)
+
+
+def polygon_area_km2(polygon):
+    """Approximate area of a (lon, lat) polygon in km², holes removed."""
+    area_m2 = 0.0
+    for ring_idx, ring in enumerate(polygon):
+        ring = np.asarray(ring, dtype=np.float64)
+        # Projected at the ring's own latitude, so areas hold anywhere
+        x_m, y_m = project_to_meters(ring[:, 1], ring[:, 0], ring[:, 1].mean())
+        ring_area = abs(np.dot(x_m, np.roll(y_m, -1)) - np.dot(y_m, np.roll(x_m, -1)))
+        area_m2 += ring_area / 2 if ring_idx == 0 else -ring_area / 2
+    return area_m2 / 1e6
@@ -0,0 +1,133 @@
+"""Sidebar summary statistics for any filter state, served from per-group sums."""
+
+import threading
+
+import polars as pl
+
+SUMMARY_KEYS = ["code_departement", "type_local", "is_outlier", "year"]
+MAX_CACHED_SELECTIONS = 64
+
+
+class SummaryStats:
+    """
+    Transaction count, sums and means of a selection without scanning it.
+
+    The transactions are summed once per department, type, outlier flag
+    and year (count, and sum and non-null count of the price and price per
+    m²); a filter state adds up the matching groups, so means are exact and
+    null-aware like DataFrame.mean(). The median price per m² comes from
+    the distribution store's sketches when one is given, and the
+    year-over-year change from the per-year sums, at no extra scan.
+    """
+
+    def __init__(self, data, distribution_store=None):
+        keys = [col for col in SUMMARY_KEYS if col != "year" and col in data.columns]
+        self.groups = (
+            data.with_columns(pl.col("date_mutation").dt.year().alias("year"))
+            .group_by(keys + ["year"])
+            .agg(
+                [
+                    pl.len().alias("transaction_count"),
+                    pl.sum("valeur_fonciere").alias("price_sum"),
+                    pl.count("valeur_fonciere").alias("price_count"),
+                    pl.sum("price_per_sqm").alias("price_per_sqm_sum"),
+                    pl.count("price_per_sqm").alias("price_per_sqm_count"),
+                ]
+            )
+        )
+        if "is_outlier" not in keys:
+            self.groups = self.groups.with_columns(pl.lit(False).alias("is_outlier"))
+        self.distribution_store = distribution_store
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def get(self, departments=None, types=None, include_outliers=False):
+        """
+        Return a dict of KPIs for the selection (same filters as apply_filters).
+
+        Keys: transaction_count, price_sum, avg_price, price_per_sqm_sum,
+        avg_price_per_sqm, median_price_per_sqm, latest_year and yoy_change
+        (mean price per m² of latest_year against the year before, None when
+        that year has no sale). Means, the median and the change are None
+        when undefined.
+        """
+        key = (
+            tuple(sorted(departments)) if departments else None,
+            tuple(sorted(types)) if types else None,
+            include_outliers,
+        )
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        groups = self.groups
+        if departments and "code_departement" in groups.columns:
+            groups = groups.filter(pl.col("code_departement").is_in(departments))
+        if types and "type_local" in groups.columns:
+            groups = groups.filter(pl.col("type_local").is_in(types))
+        if not include_outliers:
+            groups = groups.filter(~pl.col("is_outlier"))
+
+        totals = groups.select(
+            [
+                pl.sum("transaction_count"),
+                pl.sum("price_sum"),
+                pl.sum("price_count"),
+                pl.sum("price_per_sqm_sum"),
+                pl.sum("price_per_sqm_count"),
+            ]
+        ).row(0, named=True)
+        summary = {
+            "transaction_count": totals["transaction_count"],
+            "price_sum": totals["price_sum"],
+            "avg_price": (
+                totals["price_sum"] / totals["price_count"]
+                if totals["price_count"]
+                else None
+            ),
+            "price_per_sqm_sum": totals["price_per_sqm_sum"],
+            "avg_price_per_sqm": (
+                totals["price_per_sqm_sum"] / totals["price_per_sqm_count"]
+                if totals["price_per_sqm_count"]
+                else None
+            ),
+            "median_price_per_sqm": None,
+            "latest_year": None,
+            "yoy_change": None,
+        }
+
+        if self.distribution_store is not None and summary["transaction_count"]:
+            summary["median_price_per_sqm"] = self.distribution_store.quantiles(
+                [0.5], departments, types, include_outliers
+            )[0]
+
+        yearly = (
+            groups.filter(pl.col("year").is_not_null())
+            .group_by("year")
+            .agg([pl.sum("price_per_sqm_sum"), pl.sum("price_per_sqm_count")])
+            .filter(pl.col("price_per_sqm_count") > 0)
+            .sort("year")
+            .tail(2)
+            .with_columns(
+                (pl.col("price_per_sqm_sum") / pl.col("price_per_sqm_count")).alias(
+                    "avg_price_per_sqm"
+                )
+            )
+        )
+        if yearly.height:
+            summary["latest_year"] = yearly["year"][-1]
+        # Only against the calendar year before: a gap in the sales is no change
+        if (
+            yearly.height == 2
+            and yearly["year"][0] == yearly["year"][1] - 1
+            and yearly["avg_price_per_sqm"][0]
+        ):
+            summary["yoy_change"] = (
+                yearly["avg_price_per_sqm"][1] / yearly["avg_price_per_sqm"][0] - 1
+            )
+
+        with self._cache_lock:
+            if len(self._cache) >= MAX_CACHED_SELECTIONS:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = summary
+        return summary
@@ -0,0 +1,174 @@
+"""Batched price trend fitting for every commune and type over the monthly cube."""
+
+import numpy as np
+import polars as pl
+
+from analytics.monthly_cube import CUBE_KEYS
+from analytics.price_index import ALL_TYPES
+
+DEFAULT_TREND_WINDOW_MONTHS = 36
+MIN_TREND_MONTHS = 12
+MIN_TREND_SALES = 30
+CONFIDENCE_Z = 1.959964  # Two-sided 95 %
+
+
+def _t_critical(degrees_of_freedom):
+    """Student t quantile for CONFIDENCE_Z, by Cornish-Fisher expansion (vectorised)."""
+    z = CONFIDENCE_Z
+    df = np.maximum(np.asarray(degrees_of_freedom, dtype=np.float64), 1.0)
+    return (
+        z
+        + (z**3 + z) / (4 * df)
+        + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+        + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3)
+    )
+
+
+class TrendEngine:
+    """
+    Log-linear and quadratic price trends for all commune × type groups at once.
+
+    Each group's monthly mean price per m² is regressed on time, weighted
+    by the month's sale count. The weighted moments of every group come out
+    of a single group_by over the cube, and the 2×2 (slope) and 3×3
+    (acceleration) normal equations of all groups are solved in one batch.
+    """
+
+    def __init__(self, cube):
+        self.cube = cube
+
+    def _moments(self, window_months):
+        """Weighted power sums of t and log price per group over the trailing window."""
+        months = self.cube.months
+        last_month = months[-1]
+        cells = self.cube.totals.filter(pl.col("month_id") > last_month - window_months)
+        cells = pl.concat(
+            [cells, cells.with_columns(pl.lit(ALL_TYPES).alias("type_local"))]
+        )
+        # Re-aggregate so the ALL_TYPES rows have one cell per commune and month
+        cells = (
+            cells.group_by(CUBE_KEYS + ["month_id"])
+            .agg([pl.sum("transaction_count"), pl.sum("sum_price_per_sqm")])
+            .with_columns(
+                [
+                    pl.col("transaction_count").cast(pl.Float64).alias("w"),
+                    ((pl.col("month_id") - last_month) / 12).alias("t"),
+                    (pl.col("sum_price_per_sqm") / pl.col("transaction_count"))
+                    .log()
+                    .alias("y"),
+                ]
+            )
+        )
+        w, t, y = pl.col("w"), pl.col("t"), pl.col("y")
+        return cells.group_by(CUBE_KEYS).agg(
+            [
+                pl.len().alias("months_observed"),
+                pl.sum("transaction_count").alias("sales"),
+                w.sum().alias("s0"),
+                (w * t).sum().alias("s1"),
+                (w * t**2).sum().alias("s2"),
+                (w * t**3).sum().alias("s3"),
+                (w * t**4).sum().alias("s4"),
+                (w * y).sum().alias("sy"),
+                (w * t * y).sum().alias("sty"),
+                (w * t**2 * y).sum().alias("st2y"),
+                (w * y**2).sum().alias("syy"),
+            ]
+        )
+
+    def fit(
+        self,
+        window_months=DEFAULT_TREND_WINDOW_MONTHS,
+        min_months=MIN_TREND_MONTHS,
+        min_sales=MIN_TREND_SALES,
+    ):
+        """
+        Return one row per commune and type with its trend over the window.
+
+        annual_change is the fitted yearly price change (0.05 = +5 %/an) with
+        its 95 % confidence bounds; acceleration is the change of that yearly
+        rate per year, from the quadratic fit; trend_price_per_sqm is the
+        fitted level at the latest month.
+        """
+        if not self.cube.months:
+            return pl.DataFrame()
+        moments = self._moments(window_months).filter(
+            (pl.col("months_observed") >= max(min_months, 4))
+            & (pl.col("sales") >= min_sales)
+        )
+        if moments.is_empty():
+            return pl.DataFrame()
+
+        s0, s1, s2, s3, s4, sy, sty, st2y, syy = (
+            moments[name].to_numpy()
+            for name in ("s0", "s1", "s2", "s3", "s4", "sy", "sty", "st2y", "syy")
+        )
+        months_observed = moments["months_observed"].to_numpy()
+
+        # Linear fit y = a + b t, solved in closed form for every group
+        determinant = s0 * s2 - s1**2
+        slope = (s0 * sty - s1 * sy) / determinant
+        intercept = (sy - slope * s1) / s0
+        residual = syy - intercept * sy - slope * sty
+        degrees_of_freedom = months_observed - 2
+        # Weights are sale counts: sigma2 is the per-sale variance of log price
+        sigma2 = np.maximum(residual, 0) / degrees_of_freedom
+        slope_se = np.sqrt(sigma2 * s0 / determinant)
+        margin = _t_critical(degrees_of_freedom) * slope_se
+
+        # Quadratic fit y = a + b t + c t², batched 3×3 solve
+        normal = np.stack(
+            [
+                np.stack([s0, s1, s2], axis=-1),
+                np.stack([s1, s2, s3], axis=-1),
+                np.stack([s2, s3, s4], axis=-1),
+            ],
+            axis=-2,
+        )
+        rhs = np.stack([sy, sty, st2y], axis=-1)[:, :, None]
+        well_posed = np.abs(np.linalg.det(normal)) > 1e-12
+        normal[~well_posed] = np.eye(3)
+        quadratic = np.linalg.solve(normal, rhs)[:, :, 0]
+        acceleration = np.where(well_posed, 2 * quadratic[:, 2], np.nan)
+
+        return (
+            moments.select(CUBE_KEYS + ["months_observed", "sales"])
+            .with_columns(
+                [
+                    pl.Series("annual_change", np.expm1(slope)),
+                    pl.Series("annual_change_low", np.expm1(slope - margin)),
+                    pl.Series("annual_change_high", np.expm1(slope + margin)),
+                    pl.Series("acceleration", acceleration),
+                    pl.Series("trend_price_per_sqm", np.exp(intercept)),
+                ]
+            )
+            .with_columns(pl.col(pl.Float64).fill_nan(None))
+            .sort(CUBE_KEYS)
+        )
+
+    def movers(
+        self, departments=None, types=None, n=10, significant_only=False, **fit_kwargs
+    ):
+        """
+        Return the (rising, falling) communes with the strongest trends.
+
+        significant_only keeps the communes whose confidence interval
+        excludes zero.
+        """
+        trends = self.fit(**fit_kwargs)
+        if trends.is_empty():
+            return trends, trends
+        if departments:
+            trends = trends.filter(pl.col("code_departement").is_in(departments))
+        if types:
+            trends = trends.filter(pl.col("type_local").is_in(types))
+        if significant_only:
+            trends = trends.filter(
+                (pl.col("annual_change_low") > 0) | (pl.col("annual_change_high") < 0)
+            )
+        trends = trends.filter(pl.col("annual_change").is_not_null())
+        rising = trends.filter(pl.col("annual_change") > 0).sort(
+            "annual_change", descending=True
+        )
+        falling = trends.filter(pl.col("annual_change") < 0).sort("annual_change")
+        return rising.head(n), falling.head(n)
@@ -0,0 +1,225 @@
+"""Batch automated valuation model (AVM) scoring every transaction."""
+
+import numpy as np
+import polars as pl
+
+from analytics.comparables import SALE_KEY
+from analytics.price_index import _hedonic_features, month_id
+from analytics.spatial_index import project_to_meters
+
+COMMUNE_SHRINKAGE = 10.0  # Pseudo-sales pulling small communes to the regional surface
+DENSE_RIDGE = 1e-6
+ROBUST_ITERATIONS = 4
+HUBER_K = 1.345
+VALUATION_Z = 1.5  # Robust z-score beyond which a sale is flagged
+VALUATION_FLAGS = ["Sous le marché", "Dans le marché", "Au-dessus du marché"]
+MODEL_COLUMNS = [
+    "code_departement",
+    "code_commune",
+    "type_local",
+    "surface_reelle_bati",
+    "nombre_pieces_principales",
+    "latitude",
+    "longitude",
+    "date_mutation",
+    "price_per_sqm",
+]
+SCORE_SCHEMA = {
+    "predicted_price_per_sqm": pl.Float64,
+    "predicted_value": pl.Float64,
+    "valuation_gap": pl.Float64,
+    "valuation_flag": pl.Enum(VALUATION_FLAGS),
+}
+
+
+class _DepartmentModel:
+    """
+    Robust ridge regression of log price per m² for one department.
+
+    Dense features: surface, rooms and type (as in the hedonic index),
+    a quadratic surface of the coordinates and one dummy per quarter.
+    Communes enter as shrunken fixed effects: their block of the normal
+    equations is diagonal, so it is accumulated with bincount instead of a
+    one-hot design matrix.
+    """
+
+    def __init__(self, sales):
+        self.center = (
+            np.nanmean(sales["latitude"].to_numpy()),
+            np.nanmean(sales["longitude"].to_numpy()),
+        )
+        quarters = sales.select(month_id() // 3).to_series().to_numpy()
+        self.first_quarter = int(quarters.min())
+        self.n_quarters = int(quarters.max()) - self.first_quarter + 1
+        self.communes = {
+            code: idx
+            for idx, code in enumerate(sales["code_commune"].unique().sort().to_list())
+        }
+
+        dense = self._dense(sales)
+        commune_idx = self._commune_idx(sales)
+        y = np.log(sales["price_per_sqm"].to_numpy())
+
+        # Huber IRLS: DVF prices have heavy tails (multi-lot mutations,
+        # non-market transfers), which plain least squares chases
+        weights = np.ones(len(y))
+        for _ in range(ROBUST_ITERATIONS):
+            self._solve(dense, commune_idx, y, weights)
+            residuals = y - self._predict_log(dense, commune_idx)
+            scale = 1.4826 * np.median(np.abs(residuals - np.median(residuals)))
+            threshold = HUBER_K * max(scale, 1e-9)
+            weights = np.minimum(1.0, threshold / np.maximum(np.abs(residuals), 1e-12))
+
+        # Recentred on the median residual, so predictions are median estimates
+        self.offset = float(np.median(residuals))
+        self.residual_scale = float(1.4826 * np.median(np.abs(residuals - self.offset)))
+
+    def _solve(self, dense, commune_idx, y, weights):
+        """Weighted ridge normal equations with a diagonal commune block."""
+        n_dense, n_communes = dense.shape[1], len(self.communes)
+        weighted_dense = dense * weights[:, None]
+        normal = np.zeros((n_dense + n_communes, n_dense + n_communes))
+        normal[:n_dense, :n_dense] = weighted_dense.T @ dense
+        cross = np.zeros((n_communes, n_dense))
+        np.add.at(cross, commune_idx, weighted_dense)
+        normal[n_dense:, :n_dense] = cross
+        normal[:n_dense, n_dense:] = cross.T
+        commune_weights = np.bincount(
+            commune_idx, weights=weights, minlength=n_communes
+        )
+        normal[n_dense:, n_dense:] = np.diag(commune_weights + COMMUNE_SHRINKAGE)
+        normal[:n_dense, :n_dense] += DENSE_RIDGE * len(y) * np.eye(n_dense)
+        rhs = np.concatenate(
+            [
+                weighted_dense.T @ y,
+                np.bincount(commune_idx, weights=weights * y, minlength=n_communes),
+            ]
+        )
+        coefficients = np.linalg.solve(normal, rhs)
+        self.dense_coefficients = coefficients[:n_dense]
+        self.commune_effects = coefficients[n_dense:]
+
+    def _dense(self, sales):
+        latitude = sales["latitude"].to_numpy().astype(np.float64)
+        longitude = sales["longitude"].to_numpy().astype(np.float64)
+        location_missing = ~(np.isfinite(latitude) & np.isfinite(longitude))
+        x_m, y_m = project_to_meters(latitude, longitude, self.center[0])
+        center_x, center_y = project_to_meters(*self.center, self.center[0])
+        x_km = np.where(location_missing, 0.0, (x_m - center_x) / 1000)
+        y_km = np.where(location_missing, 0.0, (y_m - center_y) / 1000)
+
+        quarters = sales.select(month_id() // 3).to_series().to_numpy()
+        quarter_idx = np.clip(quarters - self.first_quarter, 0, self.n_quarters - 1)
+        quarter_dummies = np.zeros((sales.height, self.n_quarters))
+        quarter_dummies[np.arange(sales.height), quarter_idx] = 1.0
+
+        return np.column_stack(
+            [
+                _hedonic_features(sales),
+                x_km,
+                y_km,
+                x_km**2,
+                y_km**2,
+                x_km * y_km,
+                location_missing.astype(np.float64),
+                quarter_dummies,
+            ]
+        )
+
+    def _commune_idx(self, sales):
+        # Unknown communes get index -1 and no commune effect
+        return np.fromiter(
+            (self.communes.get(code, -1) for code in sales["code_commune"].to_list()),
+            dtype=np.int64,
+            count=sales.height,
+        )
+
+    def _predict_log(self, dense, commune_idx):
+        effects = np.where(
+            commune_idx >= 0, self.commune_effects[np.maximum(commune_idx, 0)], 0.0
+        )
+        return dense @ self.dense_coefficients + effects
+
+    def score(self, sales):
+        """Predicted price per m² and robust z-score of the actual log price."""
+        log_prediction = (
+            self._predict_log(self._dense(sales), self._commune_idx(sales))
+            + self.offset
+        )
+        predicted = np.exp(log_prediction)
+        z_score = (np.log(sales["price_per_sqm"].to_numpy()) - log_prediction) / max(
+            self.residual_scale, 1e-9
+        )
+        return predicted, z_score
+
+
+class ValuationModel:
+    """
+    One AVM per department, refitted only when that department's rows change.
+
+    score() returns columns aligned with the input rows: the predicted price
+    per m² and total value, the relative gap of the actual price to the
+    prediction and a flag for sales well below or above the market.
+
+    Models are fitted on one row per sold lot (repeated DVF rows of a sale
+    dropped, as in ComparablesEngine), then every row is scored.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.fingerprints = {}
+
+    @staticmethod
+    def _fingerprint(sales):
+        return sales.height, int(sales.hash_rows(seed=0).sum())
+
+    def score(self, data):
+        if data.is_empty():
+            return pl.DataFrame(schema=SCORE_SCHEMA)
+        sale_key = [col for col in SALE_KEY if col in data.columns]
+        rows = data.select(MODEL_COLUMNS + sale_key).with_row_index("row_nr")
+        valid = (
+            pl.col("price_per_sqm").is_not_null()
+            & (pl.col("price_per_sqm") > 0)
+            & pl.col("date_mutation").is_not_null()
+            & (pl.col("surface_reelle_bati") > 0)
+        )
+
+        predicted = np.full(data.height, np.nan)
+        z_score = np.full(data.height, np.nan)
+        refitted = 0
+        for (department,), sales in rows.filter(valid).group_by(
+            "code_departement", maintain_order=True
+        ):
+            fit_sales = sales.unique(subset=sale_key, keep="first", maintain_order=True)
+            fingerprint = self._fingerprint(fit_sales.drop("row_nr"))
+            if self.fingerprints.get(department) != fingerprint:
+                self.models[department] = _DepartmentModel(fit_sales)
+                self.fingerprints[department] = fingerprint
+                refitted += 1
+            row_nr = sales["row_nr"].to_numpy()
+            predicted[row_nr], z_score[row_nr] = self.models[department].score(sales)
+        print(
+            f"Valuation model scored {data.height} sales "
+            f"({refitted} of {len(self.models)} departments refitted)."
+        )
+
+        flag_idx = np.where(
+            z_score <= -VALUATION_Z, 0, np.where(z_score >= VALUATION_Z, 2, 1)
+        )
+        flags = np.asarray(VALUATION_FLAGS, dtype=object)[flag_idx]
+        flags[~np.isfinite(z_score)] = None
+        return pl.DataFrame(
+            {
+                "predicted_price_per_sqm": predicted,
+                "predicted_value": predicted
+                * data["surface_reelle_bati"].to_numpy().astype(np.float64),
+                "valuation_gap": data["price_per_sqm"].to_numpy() / predicted - 1,
+                "valuation_flag": pl.Series(flags.tolist(), dtype=pl.String),
+            },
+        ).with_columns(
+            [
+                pl.col(pl.Float64).fill_nan(None),
+                pl.col("valuation_flag").cast(pl.Enum(VALUATION_FLAGS)),
+            ]
+        )
@@ -0,0 +1,455 @@
+"""Mapbox Vector Tile (MVT) generation for transaction points and commune polygons."""
+
+import json
+import math
+import struct
+from functools import lru_cache
+
+import numpy as np
+import polars as pl
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64  # Pixels kept outside the tile so shapes join without seams
+MAX_POINTS_PER_TILE = 2000
+CLUSTER_CELL_PX = 64  # Cluster grid used when a tile holds too many points
+TILE_CACHE_SIZE = 2048
+MIN_RING_AREA_PX = 16  # Rings smaller than this are invisible at the tile zoom
+
+POINT_PROPERTY_COLUMNS = [
+    "id_mutation",
+    "type_local",
+    "valeur_fonciere",
+    "surface_reelle_bati",
+    "price_per_sqm",
+    "nom_commune",
+    "code_postal",
+]
+
+_GEOM_POINT = 1
+_GEOM_POLYGON = 3
+_CMD_MOVE_TO = 1
+_CMD_LINE_TO = 2
+_CMD_CLOSE_PATH = 7
+
+
+def lonlat_to_world(lon, lat):
+    """Project longitude/latitude arrays to Web Mercator world units in [0, 1]."""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    world_x = (lon + 180.0) / 360.0
+    lat_rad = np.radians(lat)
+    world_y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / math.pi) / 2.0
+    return world_x, world_y
+
+
+def tile_bounds(z, x, y, buffer=0):
+    """Return (min_x, min_y, max_x, max_y) of a tile in world units, with a pixel buffer."""
+    tile_size = 1.0 / (1 << z)
+    pad = tile_size * buffer / TILE_EXTENT
+    return (
+        x * tile_size - pad,
+        y * tile_size - pad,
+        (x + 1) * tile_size + pad,
+        (y + 1) * tile_size + pad,
+    )
+
+
+# --- Protobuf encoding -------------------------------------------------------
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field_key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _varint_field(field, value):
+    return _field_key(field, 0) + _varint(value)
+
+
+def _bytes_field(field, payload):
+    return _field_key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _encode_value(value):
+    if isinstance(value, (bool, np.bool_)):
+        return _varint_field(7, int(value))
+    if isinstance(value, (int, np.integer)):
+        value = int(value)
+        if value >= 0:
+            return _varint_field(5, value)
+        return _varint_field(6, _zigzag(value))
+    if isinstance(value, (float, np.floating)):
+        return _field_key(3, 1) + struct.pack("<d", float(value))
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _point_geometry(px, py):
+    return [_command(_CMD_MOVE_TO, 1), _zigzag(int(px)), _zigzag(int(py))]
+
+
+def _polygon_geometry(polygons):
+    """
+    Encode polygons (lists of integer rings, exterior first) as one geometry.
+
+    Several polygons make a multipolygon: each exterior ring starts a new
+    one. Rings must not repeat their first point.
+    """
+    geometry = []
+    cursor_x = cursor_y = 0
+    for rings in polygons:
+        for ring_idx, ring in enumerate(rings):
+            # MVT exterior rings have positive area in tile space, interiors negative
+            area = _ring_area(ring)
+            if (ring_idx == 0) != (area > 0):
+                ring = ring[::-1]
+            for point_idx, (px, py) in enumerate(ring):
+                if point_idx == 0:
+                    geometry.append(_command(_CMD_MOVE_TO, 1))
+                elif point_idx == 1:
+                    geometry.append(_command(_CMD_LINE_TO, len(ring) - 1))
+                geometry.append(_zigzag(px - cursor_x))
+                geometry.append(_zigzag(py - cursor_y))
+                cursor_x, cursor_y = px, py
+            geometry.append(_command(_CMD_CLOSE_PATH, 1))
+    return geometry
+
+
+def _ring_area(ring):
+    area = 0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return area
+
+
+class _LayerBuilder:
+    """Accumulate features and their shared key/value tables for one MVT layer."""
+
+    def __init__(self, name, extent=TILE_EXTENT):
+        self.name = name
+        self.extent = extent
+        self.keys = {}
+        self.values = {}
+        self.features = []
+
+    def _tags(self, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            key_idx = self.keys.setdefault(key, len(self.keys))
+            value_key = (type(value).__name__, value)
+            value_idx = self.values.setdefault(value_key, len(self.values))
+            tags.extend([key_idx, value_idx])
+        return tags
+
+    def add_feature(self, geom_type, geometry, properties, feature_id=None):
+        payload = b""
+        if feature_id is not None:
+            payload += _varint_field(1, feature_id)
+        tags = self._tags(properties)
+        if tags:
+            payload += _packed_field(2, tags)
+        payload += _varint_field(3, geom_type)
+        payload += _packed_field(4, geometry)
+        self.features.append(payload)
+
+    def encode(self):
+        payload = _varint_field(15, 2) + _bytes_field(1, self.name.encode("utf-8"))
+        for feature in self.features:
+            payload += _bytes_field(2, feature)
+        for key in self.keys:
+            payload += _bytes_field(3, key.encode("utf-8"))
+        for _, value in self.values:
+            payload += _bytes_field(4, _encode_value(value))
+        payload += _varint_field(5, self.extent)
+        return payload
+
+
+def encode_tile(layers):
+    """Encode a list of _LayerBuilder into the bytes of one vector tile."""
+    return b"".join(
+        _bytes_field(3, layer.encode()) for layer in layers if layer.features
+    )
+
+
+# --- Polygon clipping --------------------------------------------------------
+
+
+def _clip_ring(ring, min_v, max_v):
+    """Sutherland-Hodgman clip of a ring (list of (x, y)) against a square."""
+    edges = [
+        (lambda p: p[0] >= min_v, lambda a, b: _cut_x(a, b, min_v)),
+        (lambda p: p[0] <= max_v, lambda a, b: _cut_x(a, b, max_v)),
+        (lambda p: p[1] >= min_v, lambda a, b: _cut_y(a, b, min_v)),
+        (lambda p: p[1] <= max_v, lambda a, b: _cut_y(a, b, max_v)),
+    ]
+    for inside, cut in edges:
+        if not ring:
+            break
+        clipped = []
+        previous = ring[-1]
+        for current in ring:
+            if inside(current):
+                if not inside(previous):
+                    clipped.append(cut(previous, current))
+                clipped.append(current)
+            elif inside(previous):
+                clipped.append(cut(previous, current))
+            previous = current
+        ring = clipped
+    return ring
+
+
+def _cut_x(a, b, x):
+    t = (x - a[0]) / (b[0] - a[0])
+    return (x, a[1] + t * (b[1] - a[1]))
+
+
+def _cut_y(a, b, y):
+    t = (y - a[1]) / (b[1] - a[1])
+    return (a[0] + t * (b[0] - a[0]), y)
+
+
+def _quantize_ring(ring):
+    """Round a ring to integer pixels and drop repeated points."""
+    quantized = []
+    for px, py in ring:
+        point = (int(round(px)), int(round(py)))
+        if not quantized or quantized[-1] != point:
+            quantized.append(point)
+    if len(quantized) > 1 and quantized[0] == quantized[-1]:
+        quantized.pop()
+    if len(quantized) < 3 or abs(_ring_area(quantized)) < 2 * MIN_RING_AREA_PX:
+        return []
+    return quantized
+
+
+# --- Tile sources ------------------------------------------------------------
+
+
+class PointTileSource:
+    """Serve transaction points as vector tiles, clustering dense tiles."""
+
+    layer_name = "transactions"
+
+    def __init__(self, data, max_points_per_tile=MAX_POINTS_PER_TILE):
+        self.max_points_per_tile = max_points_per_tile
+        located = data.filter(
+            pl.col("latitude").is_not_null() & pl.col("longitude").is_not_null()
+        )
+        world_x, world_y = lonlat_to_world(
+            located["longitude"].to_numpy(), located["latitude"].to_numpy()
+        )
+        # Sorting on x lets a tile lookup bisect its column instead of scanning
+        order = np.argsort(world_x, kind="stable")
+        self.world_x = world_x[order]
+        self.world_y = world_y[order]
+        self.columns = {
+            col: located[col].to_numpy()[order]
+            for col in POINT_PROPERTY_COLUMNS + ["code_departement"]
+            if col in located.columns
+        }
+        self.tile = lru_cache(maxsize=TILE_CACHE_SIZE)(self._render_tile)
+        print(f"Point tile source ready with {len(self.world_x)} transactions.")
+
+    def _render_tile(self, z, x, y, types=None, departments=None):
+        min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+        start, stop = np.searchsorted(self.world_x, [min_x, max_x])
+        idx = np.arange(start, stop)
+        tile_y = self.world_y[idx]
+        mask = (tile_y >= min_y) & (tile_y < max_y)
+        if types and "type_local" in self.columns:
+            mask &= np.isin(self.columns["type_local"][idx], list(types))
+        if departments and "code_departement" in self.columns:
+            mask &= np.isin(self.columns["code_departement"][idx], list(departments))
+        idx = idx[mask]
+
+        layer = _LayerBuilder(self.layer_name)
+        scale = TILE_EXTENT * (1 << z)
+        px = np.floor((self.world_x[idx] - min_x) * scale).astype(np.int64)
+        py = np.floor((self.world_y[idx] - min_y) * scale).astype(np.int64)
+
+        if len(idx) <= self.max_points_per_tile:
+            for row, point_x, point_y in zip(idx, px, py):
+                properties = {
+                    col: values[row].item()
+                    if isinstance(values[row], np.generic)
+                    else values[row]
+                    for col, values in self.columns.items()
+                    if col != "code_departement"
+                }
+                properties["point_count"] = 1
+                layer.add_feature(
+                    _GEOM_POINT, _point_geometry(point_x, point_y), properties
+                )
+        else:
+            self._add_clusters(layer, idx, px, py)
+        return encode_tile([layer])
+
+    def _add_clusters(self, layer, idx, px, py):
+        cells_per_side = TILE_EXTENT // CLUSTER_CELL_PX
+        cell = (py // CLUSTER_CELL_PX) * cells_per_side + (px // CLUSTER_CELL_PX)
+        cell_ids, inverse = np.unique(cell, return_inverse=True)
+        counts = np.bincount(inverse)
+        mean_x = np.bincount(inverse, weights=px) / counts
+        mean_y = np.bincount(inverse, weights=py) / counts
+        properties = {}
+        if "price_per_sqm" in self.columns:
+            prices = self.columns["price_per_sqm"][idx].astype(np.float64)
+            properties["avg_price_per_sqm"] = (
+                np.bincount(inverse, weights=prices) / counts
+            )
+        for cluster_idx in range(len(cell_ids)):
+            cluster_properties = {"point_count": int(counts[cluster_idx])}
+            for key, values in properties.items():
+                cluster_properties[key] = round(float(values[cluster_idx]), 1)
+            layer.add_feature(
+                _GEOM_POINT,
+                _point_geometry(mean_x[cluster_idx], mean_y[cluster_idx]),
+                cluster_properties,
+            )
+
+
+class CommuneTileSource:
+    """Serve commune polygons, with optional per-commune statistics, as vector tiles."""
+
+    layer_name = "communes"
+
+    def __init__(self, geojson_path, commune_stats=None):
+        with open(geojson_path, "r", encoding="utf-8") as f:
+            geojson_data = json.load(f)
+
+        stats_by_code = {}
+        if commune_stats is not None and not commune_stats.is_empty():
+            for row in commune_stats.iter_rows(named=True):
+                code = row.pop("code_commune")
+                stats_by_code[code] = row
+
+        # One entry per commune: (bbox, parts, properties, feature_id), each
+        # part a (bbox, [rings as (n, 2) world arrays]) polygon
+        self.polygons = []
+        for feature_id, feature in enumerate(geojson_data["features"]):
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+            properties = dict(feature.get("properties") or {})
+            properties.update(stats_by_code.get(properties.get("code"), {}))
+            parts = []
+            for polygon in polygons:
+                rings = []
+                for ring in polygon:
+                    ring = np.asarray(ring, dtype=np.float64)
+                    world_x, world_y = lonlat_to_world(ring[:, 0], ring[:, 1])
+                    rings.append(np.column_stack([world_x, world_y]))
+                bbox = (
+                    rings[0][:, 0].min(),
+                    rings[0][:, 1].min(),
+                    rings[0][:, 0].max(),
+                    rings[0][:, 1].max(),
+                )
+                parts.append((bbox, rings))
+            if not parts:
+                continue
+            bbox = (
+                min(part[0][0] for part in parts),
+                min(part[0][1] for part in parts),
+                max(part[0][2] for part in parts),
+                max(part[0][3] for part in parts),
+            )
+            self.polygons.append((bbox, parts, properties, feature_id))
+        self.tile = lru_cache(maxsize=TILE_CACHE_SIZE)(self._render_tile)
+        print(f"Commune tile source ready with {len(self.polygons)} communes.")
+
+    def _render_tile(self, z, x, y):
+        min_x, min_y, max_x, max_y = tile_bounds(z, x, y, buffer=TILE_BUFFER)
+        origin_x, origin_y, _, _ = tile_bounds(z, x, y)
+        scale = TILE_EXTENT * (1 << z)
+        layer = _LayerBuilder(self.layer_name)
+
+        for bbox, parts, properties, feature_id in self.polygons:
+            if bbox[2] < min_x or bbox[0] > max_x or bbox[3] < min_y or bbox[1] > max_y:
+                continue
+            # The parts of a multipolygon stay one feature with one id
+            tile_polygons = []
+            for part_bbox, rings in parts:
+                tile_rings = self._tile_rings(
+                    part_bbox,
+                    rings,
+                    (min_x, min_y, max_x, max_y),
+                    origin_x,
+                    origin_y,
+                    scale,
+                )
+                if tile_rings:
+                    tile_polygons.append(tile_rings)
+            if tile_polygons:
+                layer.add_feature(
+                    _GEOM_POLYGON,
+                    _polygon_geometry(tile_polygons),
+                    properties,
+                    feature_id=feature_id,
+                )
+        return encode_tile([layer])
+
+    @staticmethod
+    def _tile_rings(bbox, rings, bounds, origin_x, origin_y, scale):
+        """Integer tile rings of one polygon, clipped to bounds; [] if outside."""
+        min_x, min_y, max_x, max_y = bounds
+        if bbox[2] < min_x or bbox[0] > max_x or bbox[3] < min_y or bbox[1] > max_y:
+            return []
+        fully_inside = (
+            bbox[0] >= min_x
+            and bbox[2] <= max_x
+            and bbox[1] >= min_y
+            and bbox[3] <= max_y
+        )
+        tile_rings = []
+        for ring in rings:
+            pixels = ((ring - (origin_x, origin_y)) * scale).tolist()
+            if not fully_inside:
+                pixels = _clip_ring(pixels, -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER)
+            pixels = _quantize_ring(pixels)
+            if pixels:
+                tile_rings.append(pixels)
+            elif not tile_rings:
+                break  # Exterior vanished, holes are meaningless
+        return tile_rings
+
+
+def commune_tile_stats(data):
+    """Per-commune statistics attached to the commune polygons."""
+    if data is None or data.is_empty() or "code_commune" not in data.columns:
+        return pl.DataFrame()
+    return data.group_by("code_commune").agg(
+        [
+            pl.median("price_per_sqm").round(0).alias("median_price_per_sqm"),
+            pl.len().cast(pl.Int64).alias("transaction_count"),
+        ]
+    )
@@ -1,14 +1,14 @@
+import functools
+from datetime import datetime
+
 import streamlit as st
 
-from data_processing import RealEstateData
-from ui_components.demographics_page import display_demographics_page
-from ui_components.market_trends_page import display_market_trends_page
-from ui_components.price_map_page import display_price_map_page
-from ui_components.property_map_page import display_property_map_page
-from ui_components.sidebar import (  # Corrected import names
-    apply_filters,
-    display_sidebar_controls,
-)
+from dataset_registry import DatasetRegistry
+from exports import ExportManager
+from ui_components.export_panel import display_export_panel
+from ui_components.pages import PAGES, load_page
+from ui_components.sidebar import create_sidebar, display_department_selector
+from warmup import Warmup
 
 # Removed unused imports like folium, numpy, pandas, plotly, etc. as they are now in specific UI components
 # import folium
@@ -66,27 +66,104 @@ st.markdown(
 )
 
 
-# Initialize data processor
-@st.cache_data(ttl=3600)
-def load_data_and_processor():
+@st.cache_resource
+def get_warmup():
+    return Warmup()
+
+
+# One dataset registry per process: sessions share each department
+# selection's data by reference; it is loaded on first selection, and a
+# stale snapshot is reloaded (and warmed up) in the background
+@st.cache_resource
+def get_dataset_registry():
+    registry = DatasetRegistry()
+    registry.resource_hooks.append(get_warmup().attach)
+    return registry
+
+
+# Export files live in one temporary directory per process; the query server
+# shares the manager so that large exports download from it
+@st.cache_resource
+def get_export_manager():
+    return ExportManager()
+
+
+@st.cache_resource
+def get_query_server():
+    """Start the local query API once per process (serves large export downloads)."""
+    from query_server import DEFAULT_HOST, DEFAULT_PORT, start_query_server
+
+    registry = get_dataset_registry()
     try:
-        data_processor = RealEstateData()
-        data = data_processor.load_data()
-        if data is None or data.is_empty():
-            st.error(
-                "Le chargement des données a échoué ou les données sont vides. Vérifiez les logs et les fichiers CSV."
-            )
-            return None, None
-        return data_processor, data
-    except Exception as e:
+        # Every department, loaded only if an API query needs it; resolved
+        # per request so the registry's memory budget covers it
+        start_query_server(
+            functools.partial(registry.resource, registry.departments),
+            exports=get_export_manager(),
+        )
+    except OSError as e:
+        # The port is taken, most likely by a standalone query_server.py
+        print(f"Query server not started: {e}")
+        return None
+    return f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+
+
+def load_data_and_processor(selected_departments):
+    # The spinner only shows when the departments are not loaded yet
+    with st.spinner("Chargement des départements sélectionnés…"):
+        data_processor = get_dataset_registry().get(selected_departments)
+    if data_processor is None:
         st.error(
-            f"Erreur critique lors de l'initialisation ou du chargement des données: {e}"
+            "Le chargement des données a échoué ou les données sont vides. Vérifiez les logs et les fichiers CSV."
         )
         return None, None
+    return data_processor, data_processor.data
+
+
+def display_data_resource_status(registry, selected_departments, warmup):
+    resource = registry.resource(selected_departments)
+    progress = warmup.progress()
+    if progress["running"]:
+        st.sidebar.progress(
+            progress["completed"] / progress["total"],
+            text=f"Préchauffage : {progress['current_step']} "
+            f"({progress['completed']}/{progress['total']})",
+        )
+    if resource.loaded_at is not None:
+        st.sidebar.caption(
+            f"Données chargées le {datetime.fromtimestamp(resource.loaded_at):%d/%m/%Y à %H:%M}"
+        )
+    if resource.is_refreshing():
+        st.sidebar.caption("Rechargement des données en arrière-plan…")
+    elif st.sidebar.button("Recharger les données", key="refresh_data"):
+        # The current data stays in use until the new snapshot is loaded
+        resource.refresh()
+        st.sidebar.caption("Rechargement des données en arrière-plan…")
+    loaded = registry.loaded()
+    if loaded:
+        st.sidebar.caption(
+            "En mémoire : "
+            + " ; ".join(", ".join(departments) for departments, _ in loaded)
+            + f" ({registry.memory_usage() / 2**20:,.0f} Mo estimés sur "
+            f"{registry.memory_budget_bytes / 2**20:,.0f} Mo)"
+        )
 
 
 def main():
-    data_processor, raw_data = load_data_and_processor()
+    registry = get_dataset_registry()
+    if not registry.departments:
+        st.error(
+            "Aucun fichier de données trouvé. Vérifiez le dossier de données et les logs."
+        )
+        return
+    # Chosen before loading: only the selected departments are loaded
+    selected_departments = display_department_selector(registry)
+    if not selected_departments:
+        st.info("Sélectionnez au moins un département dans la barre latérale.")
+        return
+
+    data_processor, raw_data = load_data_and_processor(selected_departments)
+    resource = registry.resource(selected_departments)
 
     if not data_processor or raw_data is None or raw_data.is_empty():
         st.warning(
@@ -98,44 +175,38 @@ def main():
         f"Données chargées avec succès! {raw_data.height} transactions disponibles."
     )
 
-    page, selected_departments, selected_types = display_sidebar_controls(
-        raw_data
-    )  # Corrected function name
-
-    filtered_data = apply_filters(raw_data, selected_departments, selected_types)
-
-    # Display filtered data statistics in sidebar (moved from main app body)
-    st.sidebar.markdown(
-        '<div class="sub-header">Statistiques (Données Filtrées)</div>',
-        unsafe_allow_html=True,
+    # Options, filters and statistics come from structures built at load time
+    page, filtered_data, selected_departments, selected_types, include_outliers = (
+        create_sidebar(
+            raw_data,
+            data_processor.get_filter_index(),
+            data_processor.get_summary_stats(),
+            selected_departments,
+        )
     )
-    st.sidebar.info(f"Nombre de transactions: {filtered_data.height:,}")
-    if filtered_data.height > 0:
-        # Ensure columns exist before trying to calculate mean
-        if "valeur_fonciere" in filtered_data.columns:
-            avg_price = filtered_data["valeur_fonciere"].mean()
-            if avg_price is not None:
-                st.sidebar.info(f"Prix moyen: {avg_price:,.2f} €")
-
-        if "price_per_sqm" in filtered_data.columns:
-            avg_price_sqm = filtered_data["price_per_sqm"].mean()
-            if avg_price_sqm is not None:
-                st.sidebar.info(f"Prix moyen au m²: {avg_price_sqm:,.2f} €/m²")
-    else:
-        st.sidebar.info("Aucune transaction après filtrage.")
-
-    if page == "Prix au m²":
-        display_price_map_page(
-            data_processor, filtered_data, selected_departments, selected_types
+    with st.sidebar:
+        display_export_panel(
+            resource,
+            get_export_manager(),
+            selected_departments,
+            selected_types,
+            include_outliers,
+            get_query_server(),
         )
-    elif page == "Tendances du marché":
-        display_market_trends_page(data_processor, filtered_data)
-    elif page == "Données démographiques":
-        display_demographics_page(data_processor, filtered_data)
-    elif page == "Carte des biens":
-        display_property_map_page(data_processor, filtered_data)
-    else:
+    display_data_resource_status(registry, selected_departments, get_warmup())
+
+    if page not in PAGES:
         st.error("Page non reconnue.")
+        return
+    # Page modules (and folium, plotly, pandas) are imported on first visit
+    display_page = load_page(page)
+    display_page(
+        data_processor,
+        filtered_data,
+        selected_departments,
+        selected_types,
+        include_outliers,
+    )
 
 
 if __name__ == "__main__":
@@ -1,15 +1,119 @@
+import functools
+import json
 import os
+import threading
 import traceback
 
-import pandas as pd
 import polars as pl
 
+from analytics.breakdowns import TransactionBreakdowns
+from analytics.comparables import ComparablesEngine
+from analytics.distributions import DistributionStore
+from analytics.filter_index import FilterIndex
+from analytics.monthly_cube import MonthlyCube
+from analytics.outliers import (
+    compute_outlier_bounds,
+    flag_outliers,
+    outlier_bounds_lazy,
+)
+from analytics.parcel_history import ParcelHistory
+from analytics.price_grid import build_price_grid
+from analytics.price_index import PriceIndexEngine
+from analytics.rolling_stats import RollingStatsEngine
+from analytics.seasonality import SeasonalityEngine
+from analytics.spatial_index import SpatialIndex
+from analytics.spatial_query import postal_code_index
+from analytics.summary_stats import SummaryStats
+from analytics.trends import TrendEngine
+from analytics.valuation import SCORE_SCHEMA, ValuationModel
+
+COMMUNES_GEOJSON_PATH = "resources/communes-occitanie.geojson"
+# Directory of the dvf*.parquet files; load tests point it at synthetic data
+DATA_DIR_ENV_VAR = "REAL_ESTATE_DATA_DIR"
+DEFAULT_DATA_DIR = "data"
+
+
+def _built_once(key):
+    """
+    Serialize a lazy getter's build of processed_data[key].
+
+    Concurrent callers (sessions, the warm-up thread) wait for the build in
+    progress and get its result instead of building the same structure
+    again. Cached values are returned without taking the lock.
+    """
+
+    def decorator(getter):
+        @functools.wraps(getter)
+        def wrapper(self, *args, **kwargs):
+            if key in self.processed_data:
+                return self.processed_data[key]
+            with self._build_lock(key):
+                return getter(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def transaction_cast_expressions():
+    """Expressions casting the raw DVF string columns to their analysis types."""
+    return [
+        pl.col("date_mutation").str.strptime(
+            pl.Date, format="%Y-%m-%d", strict=False, exact=True
+        ),
+        pl.col("valeur_fonciere")
+        .str.replace_all(",", "")
+        .cast(pl.Float64, strict=False),
+        pl.col("surface_reelle_bati")
+        .str.replace_all(",", "")
+        .cast(pl.Float64, strict=False),
+        pl.col("nombre_pieces_principales").cast(pl.Int64, strict=False),
+        pl.col("latitude").cast(pl.Float64, strict=False),
+        pl.col("longitude").cast(pl.Float64, strict=False),
+    ]
+
+
+def clean_transactions_lazy(lf, drop_outliers=True):
+    """
+    Apply the load_data cleaning steps to a LazyFrame of raw DVF rows.
+
+    Used by batch jobs that stream parquet files instead of loading them
+    into a RealEstateData object. Rows get the 'is_outlier' flag computed
+    from the frame's own per-commune bounds; with drop_outliers they are
+    removed instead.
+    """
+    cleaned = (
+        lf.filter(pl.col("type_local").is_not_null())
+        .with_columns(transaction_cast_expressions())
+        .filter(
+            pl.col("date_mutation").is_not_null()
+            & pl.col("valeur_fonciere").is_not_null()
+            & pl.col("surface_reelle_bati").is_not_null()
+            & (pl.col("surface_reelle_bati") > 0)
+        )
+        .with_columns(
+            (pl.col("valeur_fonciere") / pl.col("surface_reelle_bati")).alias(
+                "price_per_sqm"
+            )
+        )
+        .filter(pl.col("price_per_sqm").is_finite())
+    )
+    flagged = flag_outliers(cleaned, outlier_bounds_lazy(cleaned))
+    if drop_outliers:
+        return flagged.filter(~pl.col("is_outlier")).drop("is_outlier")
+    return flagged
+
 
 class RealEstateData:
-    def __init__(self, files=None):
-        """Initialize the data processing object with file paths."""
+    def __init__(self, files=None, valuation_model=None):
+        """
+        Initialize the data processing object with file paths.
+
+        valuation_model, typically the one of the processor being replaced,
+        is reused so departments whose sales are unchanged are not refitted.
+        """
         if files is None:
-            data_dir = "data"
+            data_dir = os.environ.get(DATA_DIR_ENV_VAR, DEFAULT_DATA_DIR)
             if not os.path.exists(data_dir) or not os.path.isdir(data_dir):
                 print(f"Error: Data directory '{data_dir}' not found.")
                 self.files = []
@@ -26,6 +130,10 @@ class RealEstateData:
 
         self.data = pl.DataFrame()
         self.processed_data = {}
+        self._build_locks = {}
+        self._build_locks_lock = threading.Lock()
+        if valuation_model is not None:
+            self.processed_data["valuation_model"] = valuation_model
 
     def load_data(self):
         """Load all CSV files, concatenate, clean, and transform them."""
@@ -109,21 +217,7 @@ class RealEstateData:
             print("Data empty after filtering null 'type_local'.")
             return self.data
 
-        column_expressions = [
-            pl.col("date_mutation").str.strptime(
-                pl.Date, format="%Y-%m-%d", strict=False, exact=True
-            ),
-            pl.col("valeur_fonciere")
-            .str.replace_all(",", "")
-            .cast(pl.Float64, strict=False),
-            pl.col("surface_reelle_bati")
-            .str.replace_all(",", "")
-            .cast(pl.Float64, strict=False),
-            pl.col("nombre_pieces_principales").cast(pl.Int64, strict=False),
-            pl.col("latitude").cast(pl.Float64, strict=False),
-            pl.col("longitude").cast(pl.Float64, strict=False),
-        ]
-        self.data = self.data.with_columns(column_expressions)
+        self.data = self.data.with_columns(transaction_cast_expressions())
         print(f"Shape after type casting attempts: {self.data.shape}")
 
         critical_cols_post_cast = [
@@ -155,12 +249,6 @@ class RealEstateData:
         )
         print(f"Shape after calculating 'price_per_sqm': {self.data.shape}")
 
-        # Filter out properties with price_per_sqm > 9000
-        self.data = self.data.filter(pl.col("price_per_sqm") <= 9000)
-        print(
-            f"Shape after filtering out properties with price_per_sqm > 9000: {self.data.shape}"
-        )
-
         self.data = self.data.filter(
             pl.col("price_per_sqm").is_not_null() & pl.col("price_per_sqm").is_finite()
         )
@@ -169,15 +257,52 @@ class RealEstateData:
             print("Data empty after 'price_per_sqm' null/inf filter.")
             return self.data
 
+        # Flag (not drop) prices outside robust per-commune and per-type bounds
+        outlier_bounds = compute_outlier_bounds(self.data)
+        self.processed_data["outlier_bounds"] = outlier_bounds
+        self.data = flag_outliers(self.data, outlier_bounds)
+        print(
+            f"Flagged {self.data['is_outlier'].sum()} price outliers "
+            f"from {outlier_bounds.height} group bounds."
+        )
+
         if self.data.is_empty():
             print("Data is empty after all processing steps in load_data.")
         else:
             print(
                 f"Successfully loaded and processed data. Final shape: {self.data.shape}"
             )
+            self.processed_data["price_grid"] = build_price_grid(self.data)
+            self.data = self.score_valuations(self.data)
+            self.processed_data["parcel_history"] = ParcelHistory(self.data)
 
         return self.data
 
+    def _build_lock(self, key):
+        with self._build_locks_lock:
+            # Reentrant: a getter may be called again while it builds
+            return self._build_locks.setdefault(key, threading.RLock())
+
+    def market_data(self):
+        """Rows of self.data not flagged as price outliers, used by the aggregates."""
+        if "is_outlier" not in self.data.columns:
+            return self.data
+        return self.data.filter(~pl.col("is_outlier"))
+
+    @_built_once("outlier_bounds")
+    def get_outlier_bounds(self):
+        """Get the per-commune and per-type price bounds computed by load_data."""
+        if "outlier_bounds" not in self.processed_data:
+            if self.data is None or self.data.is_empty():
+                print(
+                    "Data not loaded or empty in get_outlier_bounds. Attempting load."
+                )
+                self.load_data()
+            if "outlier_bounds" not in self.processed_data:
+                print("Outlier bounds unavailable in get_outlier_bounds.")
+                return pl.DataFrame()
+        return self.processed_data["outlier_bounds"]
+
     def get_property_price_data(self):
         """Extract property price data."""
         if self.data is None or self.data.is_empty():
@@ -192,7 +317,7 @@ class RealEstateData:
                 return pl.DataFrame()
 
         try:
-            price_data = self.data.filter(pl.col("nature_mutation") == "Vente")
+            price_data = self.market_data().filter(pl.col("nature_mutation") == "Vente")
             commune_prices = price_data.group_by(["nom_commune", "code_postal"]).agg(
                 [
                     pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
@@ -223,14 +348,18 @@ class RealEstateData:
                 return pl.DataFrame()
 
         try:
-            property_types = self.data.group_by(["type_local"]).agg(
-                [
-                    pl.count("id_mutation").alias("count"),
-                    pl.mean("surface_reelle_bati").alias("avg_surface"),
-                    pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
-                    pl.median("valeur_fonciere").alias("median_price"),
-                    pl.mean("nombre_pieces_principales").alias("avg_rooms"),
-                ]
+            property_types = (
+                self.market_data()
+                .group_by(["type_local"])
+                .agg(
+                    [
+                        pl.count("id_mutation").alias("count"),
+                        pl.mean("surface_reelle_bati").alias("avg_surface"),
+                        pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
+                        pl.median("valeur_fonciere").alias("median_price"),
+                        pl.mean("nombre_pieces_principales").alias("avg_rooms"),
+                    ]
+                )
             )
 
             self.processed_data["property_types"] = property_types
@@ -249,7 +378,7 @@ class RealEstateData:
                 return pl.DataFrame()
 
         try:
-            data_with_dates = self.data.with_columns(
+            data_with_dates = self.market_data().with_columns(
                 [
                     pl.col("date_mutation").dt.year().alias("year"),
                     pl.col("date_mutation").dt.month().alias("month"),
@@ -294,7 +423,8 @@ class RealEstateData:
 
         try:
             demographics = (
-                self.data.group_by(["nom_commune", "code_postal"])
+                self.market_data()
+                .group_by(["nom_commune", "code_postal"])
                 .agg(
                     [
                         pl.count("id_mutation").alias("transaction_count"),
@@ -321,7 +451,8 @@ class RealEstateData:
 
         try:
             features = (
-                self.data.group_by("type_local")
+                self.market_data()
+                .group_by("type_local")
                 .agg(
                     [
                         pl.mean("nombre_pieces_principales")
@@ -362,23 +493,28 @@ class RealEstateData:
                 return pl.DataFrame()
 
         try:
-            geo_data = self.data.filter(
-                (pl.col("latitude").is_not_null()) & (pl.col("longitude").is_not_null())
-            ).select(
-                [
-                    "id_mutation",
-                    "type_local",
-                    "valeur_fonciere",
-                    "surface_reelle_bati",
-                    "nombre_pieces_principales",
-                    "nom_commune",
-                    "code_postal",
-                    "adresse_nom_voie",
-                    "adresse_numero",
-                    "latitude",
-                    "longitude",
-                    "price_per_sqm",
-                ]
+            geo_data = (
+                self.market_data()
+                .filter(
+                    (pl.col("latitude").is_not_null())
+                    & (pl.col("longitude").is_not_null())
+                )
+                .select(
+                    [
+                        "id_mutation",
+                        "type_local",
+                        "valeur_fonciere",
+                        "surface_reelle_bati",
+                        "nombre_pieces_principales",
+                        "nom_commune",
+                        "code_postal",
+                        "adresse_nom_voie",
+                        "adresse_numero",
+                        "latitude",
+                        "longitude",
+                        "price_per_sqm",
+                    ]
+                )
             )
 
             self.processed_data["geo_data"] = geo_data
@@ -387,8 +523,401 @@ class RealEstateData:
             print(f"Error in get_all_properties_geo_data: {e}")
             return pl.DataFrame()
 
+    @_built_once("price_grid")
+    def get_price_grid(self):
+        """Get the multi-resolution price grid built at load time."""
+        if "price_grid" in self.processed_data:
+            return self.processed_data["price_grid"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_price_grid. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_price_grid.")
+                return pl.DataFrame()
+
+        price_grid = build_price_grid(self.data)
+        self.processed_data["price_grid"] = price_grid
+        return price_grid
+
+    @_built_once("comparables_engine")
+    def get_comparables_engine(self):
+        """Get the comparable-sales engine, building it on first use."""
+        if "comparables_engine" in self.processed_data:
+            return self.processed_data["comparables_engine"]
+
+        if self.data is None or self.data.is_empty():
+            print(
+                "Data not loaded or empty in get_comparables_engine. Attempting load."
+            )
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_comparables_engine.")
+                return None
+
+        try:
+            engine = ComparablesEngine(self.market_data())
+        except Exception as e:
+            print(f"Error in get_comparables_engine: {e}")
+            return None
+
+        self.processed_data["comparables_engine"] = engine
+        return engine
+
+    @_built_once("spatial_index")
+    def get_spatial_index(self):
+        """Get a spatial index whose positions are rows of self.data."""
+        if "spatial_index" in self.processed_data:
+            return self.processed_data["spatial_index"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_spatial_index. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_spatial_index.")
+                return None
+
+        spatial_index = SpatialIndex(
+            self.data["latitude"].to_numpy(), self.data["longitude"].to_numpy()
+        )
+        self.processed_data["spatial_index"] = spatial_index
+        return spatial_index
+
+    @_built_once("filter_index")
+    def get_filter_index(self):
+        """
+        Get the sidebar filter options and row bitmaps of self.data.
+
+        Built over all rows, outliers included; filter with
+        FilterIndex.select(self.data, ...).
+        """
+        if "filter_index" in self.processed_data:
+            return self.processed_data["filter_index"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_filter_index. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_filter_index.")
+                return None
+
+        try:
+            filter_index = FilterIndex(self.data)
+        except Exception as e:
+            print(f"Error in get_filter_index: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["filter_index"] = filter_index
+        return filter_index
+
+    @_built_once("postal_code_index")
+    def get_postal_code_index(self):
+        """Get the positions of the rows of self.data for each postal code."""
+        if "postal_code_index" in self.processed_data:
+            return self.processed_data["postal_code_index"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_postal_code_index. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_postal_code_index.")
+                return None
+
+        index = postal_code_index(self.data)
+        self.processed_data["postal_code_index"] = index
+        return index
+
+    @_built_once("price_index_engine")
+    def get_price_index_engine(self):
+        """
+        Get the hedonic/repeat-sales index engine, building it on first use.
+
+        New sales can later be folded in with engine.update(new_rows)
+        without refitting from scratch.
+        """
+        if "price_index_engine" in self.processed_data:
+            return self.processed_data["price_index_engine"]
+
+        if self.data is None or self.data.is_empty():
+            print(
+                "Data not loaded or empty in get_price_index_engine. Attempting load."
+            )
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_price_index_engine.")
+                return None
+
+        try:
+            engine = PriceIndexEngine().update(self.market_data())
+        except Exception as e:
+            print(f"Error in get_price_index_engine: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["price_index_engine"] = engine
+        return engine
+
+    @_built_once("monthly_cube")
+    def get_monthly_cube(self):
+        """Get the monthly aggregate cube per commune and type, building it on first use."""
+        if "monthly_cube" in self.processed_data:
+            return self.processed_data["monthly_cube"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_monthly_cube. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_monthly_cube.")
+                return None
+
+        try:
+            cube = MonthlyCube()
+            cube.update(self.market_data())
+        except Exception as e:
+            print(f"Error in get_monthly_cube: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["monthly_cube"] = cube
+        return cube
+
+    @_built_once("rolling_stats_engine")
+    def get_rolling_stats_engine(self):
+        """
+        Get the 12-month rolling statistics engine over the monthly cube.
+
+        After cube.update(new_rows), pass the returned month ids to
+        engine.refresh() to recompute only the affected windows.
+        """
+        if "rolling_stats_engine" in self.processed_data:
+            return self.processed_data["rolling_stats_engine"]
+
+        cube = self.get_monthly_cube()
+        if cube is None:
+            return None
+
+        try:
+            engine = RollingStatsEngine(cube).refresh()
+        except Exception as e:
+            print(f"Error in get_rolling_stats_engine: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["rolling_stats_engine"] = engine
+        return engine
+
+    @_built_once("trend_engine")
+    def get_trend_engine(self):
+        """Get the batched trend engine over the monthly cube."""
+        if "trend_engine" in self.processed_data:
+            return self.processed_data["trend_engine"]
+
+        cube = self.get_monthly_cube()
+        if cube is None:
+            return None
+
+        engine = TrendEngine(cube)
+        self.processed_data["trend_engine"] = engine
+        return engine
+
+    @_built_once("seasonality_engine")
+    def get_seasonality_engine(self):
+        """
+        Get the seasonal decomposition / forecast engine over the monthly cube.
+
+        Its results are recomputed only when the cube's version changes.
+        """
+        if "seasonality_engine" in self.processed_data:
+            return self.processed_data["seasonality_engine"]
+
+        cube = self.get_monthly_cube()
+        if cube is None:
+            return None
+
+        try:
+            engine = SeasonalityEngine(cube).refresh()
+        except Exception as e:
+            print(f"Error in get_seasonality_engine: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["seasonality_engine"] = engine
+        return engine
+
+    @_built_once("parcel_history")
+    def get_parcel_history(self):
+        """Get the parcel/lot sales history index built by load_data."""
+        if "parcel_history" in self.processed_data:
+            return self.processed_data["parcel_history"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_parcel_history. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_parcel_history.")
+                return None
+
+        try:
+            history = ParcelHistory(self.data)
+        except Exception as e:
+            print(f"Error in get_parcel_history: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["parcel_history"] = history
+        return history
+
+    @_built_once("transaction_breakdowns")
+    def get_transaction_breakdowns(self):
+        """
+        Get the per-filter transaction breakdowns (type mix, top types, top communes).
+
+        Built over all rows, outliers included; results are cached per
+        filter state inside the object.
+        """
+        if "transaction_breakdowns" in self.processed_data:
+            return self.processed_data["transaction_breakdowns"]
+
+        if self.data is None or self.data.is_empty():
+            print(
+                "Data not loaded or empty in get_transaction_breakdowns. Attempting load."
+            )
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print(
+                    "Failed to load data or data is empty in get_transaction_breakdowns."
+                )
+                return None
+
+        try:
+            breakdowns = TransactionBreakdowns(self.data)
+        except Exception as e:
+            print(f"Error in get_transaction_breakdowns: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["transaction_breakdowns"] = breakdowns
+        return breakdowns
+
+    @_built_once("distribution_store")
+    def get_distribution_store(self):
+        """
+        Get the price per m² distribution store (box plots, histograms).
+
+        Built over all rows, outliers included, so pages can honour the
+        sidebar's outlier toggle without rebuilding it.
+        """
+        if "distribution_store" in self.processed_data:
+            return self.processed_data["distribution_store"]
+
+        if self.data is None or self.data.is_empty():
+            print(
+                "Data not loaded or empty in get_distribution_store. Attempting load."
+            )
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_distribution_store.")
+                return None
+
+        try:
+            store = DistributionStore(self.data)
+        except Exception as e:
+            print(f"Error in get_distribution_store: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["distribution_store"] = store
+        return store
+
+    @_built_once("summary_stats")
+    def get_summary_stats(self):
+        """
+        Get the sidebar summary statistics service (count, sums, means, median).
+
+        Built over all rows, outliers included, on top of the distribution
+        store for medians.
+        """
+        if "summary_stats" in self.processed_data:
+            return self.processed_data["summary_stats"]
+
+        if self.data is None or self.data.is_empty():
+            print("Data not loaded or empty in get_summary_stats. Attempting load.")
+            self.load_data()
+            if self.data is None or self.data.is_empty():
+                print("Failed to load data or data is empty in get_summary_stats.")
+                return None
+
+        try:
+            stats = SummaryStats(self.data, self.get_distribution_store())
+        except Exception as e:
+            print(f"Error in get_summary_stats: {e}")
+            traceback.print_exc()
+            return None
+
+        self.processed_data["summary_stats"] = stats
+        return stats
+
+    @_built_once("commune_features")
+    def get_commune_features(self, geojson_path=COMMUNES_GEOJSON_PATH):
+        """
+        Get the commune boundary GeoJSON features keyed by commune code.
+
+        The file is parsed once; maps build their FeatureCollection from the
+        communes they display instead of shipping every boundary.
+        """
+        if "commune_features" in self.processed_data:
+            return self.processed_data["commune_features"]
+
+        try:
+            with open(geojson_path, "r", encoding="utf-8") as f:
+                geojson = json.load(f)
+        except Exception as e:
+            print(f"Error in get_commune_features: {e}")
+            traceback.print_exc()
+            return None
+
+        features = {
+            feature["properties"]["code"]: feature
+            for feature in geojson.get("features", [])
+            if feature.get("properties", {}).get("code") is not None
+        }
+        self.processed_data["commune_features"] = features
+        return features
+
+    @_built_once("valuation_model")
+    def get_valuation_model(self):
+        """Get the per-department valuation model (fitted lazily by score_valuations)."""
+        if "valuation_model" not in self.processed_data:
+            self.processed_data["valuation_model"] = ValuationModel()
+        return self.processed_data["valuation_model"]
+
+    def score_valuations(self, data):
+        """
+        Append the valuation columns (predicted price, gap, flag) to data.
+
+        Departments whose rows are unchanged since the last call reuse their
+        fitted model; on failure the columns are added empty.
+        """
+        data = data.drop([col for col in SCORE_SCHEMA if col in data.columns])
+        try:
+            scores = self.get_valuation_model().score(data)
+        except Exception as e:
+            print(f"Error in score_valuations: {e}")
+            traceback.print_exc()
+            scores = pl.DataFrame(
+                {
+                    name: pl.Series(name, [None] * data.height, dtype=dtype)
+                    for name, dtype in SCORE_SCHEMA.items()
+                }
+            )
+        return data.hstack(scores)
+
     def convert_to_pandas(self, data):
         """Convert Polars DataFrame to Pandas DataFrame."""
+        # Imported here: pandas is the slowest import and only pages need it
+        import pandas as pd
+
         if data is None or data.is_empty():
             return pd.DataFrame()
         try:
@@ -0,0 +1,159 @@
+"""Process-wide shared RealEstateData with atomic background refresh."""
+
+import threading
+import time
+import traceback
+import uuid
+
+from data_processing import RealEstateData
+
+DEFAULT_REFRESH_SECONDS = 3600
+
+
+def load_processor(files=None, previous=None):
+    """
+    Build, load and index a new RealEstateData; raise if nothing could be loaded.
+
+    previous is the processor being refreshed: its valuation model is
+    carried over, so only departments whose sales changed are refitted.
+    """
+    data_processor = RealEstateData(
+        files,
+        valuation_model=previous.get_valuation_model()
+        if previous is not None
+        else None,
+    )
+    data = data_processor.load_data()
+    if data is None or data.is_empty():
+        raise ValueError("No transactions loaded.")
+    # Sidebar options and filters resolve through it on every rerun
+    data_processor.get_filter_index()
+    return data_processor
+
+
+class DataResource:
+    """
+    One loaded RealEstateData per process, shared by every session.
+
+    Sessions read the current processor by reference: no copy, no
+    pickling, and its lazily built engines are shared. A refresh loads a
+    complete new processor in a background thread and swaps the reference
+    in one assignment, so sessions keep the previous snapshot until the new
+    one is ready; a failed refresh keeps the previous snapshot too. The
+    loader is called with previous=<current processor or None>.
+
+    prepare_hooks run on a refreshed processor before it is swapped in (in
+    the refresh thread); loaded_hooks run on each processor once it is
+    current, including the first one.
+    """
+
+    def __init__(self, loader=load_processor, refresh_seconds=DEFAULT_REFRESH_SECONDS):
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        # Identifies this resource in keys that may outlive it (export jobs)
+        self.id = uuid.uuid4().hex
+        self.current = None
+        self.version = 0
+        self.loaded_at = None
+        self.last_attempt_at = None
+        self.last_error = None
+        self._load_lock = threading.Lock()
+        # Held while current and version change together (see snapshot())
+        self._swap_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._refresh_thread = None
+        self.prepare_hooks = []
+        self.loaded_hooks = []
+
+    def _load(self):
+        self.last_attempt_at = time.time()
+        try:
+            data_processor = self.loader(previous=self.current)
+        except Exception as e:
+            print(f"Error loading the data resource: {e}")
+            traceback.print_exc()
+            self.last_error = e
+            return False
+        if self.current is not None:
+            for hook in self.prepare_hooks:
+                hook(data_processor)
+        with self._swap_lock:
+            self.current = data_processor
+            self.version += 1
+        self.loaded_at = time.time()
+        self.last_error = None
+        print(f"Data resource loaded (version {self.version}).")
+        for hook in self.loaded_hooks:
+            hook(data_processor)
+        return True
+
+    def get(self):
+        """
+        Return the current processor, or None if no load ever succeeded.
+
+        The first call blocks until the initial load finishes (concurrent
+        first calls wait on the same load); later calls never block and
+        start a background refresh once the snapshot is refresh_seconds old.
+        """
+        if self.current is None:
+            with self._load_lock:
+                if self.current is None:
+                    self._load()
+            return self.current
+        if self.is_stale():
+            self.refresh()
+        return self.current
+
+    def snapshot(self):
+        """
+        Return (processor, version) of the same load, as get() would.
+
+        Reading current and version separately can pair an old processor
+        with a new version if a refresh lands in between.
+        """
+        self.get()
+        with self._swap_lock:
+            return self.current, self.version
+
+    def release(self):
+        """
+        Drop the current processor; the next get() loads it again.
+
+        Its memory is freed once sessions drop their references to it.
+        """
+        with self._swap_lock:
+            self.current = None
+
+    def is_stale(self):
+        last = self.last_attempt_at or self.loaded_at
+        return (
+            self.refresh_seconds is not None
+            and last is not None
+            and time.time() - last >= self.refresh_seconds
+        )
+
+    def refresh(self, wait=False):
+        """
+        Reload the data in a background thread unless a refresh is running.
+
+        Returns the refresh thread; with wait=True, joins it first.
+        """
+        with self._thread_lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self.last_attempt_at = time.time()
+                self._refresh_thread = threading.Thread(
+                    target=self._refresh, name="data-resource-refresh", daemon=True
+                )
+                self._refresh_thread.start()
+            thread = self._refresh_thread
+        if wait:
+            thread.join()
+        return thread
+
+    def _refresh(self):
+        with self._load_lock:
+            self._load()
+
+    def is_refreshing(self):
+        thread = self._refresh_thread
+        return thread is not None and thread.is_alive()
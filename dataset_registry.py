@@ -0,0 +1,274 @@
+"""Registry of the department datasets: metadata at startup, data on demand."""
+
+import functools
+import json
+import os
+import threading
+import traceback
+from collections import OrderedDict
+
+import polars as pl
+
+from data_processing import (
+    DATA_DIR_ENV_VAR,
+    DEFAULT_DATA_DIR,
+    transaction_cast_expressions,
+)
+from data_resource import DataResource, load_processor
+
+MEMORY_BUDGET_ENV_VAR = "REAL_ESTATE_MEMORY_BUDGET_MB"
+DEFAULT_MEMORY_BUDGET_MB = 2048
+# Measured: a warmed processor (engines, indexes, grids) takes about this
+# many times the estimated size of its transactions frame
+PROCESSOR_SIZE_FACTOR = 17
+METADATA_CACHE_FILE = ".dataset_registry.json"
+# Bumped when summarize_dataset() changes, so older caches are rebuilt
+METADATA_CACHE_VERSION = 1
+
+
+def read_footer(path):
+    """Columns and row count of a parquet file, read from its footer only."""
+    columns = list(pl.read_parquet_schema(path))
+    # A bare len() of a scan is answered from the row group metadata
+    row_count = pl.scan_parquet(path).select(pl.len()).collect().item()
+    return {"columns": columns, "row_count": row_count}
+
+
+def summarize_dataset(path):
+    """
+    Departments, date range and value ranges of the transactions in a DVF parquet file.
+
+    DVF files store every column as strings (header rows included), so the
+    footer statistics are lexicographic and cannot give these; the few
+    columns needed are scanned instead, once per file version.
+    """
+    summary = (
+        pl.scan_parquet(path)
+        .with_columns(transaction_cast_expressions())
+        .filter(pl.col("date_mutation").is_not_null())
+        .select(
+            [
+                pl.col("code_departement")
+                .drop_nulls()
+                .unique()
+                .sort()
+                .implode()
+                .alias("departments"),
+                pl.len().alias("transaction_count"),
+                pl.min("date_mutation").alias("first_date"),
+                pl.max("date_mutation").alias("last_date"),
+                pl.min("valeur_fonciere").alias("min_price"),
+                pl.max("valeur_fonciere").alias("max_price"),
+                pl.min("surface_reelle_bati").alias("min_surface"),
+                pl.max("surface_reelle_bati").alias("max_surface"),
+            ]
+        )
+        .collect()
+        .row(0, named=True)
+    )
+    for key in ("first_date", "last_date"):
+        if summary[key] is not None:
+            summary[key] = summary[key].isoformat()
+    return summary
+
+
+def scan_datasets(data_dir, cache_file=METADATA_CACHE_FILE):
+    """
+    Metadata of every parquet file in data_dir.
+
+    Footers are read on every call. Summaries are kept in cache_file in
+    data_dir, keyed by file name, size and modification time, so only new
+    or changed files are scanned and startup stays flat as files are added.
+    """
+    if not os.path.isdir(data_dir):
+        print(f"Error: Data directory '{data_dir}' not found.")
+        return []
+    cache_path = os.path.join(data_dir, cache_file)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if cache.get("version") != METADATA_CACHE_VERSION:
+        cache = {"version": METADATA_CACHE_VERSION, "files": {}}
+
+    datasets, summaries = [], {}
+    for file_name in sorted(os.listdir(data_dir)):
+        if not file_name.endswith(".parquet"):
+            continue
+        path = os.path.join(data_dir, file_name)
+        try:
+            stat = os.stat(path)
+            footer = read_footer(path)
+            summary = cache["files"].get(file_name)
+            if (
+                summary is None
+                or summary.get("file_size") != stat.st_size
+                or summary.get("modified_ns") != stat.st_mtime_ns
+            ):
+                print(f"Summarizing {path} for the dataset registry...")
+                summary = dict(
+                    summarize_dataset(path),
+                    file_size=stat.st_size,
+                    modified_ns=stat.st_mtime_ns,
+                )
+        except Exception as e:
+            print(f"Error reading dataset metadata of {path}: {e}")
+            traceback.print_exc()
+            continue
+        summaries[file_name] = summary
+        datasets.append(dict(summary, **footer, path=path, file_name=file_name))
+
+    if summaries != cache["files"]:
+        try:
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"version": METADATA_CACHE_VERSION, "files": summaries}, f, indent=1
+                )
+        except OSError as e:
+            print(f"Dataset metadata cache not written: {e}")
+    return datasets
+
+
+class DatasetRegistry:
+    """
+    Available departments and their metadata, with their data loaded on demand.
+
+    Startup only reads parquet footers and the metadata cache. The
+    processor of a department selection is loaded on first request, from
+    the files holding those departments, in a DataResource shared by every
+    session (and refreshed like one). Whenever a selection loads, if the
+    loaded selections exceed the memory budget, the least recently requested
+    ones are released and dropped; sessions still holding their processor
+    keep it until their next rerun. Consumers outside the sessions (the
+    query server) resolve their resource here on each request, so every
+    load is counted.
+    """
+
+    def __init__(self, data_dir=None, memory_budget_bytes=None, loader=load_processor):
+        self.data_dir = data_dir or os.environ.get(DATA_DIR_ENV_VAR, DEFAULT_DATA_DIR)
+        if memory_budget_bytes is None:
+            memory_budget_bytes = (
+                int(os.environ.get(MEMORY_BUDGET_ENV_VAR, DEFAULT_MEMORY_BUDGET_MB))
+                * 2**20
+            )
+        self.memory_budget_bytes = memory_budget_bytes
+        self.loader = loader
+        self.datasets = scan_datasets(self.data_dir)
+        self.departments = sorted(
+            {dep for dataset in self.datasets for dep in dataset["departments"]}
+        )
+        # Called with each new DataResource, e.g. to attach a warm-up
+        self.resource_hooks = []
+        self._resources = OrderedDict()  # Sorted file paths -> DataResource
+        self._lock = threading.Lock()
+        print(
+            f"Dataset registry: {len(self.departments)} departments "
+            f"in {len(self.datasets)} files."
+        )
+
+    @property
+    def default_departments(self):
+        """Departments selected at startup: the first one only."""
+        return self.departments[:1]
+
+    def describe(self, department):
+        """Transaction count, first and last year and files of a department."""
+        datasets = [d for d in self.datasets if department in d["departments"]]
+        first_dates = [d["first_date"] for d in datasets if d["first_date"]]
+        last_dates = [d["last_date"] for d in datasets if d["last_date"]]
+        return {
+            "transaction_count": sum(d["transaction_count"] for d in datasets),
+            "first_year": int(min(first_dates)[:4]) if first_dates else None,
+            "last_year": int(max(last_dates)[:4]) if last_dates else None,
+            "files": [d["path"] for d in datasets],
+        }
+
+    def files(self, departments):
+        """Paths of the files holding any of departments."""
+        departments = set(departments)
+        return [
+            d["path"]
+            for d in self.datasets
+            if departments.intersection(d["departments"])
+        ]
+
+    def resource(self, departments):
+        """The DataResource of a department selection (not loaded yet if new), or None."""
+        files = tuple(sorted(self.files(departments)))
+        if not files:
+            return None
+        with self._lock:
+            resource = self._resources.get(files)
+            if resource is None:
+                resource = DataResource(functools.partial(self.loader, list(files)))
+                resource.loaded_hooks.append(functools.partial(self._loaded, resource))
+                for hook in self.resource_hooks:
+                    hook(resource)
+                self._resources[files] = resource
+            self._resources.move_to_end(files)
+            return resource
+
+    def get(self, departments):
+        """
+        Processor holding departments, loaded on first request; None if it fails.
+
+        It may hold more departments when files are shared, so callers
+        still filter on departments.
+        """
+        resource = self.resource(departments)
+        if resource is None:
+            return None
+        return resource.get()
+
+    def _loaded(self, resource, data_processor):
+        # Loads and refreshes both change the memory held
+        self.evict(keep=resource)
+
+    def loaded(self):
+        """List of (departments, estimated bytes) of the loaded selections."""
+        with self._lock:
+            entries = list(self._resources.items())
+        return [
+            (self._departments(files), self._estimated_size(resource))
+            for files, resource in entries
+            if resource.current is not None
+        ]
+
+    def memory_usage(self):
+        """Estimated bytes held by the loaded selections."""
+        return sum(size for _, size in self.loaded())
+
+    def evict(self, keep=None):
+        """Release the least recently requested selections while over the budget."""
+        with self._lock:
+            usage = sum(map(self._estimated_size, self._resources.values()))
+            for files, resource in list(self._resources.items()):
+                if usage <= self.memory_budget_bytes:
+                    break
+                if resource is keep or resource.current is None:
+                    continue
+                usage -= self._estimated_size(resource)
+                del self._resources[files]
+                resource.release()
+                print(
+                    f"Evicted departments {', '.join(self._departments(files))} "
+                    f"from memory ({usage / 2**20:.0f} MB still loaded)."
+                )
+
+    def _departments(self, files):
+        return sorted(
+            {
+                dep
+                for d in self.datasets
+                if d["path"] in files
+                for dep in d["departments"]
+            }
+        )
+
+    @staticmethod
+    def _estimated_size(resource):
+        data_processor = resource.current
+        if data_processor is None or data_processor.data is None:
+            return 0
+        return data_processor.data.estimated_size() * PROCESSOR_SIZE_FACTOR
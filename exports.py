@@ -0,0 +1,335 @@
+"""Bulk export of filtered transactions and aggregates to CSV, Parquet or GeoJSON."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+import polars as pl
+
+# Format -> (content type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "geojson": ("application/geo+json", ".geojson"),
+}
+# Dataset -> formats it can be written to
+EXPORT_DATASETS = {
+    "transactions": ["csv", "parquet", "geojson"],
+    "communes": ["csv", "parquet", "geojson"],
+    "monthly": ["csv", "parquet"],
+}
+EXPORT_COLUMNS = [
+    "id_mutation",
+    "date_mutation",
+    "type_local",
+    "valeur_fonciere",
+    "surface_reelle_bati",
+    "nombre_pieces_principales",
+    "price_per_sqm",
+    "adresse_numero",
+    "adresse_nom_voie",
+    "code_postal",
+    "code_commune",
+    "nom_commune",
+    "code_departement",
+    "id_parcelle",
+    "latitude",
+    "longitude",
+    "is_outlier",
+    "predicted_price_per_sqm",
+    "valuation_flag",
+]
+DEFAULT_CHUNK_ROWS = 50_000
+# Larger extracts are written in a background thread
+BACKGROUND_THRESHOLD_ROWS = 200_000
+MAX_JOB_AGE_SECONDS = 3600
+
+
+def export_frame(
+    data_processor, dataset, departments=None, types=None, include_outliers=False
+):
+    """
+    Frame of a dataset for the filter state.
+
+    Transactions are a column selection of the filter index's selection,
+    which is cached and shared with the pages, so no rows are copied.
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise ValueError(f"Unknown export dataset: {dataset}")
+    data = data_processor.data
+    filter_index = data_processor.get_filter_index()
+    rows = filter_index.select(
+        data, departments=departments, types=types, include_outliers=include_outliers
+    )
+
+    if dataset == "transactions":
+        return rows.select([col for col in EXPORT_COLUMNS if col in data.columns])
+    if dataset == "communes":
+        return (
+            rows.filter(pl.col("code_commune").is_not_null())
+            .group_by(["code_departement", "code_commune", "nom_commune"])
+            .agg(
+                [
+                    pl.len().alias("transaction_count"),
+                    pl.median("price_per_sqm").alias("median_price_per_sqm"),
+                    pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
+                    pl.median("valeur_fonciere").alias("median_total_price"),
+                ]
+            )
+            .sort("code_commune")
+        )
+    # Monthly volume and price quartiles from the distribution store
+    summary = data_processor.get_distribution_store().summary(
+        ["year", "month"], departments, types, include_outliers
+    )
+    if summary.is_empty():
+        return summary
+    return summary.drop("outliers").rename(
+        {"count": "transaction_count", "mean": "avg_price_per_sqm"}
+    )
+
+
+def _write_csv(frame, path, chunk_rows):
+    with open(path, "wb") as f:
+        if frame.is_empty():
+            frame.write_csv(f)
+            return
+        for chunk_idx, chunk in enumerate(frame.iter_slices(chunk_rows)):
+            chunk.write_csv(f, include_header=chunk_idx == 0)
+
+
+def _write_point_features(frame, f, chunk_rows):
+    located = frame.filter(
+        pl.col("latitude").is_finite() & pl.col("longitude").is_finite()
+    )
+    properties = [col for col in frame.columns if col not in ("latitude", "longitude")]
+    first = True
+    for chunk in located.iter_slices(chunk_rows):
+        features = chunk.select(
+            pl.format(
+                '{"type":"Feature","geometry":{"type":"Point","coordinates":[{},{}]},'
+                '"properties":{}}',
+                "longitude",
+                "latitude",
+                pl.struct(properties).struct.json_encode(),
+            )
+        ).to_series()
+        f.write(("" if first else ",\n") + ",\n".join(features))
+        first = False
+
+
+def _write_commune_features(frame, f, commune_features):
+    first = True
+    for row in frame.iter_rows(named=True):
+        boundary = (commune_features or {}).get(row["code_commune"])
+        feature = {
+            "type": "Feature",
+            "geometry": boundary["geometry"] if boundary else None,
+            "properties": row,
+        }
+        f.write(("" if first else ",\n") + json.dumps(feature, default=str))
+        first = False
+
+
+def write_export(
+    frame, path, fmt, chunk_rows=DEFAULT_CHUNK_ROWS, commune_features=None
+):
+    """
+    Write frame to path in fmt, chunk_rows rows at a time; return the file size.
+
+    Parquet gets one row group per chunk. GeoJSON writes transactions as
+    points (rows without coordinates are skipped) and communes with their
+    boundary from commune_features (see RealEstateData.get_commune_features).
+    """
+    if fmt == "csv":
+        _write_csv(frame, path, chunk_rows)
+    elif fmt == "parquet":
+        frame.write_parquet(path, row_group_size=chunk_rows)
+    elif fmt == "geojson":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"type":"FeatureCollection","features":[\n')
+            if "latitude" in frame.columns and "longitude" in frame.columns:
+                _write_point_features(frame, f, chunk_rows)
+            elif "code_commune" in frame.columns:
+                _write_commune_features(frame, f, commune_features)
+            else:
+                raise ValueError("GeoJSON needs coordinates or commune codes.")
+            f.write("\n]}\n")
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return os.path.getsize(path)
+
+
+class ExportJob:
+    """One export file, written inline or in a background thread."""
+
+    def __init__(self, dataset, fmt, filters, directory):
+        self.id = uuid.uuid4().hex
+        self.dataset = dataset
+        self.format = fmt
+        self.filters = filters
+        self.rows = None  # Known once the frame is selected
+        self.content_type, extension = EXPORT_FORMATS[fmt]
+        self.file_name = f"{dataset}{extension}"
+        self.path = os.path.join(directory, f"{self.id}{extension}")
+        self.status = "pending"  # pending, running, done or failed
+        self.size_bytes = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "dataset": self.dataset,
+            "format": self.format,
+            "status": self.status,
+            "rows": self.rows,
+            "size_bytes": self.size_bytes,
+            "error": self.error,
+        }
+
+
+class ExportManager:
+    """
+    Export jobs of a process, with their files in one temporary directory.
+
+    Extracts of up to background_threshold_rows rows are written before
+    submit() returns; larger ones in a background thread, polled with
+    get(). An identical request (same resource version, dataset, format
+    and filters) reuses its job, even while it is still being prepared. Jobs and files older than max_age_seconds are removed.
+    """
+
+    def __init__(
+        self,
+        directory=None,
+        background_threshold_rows=BACKGROUND_THRESHOLD_ROWS,
+        max_age_seconds=MAX_JOB_AGE_SECONDS,
+        chunk_rows=DEFAULT_CHUNK_ROWS,
+    ):
+        self.directory = directory or tempfile.mkdtemp(prefix="real-estate-exports-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.background_threshold_rows = background_threshold_rows
+        self.max_age_seconds = max_age_seconds
+        self.chunk_rows = chunk_rows
+        self.jobs = {}
+        self._jobs_by_request = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        resource,
+        dataset,
+        fmt,
+        departments=None,
+        types=None,
+        include_outliers=False,
+    ):
+        """
+        Start (or reuse) the export of a dataset for a filter state; return the job.
+
+        Exports the current processor of resource (a DataResource); a
+        refresh makes a new version, so its exports are new jobs.
+        """
+        if fmt not in EXPORT_DATASETS.get(dataset, []):
+            raise ValueError(f"Cannot export {dataset} as {fmt}")
+        self.cleanup()
+        data_processor, version = resource.snapshot()
+        if data_processor is None:
+            raise LookupError("Data not loaded")
+        filters = (
+            tuple(sorted(departments)) if departments else None,
+            tuple(sorted(types)) if types else None,
+            bool(include_outliers),
+        )
+        request = (resource.id, version, dataset, fmt, filters)
+        # Looked up and registered in one hold, so concurrent identical
+        # requests share the job
+        with self._lock:
+            job = self.jobs.get(self._jobs_by_request.get(request))
+            if job is not None and job.status != "failed":
+                return job
+            job = ExportJob(dataset, fmt, filters, self.directory)
+            self.jobs[job.id] = job
+            self._jobs_by_request[request] = job.id
+
+        try:
+            frame = export_frame(
+                data_processor, dataset, departments, types, include_outliers
+            )
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            job.finished_at = time.time()
+            raise
+        job.rows = frame.height
+
+        commune_features = (
+            data_processor.get_commune_features()
+            if dataset == "communes" and fmt == "geojson"
+            else None
+        )
+        if frame.height <= self.background_threshold_rows:
+            self._run(job, frame, commune_features)
+        else:
+            threading.Thread(
+                target=self._run,
+                args=(job, frame, commune_features),
+                name=f"export-{job.id[:8]}",
+                daemon=True,
+            ).start()
+        return job
+
+    def _run(self, job, frame, commune_features):
+        job.status = "running"
+        start = time.perf_counter()
+        try:
+            job.size_bytes = write_export(
+                frame, job.path, job.format, self.chunk_rows, commune_features
+            )
+        except Exception as e:
+            print(f"Export {job.id} failed: {e}")
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        else:
+            job.status = "done"
+            print(
+                f"Exported {job.rows:,} {job.dataset} rows as {job.format} "
+                f"({job.size_bytes / 2**20:.1f} MB) in {time.perf_counter() - start:.2f} s."
+            )
+        job.finished_at = time.time()
+
+    def get(self, job_id):
+        """The job with job_id, or None."""
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cleanup(self):
+        """Remove finished jobs older than max_age_seconds and their files."""
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            expired = [
+                job
+                for job in self.jobs.values()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job in expired:
+                del self.jobs[job.id]
+            self._jobs_by_request = {
+                request: job_id
+                for request, job_id in self._jobs_by_request.items()
+                if job_id in self.jobs
+            }
+        for job in expired:
+            if os.path.exists(job.path):
+                os.remove(job.path)
+
+    def close(self):
+        """Delete every export file."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,605 @@
+"""Concurrent-session load test of the Streamlit app on synthetic data.
+
+Writes synthetic DVF parquet files, starts ``streamlit run app.py``
+headless on them, and drives N simulated analysts over the websocket
+protocol the browser uses: each session sends the same rerun requests
+(widget states, fragment reruns for fragment widgets) as a browser would.
+Sessions switch pages, change filters and run postal-code and radius
+searches. The report gives p50/p95/p99 rerun latency per action, throughput
+and the server's memory per session. Everything runs locally, offline.
+
+    python load_test.py --sessions 10 --actions 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Common_pb2 import StringArray
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from tornado.websocket import websocket_connect
+
+from data_processing import COMMUNES_GEOJSON_PATH, DATA_DIR_ENV_VAR
+from ui_components.pages import PAGE_NAMES
+
+DEFAULT_PORT = 8599
+DEFAULT_DEPARTMENTS = ["31", "65"]
+DEFAULT_ROWS_PER_DEPARTMENT = 20000
+COMMUNES_PER_DEPARTMENT = 80
+FIRST_SALE_DATE = date(2020, 1, 1)
+SALE_DAYS = 5 * 365
+# type_local -> (share of sales, median surface m², price per m² factor)
+SYNTHETIC_TYPES = {
+    "Maison": (0.45, 110, 1.0),
+    "Appartement": (0.35, 55, 1.25),
+    "Dépendance": (0.15, 20, 0.4),
+    "Local industriel. commercial ou assimilé": (0.05, 150, 0.8),
+}
+# Raw DVF columns, all strings as in the published files
+RAW_COLUMNS = [
+    "id_mutation",
+    "date_mutation",
+    "numero_disposition",
+    "nature_mutation",
+    "valeur_fonciere",
+    "adresse_numero",
+    "adresse_suffixe",
+    "adresse_nom_voie",
+    "adresse_code_voie",
+    "code_postal",
+    "code_commune",
+    "nom_commune",
+    "code_departement",
+    "ancien_code_commune",
+    "ancien_nom_commune",
+    "id_parcelle",
+    "ancien_id_parcelle",
+    "numero_volume",
+    "lot1_numero",
+    "lot1_surface_carrez",
+    "lot2_numero",
+    "lot2_surface_carrez",
+    "lot3_numero",
+    "lot3_surface_carrez",
+    "lot4_numero",
+    "lot4_surface_carrez",
+    "lot5_numero",
+    "lot5_surface_carrez",
+    "nombre_lots",
+    "code_type_local",
+    "type_local",
+    "surface_reelle_bati",
+    "nombre_pieces_principales",
+    "code_nature_culture",
+    "nature_culture",
+    "code_nature_culture_speciale",
+    "nature_culture_speciale",
+    "surface_terrain",
+    "longitude",
+    "latitude",
+    "section_prefixe",
+]
+
+PAGE_LABEL = "Sélectionnez une visualisation"
+DEPARTMENTS_LABEL = "Départements"
+TYPES_LABEL = "Types de biens"
+OUTLIERS_LABEL = "Inclure les prix aberrants"
+PROPERTY_MAP_PAGE = "Carte des biens"
+SUCCESS_STATUSES = (
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+)
+
+
+def _synthetic_communes(department, rng):
+    """(code, name, lat, lon) of the department's communes, from the boundary file."""
+    communes = []
+    try:
+        with open(COMMUNES_GEOJSON_PATH, "r", encoding="utf-8") as f:
+            features = json.load(f).get("features", [])
+    except OSError as e:
+        print(f"Commune boundaries unavailable ({e}), using generated communes.")
+        features = []
+    for feature in features:
+        properties = feature.get("properties", {})
+        if not str(properties.get("code", "")).startswith(department):
+            continue
+        geometry = feature["geometry"]
+        ring = (
+            geometry["coordinates"][0]
+            if geometry["type"] == "Polygon"
+            else geometry["coordinates"][0][0]
+        )
+        lon, lat = np.asarray(ring, dtype=np.float64).mean(axis=0)
+        communes.append((properties["code"], properties.get("nom", ""), lat, lon))
+    if not communes:
+        communes = [
+            (
+                f"{department}{i:03d}",
+                f"Commune {department}-{i}",
+                43.6 + rng.normal(0, 0.3),
+                1.4 + rng.normal(0, 0.3),
+            )
+            for i in range(COMMUNES_PER_DEPARTMENT)
+        ]
+    picked = rng.choice(
+        len(communes), min(COMMUNES_PER_DEPARTMENT, len(communes)), replace=False
+    )
+    return [communes[i] for i in sorted(picked)]
+
+
+def synthetic_transactions(department, rows, seed=0):
+    """Raw DVF-like sales of one department, as a frame of string columns."""
+    rng = np.random.default_rng(seed)
+    communes = _synthetic_communes(department, rng)
+    # A few large communes hold most sales, as in the real data
+    weights = 1.0 / np.arange(1, len(communes) + 1)
+    commune_idx = rng.choice(len(communes), rows, p=weights / weights.sum())
+    base_price = rng.uniform(1200, 4000, len(communes))
+
+    type_names = list(SYNTHETIC_TYPES)
+    shares = np.array([SYNTHETIC_TYPES[name][0] for name in type_names])
+    type_idx = rng.choice(len(type_names), rows, p=shares / shares.sum())
+    median_surface = np.array([SYNTHETIC_TYPES[name][1] for name in type_names])
+    price_factor = np.array([SYNTHETIC_TYPES[name][2] for name in type_names])
+
+    days = rng.integers(0, SALE_DAYS, rows)
+    surface = np.round(median_surface[type_idx] * rng.lognormal(0, 0.35, rows))
+    price_per_sqm = (
+        base_price[commune_idx]
+        * price_factor[type_idx]
+        * (1.03 ** (days / 365))
+        * rng.lognormal(0, 0.25, rows)
+    )
+    # About 1 % of prices are off by an order of magnitude (the outliers)
+    price_per_sqm *= np.where(
+        rng.random(rows) < 0.01, rng.choice([0.1, 10.0], rows), 1.0
+    )
+    surface_text = np.where(rng.random(rows) < 0.1, None, surface.astype(str))
+
+    lat = np.array([communes[i][2] for i in commune_idx]) + rng.normal(0, 0.01, rows)
+    lon = np.array([communes[i][3] for i in commune_idx]) + rng.normal(0, 0.01, rows)
+    postal_codes = [
+        f"{department}{(i // 4) * 10:03d}"[:5] for i in range(len(communes))
+    ]
+    # Resales: some sales reuse an earlier sale's parcel
+    parcel = np.arange(rows)
+    resold = rng.random(rows) < 0.05
+    parcel[resold] = rng.integers(0, rows, resold.sum())
+
+    sale_dates = [FIRST_SALE_DATE + timedelta(days=int(d)) for d in days]
+    columns = {
+        "id_mutation": [f"{d.year}-{department}{i}" for i, d in enumerate(sale_dates)],
+        "date_mutation": [d.isoformat() for d in sale_dates],
+        "numero_disposition": ["1"] * rows,
+        "nature_mutation": ["Vente"] * rows,
+        "valeur_fonciere": [f"{v:.2f}" for v in surface * price_per_sqm],
+        "adresse_numero": (rng.integers(1, 200, rows)).astype(str).tolist(),
+        "adresse_nom_voie": [f"RUE SYNTHETIQUE {i % 50}" for i in range(rows)],
+        "code_postal": [postal_codes[i] for i in commune_idx],
+        "code_commune": [communes[i][0] for i in commune_idx],
+        "nom_commune": [communes[i][1] for i in commune_idx],
+        "code_departement": [department] * rows,
+        "id_parcelle": [
+            f"{communes[commune_idx[p]][0]}000AB{p:05d}"[:14] for p in parcel
+        ],
+        "type_local": [type_names[i] for i in type_idx],
+        "surface_reelle_bati": surface_text.tolist(),
+        "nombre_pieces_principales": np.maximum(1, surface // 25)
+        .astype(int)
+        .astype(str)
+        .tolist(),
+        "longitude": [f"{v:.6f}" for v in lon],
+        "latitude": [f"{v:.6f}" for v in lat],
+    }
+    return pl.DataFrame(
+        {
+            name: pl.Series(name, columns.get(name, [None] * rows), dtype=pl.String)
+            for name in RAW_COLUMNS
+        }
+    )
+
+
+def write_synthetic_dataset(
+    directory, departments=DEFAULT_DEPARTMENTS, rows=DEFAULT_ROWS_PER_DEPARTMENT, seed=0
+):
+    """Write one dvf<department>.parquet per department; return their postal codes."""
+    os.makedirs(directory, exist_ok=True)
+    postal_codes = set()
+    for offset, department in enumerate(departments):
+        frame = synthetic_transactions(department, rows, seed + offset)
+        frame.write_parquet(os.path.join(directory, f"dvf{department}.parquet"))
+        postal_codes.update(frame["code_postal"].unique().to_list())
+    print(f"Wrote {len(departments)} x {rows:,} synthetic sales to {directory}.")
+    return sorted(postal_codes)
+
+
+def start_app(data_dir, port=DEFAULT_PORT, log_path=None, timeout=120):
+    """Start the app headless on data_dir and wait until it answers."""
+    env = dict(os.environ, **{DATA_DIR_ENV_VAR: data_dir})
+    log = open(log_path or os.devnull, "w")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "streamlit",
+            "run",
+            "app.py",
+            "--server.headless",
+            "true",
+            "--server.port",
+            str(port),
+            "--server.fileWatcherType",
+            "none",
+            "--browser.gatherUsageStats",
+            "false",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The app exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health"):
+                return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise TimeoutError(f"The app did not answer on port {port}")
+
+
+def rss_bytes(pid):
+    """Resident memory of a process (Linux)."""
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class AppSession:
+    """
+    One simulated analyst: a websocket session replaying browser reruns.
+
+    Widget states persist between reruns like in the browser; triggers
+    (buttons) are sent once. Widgets are found by element type and label
+    in the deltas of the last runs, with the fragment they belong to.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        self.widgets = {}  # (element type, label) -> (widget id, fragment id, proto)
+        self.states = {}  # widget id -> WidgetState
+        self.elements = set()  # element types rendered by the last run
+        self.exceptions = []
+        self.page = PAGE_NAMES[0]
+
+    async def connect(self):
+        # Search results ship folium maps of up to 1000 markers
+        self.connection = await websocket_connect(
+            self.url, max_message_size=512 * 1024 * 1024
+        )
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def set_widget(self, element_type, label, **value):
+        widget_id = self.widgets[(element_type, label)][0]
+        self.states[widget_id] = WidgetState(id=widget_id, **value)
+
+    def widget(self, element_type, label):
+        return self.widgets[(element_type, label)][2]
+
+    async def rerun(self, fragment_id="", triggers=()):
+        """Send a rerun request and wait for the run to finish; return its duration."""
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.fragment_id = fragment_id
+        message.rerun_script.widget_states.widgets.extend(
+            list(self.states.values()) + list(triggers)
+        )
+        if not fragment_id:
+            self.elements = set()
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        while True:
+            raw = await self.connection.read_message()
+            if raw is None:
+                raise ConnectionError("The app closed the session")
+            forward = ForwardMsg.FromString(raw)
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                self._record(forward.delta)
+            elif kind == "script_finished":
+                if forward.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if forward.script_finished not in SUCCESS_STATUSES:
+                    self.exceptions.append(f"Run status {forward.script_finished}")
+                return time.perf_counter() - start
+
+    def _record(self, delta):
+        element_type = delta.new_element.WhichOneof("type")
+        self.elements.add(element_type)
+        element = getattr(delta.new_element, element_type)
+        if element_type == "exception":
+            self.exceptions.append(element.message)
+        elif getattr(element, "id", ""):
+            self.widgets[(element_type, getattr(element, "label", ""))] = (
+                element.id,
+                delta.fragment_id,
+                element,
+            )
+
+    async def switch_page(self, page):
+        self.set_widget("radio", PAGE_LABEL, int_value=PAGE_NAMES.index(page))
+        self.page = page
+        return await self.rerun()
+
+    async def search(self, postal_code, radius_km):
+        """Submit the property map's search form (a fragment rerun)."""
+        self.set_widget("text_input", "Code Postal:", string_value=postal_code)
+        self.set_widget(
+            "number_input", "Rayon de recherche (km):", double_value=radius_km
+        )
+        button_id, fragment_id, _ = self.widgets[("button", "Rechercher")]
+        return await self.rerun(
+            fragment_id, [WidgetState(id=button_id, trigger_value=True)]
+        )
+
+
+async def _switch_page(session, rng, postal_codes):
+    page = rng.choice([name for name in PAGE_NAMES if name != session.page])
+    return [("switch_page", await session.switch_page(page))]
+
+
+async def _filter_departments(session, rng, postal_codes):
+    # Loads the selection on first use, then reuses it (or evicts another)
+    options = list(session.widget("multiselect", DEPARTMENTS_LABEL).options)
+    departments = rng.sample(options, rng.randint(1, len(options)))
+    session.set_widget(
+        "multiselect",
+        DEPARTMENTS_LABEL,
+        string_array_value=StringArray(data=departments),
+    )
+    return [("filter_departments", await session.rerun())]
+
+
+async def _filter_types(session, rng, postal_codes):
+    options = list(session.widget("multiselect", TYPES_LABEL).options)
+    types = rng.sample(options, rng.randint(1, len(options)))
+    session.set_widget(
+        "multiselect", TYPES_LABEL, string_array_value=StringArray(data=types)
+    )
+    return [("filter_types", await session.rerun())]
+
+
+async def _toggle_outliers(session, rng, postal_codes):
+    checkbox_id = session.widgets[("checkbox", OUTLIERS_LABEL)][0]
+    current = session.states.get(checkbox_id)
+    session.set_widget(
+        "checkbox", OUTLIERS_LABEL, bool_value=not (current and current.bool_value)
+    )
+    return [("toggle_outliers", await session.rerun())]
+
+
+async def _search(session, rng, postal_codes, radius_km, action):
+    timings = []
+    if session.page != PROPERTY_MAP_PAGE:
+        timings.append(("switch_page", await session.switch_page(PROPERTY_MAP_PAGE)))
+    latency = await session.search(rng.choice(postal_codes), radius_km)
+    return timings + [(action, latency)]
+
+
+async def _postal_code_search(session, rng, postal_codes):
+    return await _search(session, rng, postal_codes, 0.0, "postal_code_search")
+
+
+async def _radius_search(session, rng, postal_codes):
+    radius_km = rng.choice([1.0, 2.0, 5.0])
+    return await _search(session, rng, postal_codes, radius_km, "radius_search")
+
+
+# (action, relative frequency) of what an analyst does between reruns
+SCENARIO = [
+    (_switch_page, 3),
+    (_filter_departments, 1),
+    (_filter_types, 2),
+    (_toggle_outliers, 1),
+    (_postal_code_search, 2),
+    (_radius_search, 2),
+]
+
+
+async def run_session(url, index, actions, think_time, postal_codes, seed):
+    """Play one analyst; return (list of (action, seconds), exceptions)."""
+    rng = random.Random(seed + index)
+    session = AppSession(url)
+    timings = []
+    try:
+        await session.connect()
+        timings.append(("initial_load", await session.rerun()))
+        steps, weights = zip(*SCENARIO)
+        for _ in range(actions):
+            if think_time > 0:
+                await asyncio.sleep(rng.expovariate(1 / think_time))
+            step = rng.choices(steps, weights)[0]
+            timings.extend(await step(session, rng, postal_codes))
+    except Exception as e:
+        session.exceptions.append(f"{type(e).__name__}: {e}")
+    return session, timings
+
+
+async def prime(url, timeout=600):
+    """Open every page once and wait for the app's background warm-up to finish."""
+    session = AppSession(url)
+    await session.connect()
+    await session.rerun()
+    deadline = time.time() + timeout
+    while "progress" in session.elements and time.time() < deadline:
+        await asyncio.sleep(1)
+        await session.rerun()
+    for page in PAGE_NAMES:
+        await session.switch_page(page)
+    session.close()
+    return session.exceptions
+
+
+def percentiles(seconds):
+    values = np.asarray(seconds) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+    }
+
+
+async def load_test(
+    port, sessions, actions, think_time, postal_codes, server_pid, seed=0
+):
+    """Run the sessions concurrently against a running app and build the report."""
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    priming_errors = await prime(url)
+    baseline_rss = rss_bytes(server_pid)
+    peak_rss = baseline_rss
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_bytes(server_pid))
+            await asyncio.sleep(0.25)
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[
+            run_session(url, i, actions, think_time, postal_codes, seed)
+            for i in range(sessions)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    # Measured while the sessions (and their session state) are still open
+    final_rss = rss_bytes(server_pid)
+    sampler.cancel()
+    for session, _ in results:
+        session.close()
+
+    by_action = {}
+    for _, timings in results:
+        for action, seconds in timings:
+            by_action.setdefault(action, []).append(seconds)
+    all_timings = [seconds for values in by_action.values() for seconds in values]
+    errors = priming_errors + [
+        error for session, _ in results for error in session.exceptions
+    ]
+    return {
+        "sessions": sessions,
+        "actions_per_session": actions,
+        "think_time_s": think_time,
+        "elapsed_s": elapsed,
+        "reruns": len(all_timings),
+        "throughput_reruns_per_s": len(all_timings) / elapsed if elapsed else 0.0,
+        "latency": percentiles(all_timings) if all_timings else {},
+        "latency_by_action": {
+            action: percentiles(values) for action, values in sorted(by_action.items())
+        },
+        "memory": {
+            "baseline_mb": baseline_rss / 2**20,
+            "peak_mb": peak_rss / 2**20,
+            "final_mb": final_rss / 2**20,
+            "per_session_mb": (final_rss - baseline_rss) / 2**20 / sessions,
+        },
+        "errors": errors,
+    }
+
+
+def print_report(report):
+    print(
+        f"\n{report['sessions']} sessions x {report['actions_per_session']} actions, "
+        f"think time {report['think_time_s']} s: {report['reruns']} reruns in "
+        f"{report['elapsed_s']:.1f} s ({report['throughput_reruns_per_s']:.2f} reruns/s)"
+    )
+    print(f"{'Action':<20} {'Count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(report["latency_by_action"].items()) + [("all", report["latency"])]
+    for action, stats in rows:
+        if stats:
+            print(
+                f"{action:<20} {stats['count']:>6} {stats['p50_ms']:>9.0f} "
+                f"{stats['p95_ms']:>9.0f} {stats['p99_ms']:>9.0f}"
+            )
+    memory = report["memory"]
+    print(
+        f"Server memory: {memory['baseline_mb']:.0f} MB after warm-up, "
+        f"{memory['peak_mb']:.0f} MB peak, {memory['per_session_mb']:.1f} MB per session"
+    )
+    if report["errors"]:
+        print(f"{len(report['errors'])} errors, first: {report['errors'][0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--actions", type=int, default=20, help="Actions per session")
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=1.0,
+        help="Mean pause between actions in seconds (0 for back-to-back reruns)",
+    )
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS_PER_DEPARTMENT)
+    parser.add_argument("--departments", nargs="+", default=DEFAULT_DEPARTMENTS)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="Keep the synthetic files in this directory")
+    parser.add_argument("--app-log", help="Write the app's output to this file")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="dvf-load-test-")
+    postal_codes = write_synthetic_dataset(
+        data_dir, args.departments, args.rows, args.seed
+    )
+    process = start_app(data_dir, args.port, args.app_log)
+    try:
+        report = asyncio.run(
+            load_test(
+                args.port,
+                args.sessions,
+                args.actions,
+                args.think_time,
+                postal_codes,
+                process.pid,
+                args.seed,
+            )
+        )
+    finally:
+        process.terminate()
+        process.wait()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
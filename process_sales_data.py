@@ -1,48 +1,241 @@
+"""Enrich the commune GeoJSON with per-commune sales statistics.
+
+Each department parquet file is scanned lazily, cleaned like
+RealEstateData.load_data and aggregated with the polars streaming engine,
+departments being processed in parallel. The result is written either as
+compact GeoJSON or as a GeoParquet file (one row per commune, WKB geometry).
+"""
+
+import argparse
 import json
 import os
+import re
+import struct
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+from data_processing import clean_transactions_lazy
+
+DEFAULT_DATA_DIR = "data"
+DEFAULT_GEOJSON_PATH = os.path.join("resources", "communes-occitanie.geojson")
+DEFAULT_OUTPUT_PATH = os.path.join("output", "communes-occitanie-sales.geojson")
+
+_WKB_POLYGON = 3
+_WKB_MULTIPOLYGON = 6
+
+
+def column_suffix(value):
+    """Turn a type_local or year value into a column-name suffix."""
+    ascii_value = (
+        unicodedata.normalize("NFKD", str(value)).encode("ascii", "ignore").decode()
+    )
+    return re.sub(r"[^a-z0-9]+", "_", ascii_value.lower()).strip("_")
+
+
+def aggregate_department(parquet_path):
+    """Stream one department file and return its overall, per-type and per-year stats."""
+    sales = (
+        clean_transactions_lazy(pl.scan_parquet(parquet_path))
+        .filter(pl.col("code_commune").is_not_null())
+        .select(
+            [
+                "code_commune",
+                "type_local",
+                pl.col("date_mutation").dt.year().alias("year"),
+                "valeur_fonciere",
+                "price_per_sqm",
+            ]
+        )
+    )
+    overall = sales.group_by("code_commune").agg(
+        [
+            pl.len().cast(pl.Int64).alias("properties_sold"),
+            pl.median("price_per_sqm").alias("median_price_per_sqm"),
+            pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
+            pl.median("valeur_fonciere").alias("median_total_price"),
+            pl.min("year").alias("first_year"),
+            pl.max("year").alias("last_year"),
+        ]
+    )
+    by_type = sales.group_by(["code_commune", "type_local"]).agg(
+        [
+            pl.len().cast(pl.Int64).alias("count"),
+            pl.median("price_per_sqm").alias("median_price_per_sqm"),
+        ]
+    )
+    by_year = sales.group_by(["code_commune", "year"]).agg(
+        [
+            pl.len().cast(pl.Int64).alias("count"),
+            pl.median("price_per_sqm").alias("median_price_per_sqm"),
+        ]
+    )
+    overall, by_type, by_year = pl.collect_all(
+        [overall, by_type, by_year], engine="streaming"
+    )
+    print(
+        f"Aggregated {parquet_path}: {overall.height} communes, "
+        f"{overall['properties_sold'].sum()} sales"
+    )
+    return overall, by_type, by_year
+
+
+def _widen(long_stats, key_column):
+    """Pivot per-key count/median rows into one column per key value."""
+    if long_stats.is_empty():
+        return pl.DataFrame({"code_commune": []}, schema={"code_commune": pl.String})
+    long_stats = long_stats.sort(key_column).with_columns(
+        pl.col(key_column)
+        .map_elements(column_suffix, return_dtype=pl.String)
+        .alias(key_column)
+    )
+    return long_stats.pivot(
+        on=key_column,
+        index="code_commune",
+        values=["count", "median_price_per_sqm"],
+        separator="_",
+    )
+
+
+def compute_commune_stats(parquet_paths, workers=None):
+    """Aggregate every department in parallel and return one wide row per commune."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(aggregate_department, parquet_paths))
+    if not results:
+        return pl.DataFrame()
+
+    overall = pl.concat([result[0] for result in results])
+    by_type = _widen(pl.concat([result[1] for result in results]), "type_local")
+    by_year = _widen(pl.concat([result[2] for result in results]), "year")
+    return (
+        overall.join(by_type, on="code_commune", how="left")
+        .join(by_year, on="code_commune", how="left")
+        .with_columns(pl.col(pl.Float64).round(1))
+    )
 
-import pandas as pd
-
-# Define absolute paths
-base_dir = "/home/ers/workspace/market-analyzer"
-csv_file_path = os.path.join(base_dir, "data", "sales_data.csv")
-geojson_file_path = os.path.join(base_dir, "resources", "communes-occitanie.geojson")
-output_geojson_path = os.path.join(
-    base_dir, "output", "communes-occitanie-sales.geojson"
-)
-output_dir = os.path.dirname(output_geojson_path)
-
-# Ensure output directory exists
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-
-# Load CSV data
-sales_df = pd.read_csv(csv_file_path, low_memory=False)
-sales_df.dropna(
-    subset=["code_commune"], inplace=True
-)  # Ensure 'code_commune' is not NaN
-sales_df["code_commune"] = sales_df["code_commune"].astype(str)
-
-
-# Aggregate sales data by commune
-# Assuming each row is a single property sale/mutation
-sales_by_commune = sales_df.groupby("code_commune").size()
-
-# Load GeoJSON data
-with open(geojson_file_path, "r", encoding="utf-8") as f:
-    geojson_data = json.load(f)
-
-# Merge sales data into GeoJSON
-for feature in geojson_data["features"]:
-    # Use .get() to safely access 'code' and provide a default or skip if not found
-    commune_code = feature["properties"].get("code")
-    if commune_code and commune_code in sales_by_commune:
-        feature["properties"]["properties_sold"] = int(sales_by_commune[commune_code])
+
+def write_geojson(geojson_data, stats_by_code, output_path):
+    """Write the commune features with their stats as compact GeoJSON."""
+    for feature in geojson_data["features"]:
+        commune_code = feature["properties"].get("code")
+        feature["properties"].update(
+            stats_by_code.get(commune_code, {"properties_sold": 0})
+        )
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(geojson_data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def _wkb_polygon(rings):
+    payload = struct.pack("<BII", 1, _WKB_POLYGON, len(rings))
+    for ring in rings:
+        payload += struct.pack("<I", len(ring))
+        payload += b"".join(struct.pack("<dd", x, y) for x, y in ring)
+    return payload
+
+
+def geometry_to_wkb(geometry):
+    """Encode a GeoJSON Polygon or MultiPolygon as little-endian WKB."""
+    if geometry["type"] == "Polygon":
+        return _wkb_polygon(geometry["coordinates"])
+    if geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+        return struct.pack("<BII", 1, _WKB_MULTIPOLYGON, len(polygons)) + b"".join(
+            _wkb_polygon(polygon) for polygon in polygons
+        )
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def write_geoparquet(geojson_data, commune_stats, output_path):
+    """Write one row per commune with WKB geometry and GeoParquet metadata."""
+    communes = pl.DataFrame(
+        {
+            "code_commune": [
+                feature["properties"].get("code")
+                for feature in geojson_data["features"]
+            ],
+            "nom_commune": [
+                feature["properties"].get("nom") for feature in geojson_data["features"]
+            ],
+            "geometry": [
+                geometry_to_wkb(feature["geometry"])
+                for feature in geojson_data["features"]
+            ],
+        },
+        schema={
+            "code_commune": pl.String,
+            "nom_commune": pl.String,
+            "geometry": pl.Binary,
+        },
+    )
+    communes = communes.join(commune_stats, on="code_commune", how="left").with_columns(
+        pl.col("properties_sold").fill_null(0)
+    )
+    geo_metadata = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {
+            "geometry": {
+                "encoding": "WKB",
+                "geometry_types": ["Polygon", "MultiPolygon"],
+            }
+        },
+    }
+    communes.write_parquet(output_path, metadata={"geo": json.dumps(geo_metadata)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        help=f"Department parquet files (default: {DEFAULT_DATA_DIR}/*.parquet)",
+    )
+    parser.add_argument("--geojson", default=DEFAULT_GEOJSON_PATH)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument(
+        "--format",
+        choices=["geojson", "geoparquet"],
+        help="Output format (default: inferred from the output extension)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Departments processed in parallel"
+    )
+    args = parser.parse_args()
+
+    inputs = args.inputs or sorted(
+        os.path.join(DEFAULT_DATA_DIR, f)
+        for f in os.listdir(DEFAULT_DATA_DIR)
+        if f.endswith(".parquet")
+    )
+    if not inputs:
+        parser.error("No input parquet files found.")
+    output_format = args.format or (
+        "geoparquet" if args.output.endswith(".parquet") else "geojson"
+    )
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    commune_stats = compute_commune_stats(inputs, workers=args.workers)
+
+    with open(args.geojson, "r", encoding="utf-8") as f:
+        geojson_data = json.load(f)
+
+    if output_format == "geoparquet":
+        write_geoparquet(geojson_data, commune_stats, args.output)
     else:
-        feature["properties"]["properties_sold"] = 0
+        stats_by_code = {
+            row.pop("code_commune"): {
+                key: value for key, value in row.items() if value is not None
+            }
+            for row in commune_stats.iter_rows(named=True)
+        }
+        write_geojson(geojson_data, stats_by_code, args.output)
+
+    print(f"Successfully processed data and saved to {args.output}")
 
-# Save the updated GeoJSON
-with open(output_geojson_path, "w", encoding="utf-8") as f:
-    json.dump(geojson_data, f, ensure_ascii=False, indent=4)
 
-print(f"Successfully processed data and saved to {output_geojson_path}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+"""Local HTTP query API serving analytics aggregates as JSON or Arrow IPC.
+
+Endpoints (GET):
+  /communes     price statistics per commune
+  /trends       monthly volume and price quartiles
+  /types        volume and price quartiles per property type
+  /search       sales within radius_km of lat, lon
+  /comparables  similar recent sales near lat, lon with a price estimate
+  /export       the filtered transactions or an aggregate as a file
+  /health       data version and load time
+
+/communes, /trends, /types and /search accept repeated "code_departement"
+and "type_local" parameters and "include_outliers=1". Responses are JSON
+unless "format=arrow" is passed or the Accept header asks for
+application/vnd.apache.arrow.stream.
+
+/export takes "dataset" (transactions, communes or monthly), "format"
+(csv, parquet or geojson) and the same filters, and streams the file.
+Large extracts are written in the background: the answer is then 202 with
+a job id, and "/export?job=<id>" downloads the file once it is ready.
+
+POST /comparables scores many properties at once: the body is a JSON
+array of objects (or an Arrow IPC stream) with "latitude", "longitude",
+"type_local" and optionally "surface_reelle_bati",
+"nombre_pieces_principales" and "id_mutation"; "k" and "max_distance_km"
+go in the query string. Each row comes back with its estimate.
+"""
+
+import argparse
+import functools
+import io
+import json
+import os
+import shutil
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import polars as pl
+
+from analytics.comparables import DEFAULT_K, DEFAULT_MAX_DISTANCE_KM
+from data_resource import DataResource, load_processor
+from exports import EXPORT_DATASETS, EXPORT_FORMATS, ExportManager
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+MAX_CACHED_RESPONSES = 256
+DEFAULT_SEARCH_LIMIT = 1000
+MAX_SEARCH_LIMIT = 10_000
+MAX_SEARCH_RADIUS_KM = 50.0
+MAX_COMPARABLES_K = 100
+MAX_BATCH_BODY_BYTES = 64 * 2**20
+BATCH_QUERY_COLUMNS = {
+    "latitude": pl.Float64,
+    "longitude": pl.Float64,
+    "type_local": pl.String,
+    "surface_reelle_bati": pl.Float64,
+    "nombre_pieces_principales": pl.Float64,
+    "id_mutation": pl.String,
+}
+EXPORT_COPY_BUFFER_BYTES = 1 << 20
+SEARCH_COLUMNS = [
+    "id_mutation",
+    "date_mutation",
+    "type_local",
+    "valeur_fonciere",
+    "surface_reelle_bati",
+    "nombre_pieces_principales",
+    "price_per_sqm",
+    "adresse_numero",
+    "adresse_nom_voie",
+    "code_postal",
+    "code_commune",
+    "nom_commune",
+    "code_departement",
+    "latitude",
+    "longitude",
+    "is_outlier",
+    "predicted_price_per_sqm",
+    "valuation_flag",
+]
+
+
+class QueryError(ValueError):
+    """Invalid request parameters (answered with HTTP 400)."""
+
+
+def _floats(query, name, default=None):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise QueryError(f"Missing parameter: {name}")
+        return default
+    try:
+        return float(values[0])
+    except ValueError:
+        raise QueryError(f"Invalid number for {name}: {values[0]}") from None
+
+
+def _bounded(query, name, default, maximum):
+    """A parameter in (0, maximum], else QueryError."""
+    value = _floats(query, name, default)
+    if not 0 < value <= maximum:
+        raise QueryError(f"{name} must be in (0, {maximum}]")
+    return value
+
+
+def _filters(query):
+    return (
+        query.get("code_departement") or None,
+        query.get("type_local") or None,
+        query.get("include_outliers", ["0"])[0].lower() in ("1", "true", "yes"),
+    )
+
+
+def _filter_rows(data, departments, types, include_outliers):
+    if not include_outliers and "is_outlier" in data.columns:
+        data = data.filter(~pl.col("is_outlier"))
+    if departments:
+        data = data.filter(pl.col("code_departement").is_in(departments))
+    if types:
+        data = data.filter(pl.col("type_local").is_in(types))
+    return data
+
+
+def _batch_queries(body, content_type):
+    """Frame of the properties in a POST body, JSON or Arrow IPC."""
+    try:
+        if ARROW_CONTENT_TYPE in content_type:
+            queries = pl.read_ipc_stream(io.BytesIO(body))
+        else:
+            records = json.loads(body)
+            if not isinstance(records, list):
+                raise QueryError("Body must be a JSON array of objects")
+            queries = pl.DataFrame(records, infer_schema_length=None)
+    except QueryError:
+        raise
+    except Exception as e:
+        raise QueryError(f"Invalid body: {e}") from None
+    missing = [
+        col for col in ("latitude", "longitude", "type_local") if col not in queries
+    ]
+    if missing:
+        raise QueryError(f"Missing columns: {', '.join(missing)}")
+    try:
+        return queries.with_columns(
+            [
+                pl.col(col).cast(dtype)
+                for col, dtype in BATCH_QUERY_COLUMNS.items()
+                if col in queries.columns
+            ]
+        )
+    except Exception as e:
+        raise QueryError(f"Invalid column values: {e}") from None
+
+
+def _price_summary(summary):
+    return summary.drop("outliers").rename(
+        {"count": "transaction_count", "mean": "avg_price_per_sqm"}
+    )
+
+
+class QueryService:
+    """
+    Endpoint implementations over the shared data resource.
+
+    Each endpoint returns (DataFrame, metadata dict). Aggregates are read
+    from the processor's cached engines; whole responses are cached per
+    data version, so a refresh of the resource invalidates them.
+
+    resource is a DataResource, or a callable returning the current one:
+    the app passes a DatasetRegistry lookup, so the data the API loads is
+    counted in (and evicted from) the registry's memory budget.
+    """
+
+    def __init__(self, resource, exports=None):
+        self._resource = resource
+        # Shared with the app when it starts the server, so its jobs download here
+        self.exports = exports or ExportManager()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.endpoints = {
+            "/communes": self.communes,
+            "/trends": self.trends,
+            "/types": self.types,
+            "/search": self.search,
+            "/comparables": self.comparables,
+        }
+
+    @property
+    def resource(self):
+        resource = self._resource() if callable(self._resource) else self._resource
+        if resource is None:
+            raise LookupError("No data available")
+        return resource
+
+    def cached_response(self, path, query, fmt):
+        """Encoded (body, content_type, headers) for a request, from cache if possible."""
+        resource = self.resource
+        data_processor, version = resource.snapshot()
+        if data_processor is None:
+            raise LookupError("Data not loaded")
+        # A registry may replace the resource, whose versions restart at 1
+        key = (
+            resource.id,
+            version,
+            path,
+            tuple(sorted((name, tuple(values)) for name, values in query.items())),
+            fmt,
+        )
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        frame, metadata = self.endpoints[path](data_processor, query)
+        response = encode(frame, metadata, fmt)
+        with self._cache_lock:
+            self._cache[key] = response
+            while len(self._cache) > MAX_CACHED_RESPONSES:
+                self._cache.popitem(last=False)
+        return response
+
+    def communes(self, data_processor, query):
+        departments, types, include_outliers = _filters(query)
+        rows = data_processor.get_filter_index().select(
+            data_processor.data,
+            departments=departments,
+            types=types,
+            include_outliers=include_outliers,
+        )
+        frame = (
+            rows.filter(pl.col("code_commune").is_not_null())
+            .group_by(["code_departement", "code_commune", "nom_commune"])
+            .agg(
+                [
+                    pl.len().alias("transaction_count"),
+                    pl.median("price_per_sqm").alias("median_price_per_sqm"),
+                    pl.mean("price_per_sqm").alias("avg_price_per_sqm"),
+                    pl.median("valeur_fonciere").alias("median_total_price"),
+                ]
+            )
+            .sort("code_commune")
+        )
+        return frame, {}
+
+    def trends(self, data_processor, query):
+        store = data_processor.get_distribution_store()
+        summary = store.summary(["month_id", "year", "month"], *_filters(query))
+        if summary.is_empty():
+            return summary, {}
+        return _price_summary(summary).drop("month_id"), {}
+
+    def types(self, data_processor, query):
+        store = data_processor.get_distribution_store()
+        summary = store.summary(["type_local"], *_filters(query))
+        if summary.is_empty():
+            return summary, {}
+        return _price_summary(summary), {}
+
+    def search(self, data_processor, query):
+        latitude, longitude = _floats(query, "lat"), _floats(query, "lon")
+        radius_km = _bounded(query, "radius_km", 1.0, MAX_SEARCH_RADIUS_KM)
+        limit = int(_bounded(query, "limit", DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT))
+
+        positions, distances = data_processor.get_spatial_index().query_radius(
+            latitude, longitude, radius_km * 1000, return_distance=True
+        )
+        data = data_processor.data
+        columns = [col for col in SEARCH_COLUMNS if col in data.columns]
+        rows = _filter_rows(
+            data[positions]
+            .select(columns)
+            .with_columns(pl.Series("distance_m", distances.round(0))),
+            *_filters(query),
+        ).sort("distance_m")
+        return rows.head(limit), {"match_count": rows.height}
+
+    def comparables(self, data_processor, query):
+        type_local = query.get("type_local", [None])[0]
+        if not type_local:
+            raise QueryError("Missing parameter: type_local")
+        surface = _floats(query, "surface", 0.0) or None
+        rooms = _floats(query, "rooms", -1.0)
+        engine = data_processor.get_comparables_engine()
+        comparables, summary = engine.find(
+            _floats(query, "lat"),
+            _floats(query, "lon"),
+            type_local,
+            surface=surface,
+            rooms=int(rooms) if rooms >= 0 else None,
+            k=int(_bounded(query, "k", DEFAULT_K, MAX_COMPARABLES_K)),
+            max_distance_km=_bounded(
+                query, "max_distance_km", DEFAULT_MAX_DISTANCE_KM, MAX_SEARCH_RADIUS_KM
+            ),
+            exclude_id_mutation=query.get("exclude_id_mutation", [None])[0],
+        )
+        return comparables, summary
+
+    def comparables_batch(self, query, body, content_type):
+        """Estimates for every property of a POST body (see find_batch)."""
+        data_processor = self.resource.get()
+        if data_processor is None:
+            raise LookupError("Data not loaded")
+        queries = _batch_queries(body, content_type)
+        estimates = data_processor.get_comparables_engine().find_batch(
+            queries,
+            k=int(_bounded(query, "k", DEFAULT_K, MAX_COMPARABLES_K)),
+            max_distance_km=_bounded(
+                query, "max_distance_km", DEFAULT_MAX_DISTANCE_KM, MAX_SEARCH_RADIUS_KM
+            ),
+        )
+        return estimates, {"query_count": queries.height}
+
+    def export(self, query):
+        """The export job for a request: an existing one by id, else a new one."""
+        job_id = query.get("job", [None])[0]
+        if job_id:
+            job = self.exports.get(job_id)
+            if job is None:
+                raise LookupError(f"Unknown export job: {job_id}")
+            return job
+        dataset = query.get("dataset", ["transactions"])[0]
+        fmt = query.get("format", ["csv"])[0]
+        if dataset not in EXPORT_DATASETS:
+            raise QueryError(f"Unknown dataset: {dataset}")
+        if fmt not in EXPORT_FORMATS:
+            raise QueryError(f"Unknown format: {fmt}")
+        if fmt not in EXPORT_DATASETS[dataset]:
+            raise QueryError(f"Cannot export {dataset} as {fmt}")
+        return self.exports.submit(self.resource, dataset, fmt, *_filters(query))
+
+    def health(self):
+        try:
+            resource = self.resource
+        except LookupError:
+            return {
+                "loaded": False,
+                "version": 0,
+                "loaded_at": None,
+                "refreshing": False,
+            }
+        return {
+            "loaded": resource.current is not None,
+            "version": resource.version,
+            "loaded_at": resource.loaded_at,
+            "refreshing": resource.is_refreshing(),
+        }
+
+
+def encode(frame, metadata, fmt):
+    """Response body, content type and extra headers for a result frame."""
+    if fmt == "arrow":
+        buffer = io.BytesIO()
+        frame.write_ipc_stream(buffer)
+        # Scalar results (counts, estimates) travel in a header
+        headers = {"X-Query-Metadata": json.dumps(metadata, default=str)}
+        return buffer.getvalue(), ARROW_CONTENT_TYPE, headers
+    rows = frame.write_json().encode() if frame.width else b"[]"
+    body = (
+        b'{"metadata":'
+        + json.dumps(metadata, default=str).encode()
+        + b',"row_count":'
+        + str(frame.height).encode()
+        + b',"rows":'
+        + rows
+        + b"}"
+    )
+    return body, "application/json", {}
+
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive between queries
+    # Headers and body are separate writes; without this, Nagle's algorithm
+    # and delayed ACKs add ~40 ms to every kept-alive response
+    disable_nagle_algorithm = True
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/health":
+            body = json.dumps(self.service.health()).encode()
+            self._send(200, body, "application/json")
+            return
+        if url.path == "/export":
+            self._send_export(query)
+            return
+        if url.path not in self.service.endpoints:
+            self._send_error(404, "Not found")
+            return
+
+        fmt = query.pop("format", [None])[0]
+        if fmt is None:
+            fmt = (
+                "arrow"
+                if ARROW_CONTENT_TYPE in self.headers.get("Accept", "")
+                else "json"
+            )
+        if fmt not in ("json", "arrow"):
+            self._send_error(400, f"Unknown format: {fmt}")
+            return
+
+        try:
+            body, content_type, headers = self.service.cached_response(
+                url.path, query, fmt
+            )
+        except QueryError as e:
+            self._send_error(400, str(e))
+            return
+        except LookupError as e:
+            self._send_error(503, str(e))
+            return
+        except Exception as e:
+            print(f"Error answering {self.path}: {e}")
+            traceback.print_exc()
+            self._send_error(500, "Query failed")
+            return
+        self._send(200, body, content_type, headers)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path != "/comparables":
+            self._send_error(404, "Not found")
+            return
+        fmt = query.pop("format", ["json"])[0]
+        if fmt not in ("json", "arrow"):
+            self._send_error(400, f"Unknown format: {fmt}")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BATCH_BODY_BYTES:
+            self._send_error(413, "Body too large")
+            return
+        body = self.rfile.read(length)
+
+        try:
+            frame, metadata = self.service.comparables_batch(
+                query, body, self.headers.get("Content-Type", "")
+            )
+        except QueryError as e:
+            self._send_error(400, str(e))
+            return
+        except LookupError as e:
+            self._send_error(503, str(e))
+            return
+        except Exception as e:
+            print(f"Error answering POST {self.path}: {e}")
+            traceback.print_exc()
+            self._send_error(500, "Query failed")
+            return
+        self._send(200, *encode(frame, metadata, fmt))
+
+    def _send_export(self, query):
+        try:
+            job = self.service.export(query)
+        except QueryError as e:
+            self._send_error(400, str(e))
+            return
+        except LookupError as e:
+            self._send_error(404 if "job" in query else 503, str(e))
+            return
+        except Exception as e:
+            print(f"Error answering {self.path}: {e}")
+            traceback.print_exc()
+            self._send_error(500, "Export failed")
+            return
+
+        if job.status == "failed":
+            self._send_error(500, f"Export failed: {job.error}")
+            return
+        if job.status != "done":
+            status = dict(job.to_dict(), download_url=f"/export?job={job.id}")
+            self._send(202, json.dumps(status).encode(), "application/json")
+            return
+        try:
+            f = open(job.path, "rb")
+        except OSError:
+            # Removed by cleanup between the status check and the download
+            self._send_error(404, f"Export file expired: {job.id}")
+            return
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", job.content_type)
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header(
+                "Content-Disposition", f'attachment; filename="{job.file_name}"'
+            )
+            self.end_headers()
+            # Streamed from disk, never held in memory whole
+            shutil.copyfileobj(f, self.wfile, EXPORT_COPY_BUFFER_BYTES)
+
+    def _send_error(self, status, message):
+        self._send(status, json.dumps({"error": message}).encode(), "application/json")
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("Cache-Control", "private, max-age=300")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Bulk consumers issue many small queries
+
+
+class QueryHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connection bursts from parallel clients
+    request_queue_size = 128
+
+
+def make_query_server(resource, host=DEFAULT_HOST, port=DEFAULT_PORT, exports=None):
+    """Create a threaded HTTP server answering queries from resource."""
+    handler = type(
+        "BoundQueryRequestHandler",
+        (QueryRequestHandler,),
+        {"service": QueryService(resource, exports)},
+    )
+    return QueryHTTPServer((host, port), handler)
+
+
+def start_query_server(resource, host=DEFAULT_HOST, port=DEFAULT_PORT, exports=None):
+    """Start the query server in a daemon thread and return the server object."""
+    server = make_query_server(resource, host, port, exports)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Query server listening on http://{host}:{port}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "files", nargs="*", help="Parquet files to serve (default: data/*.parquet)"
+    )
+    args = parser.parse_args()
+
+    resource = DataResource(functools.partial(load_processor, args.files or None))
+    if resource.get() is None:
+        print("No data loaded, query server not started.")
+        return
+
+    server = make_query_server(resource, args.host, args.port)
+    print(f"Query server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nQuery server stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Local HTTP endpoint serving vector tiles for transactions and communes.
+
+Tiles are served as /<layer>/<z>/<x>/<y>.pbf where layer is "transactions" or
+"communes". Transaction tiles accept repeated "type_local" and
+"code_departement" query parameters to match the sidebar filters. Servers
+started without data serve the datasets added with add_tile_dataset(),
+selected by a "dataset" query parameter.
+"""
+
+import argparse
+import re
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from analytics.vector_tiles import (
+    CommuneTileSource,
+    PointTileSource,
+    commune_tile_stats,
+)
+from data_processing import COMMUNES_GEOJSON_PATH, RealEstateData
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_ZOOM = 22
+MAX_TILE_DATASETS = 4
+
+TILE_PATH_PATTERN = re.compile(
+    r"^/(?P<layer>[a-z_]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.pbf$"
+)
+
+
+def make_tile_sources(data, geojson_path=COMMUNES_GEOJSON_PATH):
+    """Build the tile sources served by the tile server."""
+    sources = {"transactions": PointTileSource(data)}
+    try:
+        sources["communes"] = CommuneTileSource(geojson_path, commune_tile_stats(data))
+    except Exception as e:
+        print(f"Commune tiles disabled, could not load {geojson_path}: {e}")
+    return sources
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive between tile requests
+    sources = {}
+    datasets = None  # Dataset key -> sources, most recently added last
+    datasets_lock = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        match = TILE_PATH_PATTERN.match(url.path)
+        if not match:
+            self._send(404, b"Not found", "text/plain")
+            return
+
+        query = parse_qs(url.query)
+        dataset = query.get("dataset", [None])[0]
+        if dataset is None:
+            sources = self.sources
+        else:
+            with self.datasets_lock:
+                sources = self.datasets.get(dataset, {})
+        source = sources.get(match["layer"])
+        z, x, y = int(match["z"]), int(match["x"]), int(match["y"])
+        if source is None or z > MAX_ZOOM or x >= (1 << z) or y >= (1 << z):
+            self._send(404, b"Not found", "text/plain")
+            return
+
+        try:
+            if isinstance(source, PointTileSource):
+                tile = source.tile(
+                    z,
+                    x,
+                    y,
+                    types=tuple(sorted(query.get("type_local", []))) or None,
+                    departments=tuple(sorted(query.get("code_departement", [])))
+                    or None,
+                )
+            else:
+                tile = source.tile(z, x, y)
+        except Exception as e:
+            print(f"Error rendering tile {self.path}: {e}")
+            traceback.print_exc()
+            self._send(500, b"Tile rendering failed", "text/plain")
+            return
+
+        self._send(200, tile, "application/x-protobuf")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if status == 200:
+            # Misses and failures are not cached: the dataset may be added soon
+            self.send_header("Cache-Control", "public, max-age=3600")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Tile requests are far too frequent to log
+
+
+def make_tile_server(data=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Create a threaded HTTP server bound to tile sources built from data."""
+    handler = type(
+        "BoundTileRequestHandler",
+        (TileRequestHandler,),
+        {
+            "sources": make_tile_sources(data) if data is not None else {},
+            "datasets": OrderedDict(),
+            "datasets_lock": threading.Lock(),
+        },
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_tile_server(data=None, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Start the tile server in a daemon thread and return the server object."""
+    server = make_tile_server(data, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Tile server listening on http://{host}:{port}")
+    return server
+
+
+def add_tile_dataset(server, key, data):
+    """
+    Serve tiles of data to requests with "dataset=key".
+
+    Sources are built once per key; only the MAX_TILE_DATASETS most
+    recently added keys are kept.
+    """
+    handler = server.RequestHandlerClass
+    with handler.datasets_lock:
+        if key in handler.datasets:
+            handler.datasets.move_to_end(key)
+            return
+    sources = make_tile_sources(data)
+    with handler.datasets_lock:
+        handler.datasets[key] = sources
+        while len(handler.datasets) > MAX_TILE_DATASETS:
+            handler.datasets.popitem(last=False)
+
+
+def tile_url_template(layer, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """URL template of a tile layer, as expected by Leaflet and MapLibre."""
+    return f"http://{host}:{port}/{layer}/{{z}}/{{x}}/{{y}}.pbf"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "files", nargs="*", help="Parquet files to serve (default: data/*.parquet)"
+    )
+    args = parser.parse_args()
+
+    data_processor = RealEstateData(args.files or None)
+    data = data_processor.load_data()
+    if data is None or data.is_empty():
+        print("No data loaded, tile server not started.")
+        return
+
+    # Flagged price outliers are left out, as in the app's default view
+    server = make_tile_server(data_processor.market_data(), args.host, args.port)
+    print(f"Tile server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nTile server stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,31 @@ import plotly.express as px
 import polars as pl
 import streamlit as st
 
-
-def display_demographics_page(data_processor, filtered_data):
+from analytics.breakdowns import TransactionBreakdowns
+
+
+def transaction_breakdowns(
+    data_processor,
+    filtered_data,
+    selected_departments=None,
+    selected_types=None,
+    include_outliers=False,
+):
+    """Breakdowns for the filter state, computed from filtered_data as a fallback."""
+    engine = data_processor.get_transaction_breakdowns()
+    if engine is None:
+        engine = TransactionBreakdowns(filtered_data)
+        include_outliers = True  # filtered_data is already filtered
+    return engine.get(selected_departments, selected_types, include_outliers)
+
+
+def display_demographics_page(
+    data_processor,
+    filtered_data,
+    selected_departments=None,
+    selected_types=None,
+    include_outliers=False,
+):
     st.markdown(
         '<div class="section-header">Données Démographiques (basées sur les transactions)</div>',
         unsafe_allow_html=True,
@@ -16,17 +39,23 @@ def display_demographics_page(data_processor, filtered_data):
         "Cette section analyse la distribution des types de biens et leur popularité par commune, offrant un aperçu démographique indirect."
     )
 
+    # Every breakdown below comes from one cached computation per filter state
+    breakdowns = transaction_breakdowns(
+        data_processor,
+        filtered_data,
+        selected_departments,
+        selected_types,
+        include_outliers,
+    )
+
     # Distribution of property types
     st.markdown(
         '<div class="sub-header">Distribution des types de biens</div>',
         unsafe_allow_html=True,
     )
-    property_type_dist_polars = (
-        filtered_data.group_by("type_local")
-        .agg(pl.count().alias("count"))
-        .sort("count", descending=True)
+    property_type_dist_pd = data_processor.convert_to_pandas(
+        breakdowns["type_distribution"]
     )
-    property_type_dist_pd = data_processor.convert_to_pandas(property_type_dist_polars)
 
     if not property_type_dist_pd.empty:
         fig_type_dist = px.pie(
@@ -59,18 +88,9 @@ def display_demographics_page(data_processor, filtered_data):
         )
         return
 
-    popular_types_by_commune_polars = (
-        filtered_data.group_by(["nom_commune", "type_local"])
-        .agg(pl.count().alias("transaction_count"))
-        .sort(["nom_commune", "transaction_count"], descending=[False, True])
-        .group_by(
-            "nom_commune", maintain_order=True
-        )  # maintain_order=True to keep the sort from previous step
-        .head(3)  # Top 3 types per commune
-    )
-
+    top_types_by_commune = breakdowns["top_types_by_commune"]
     popular_types_by_commune_pd = data_processor.convert_to_pandas(
-        popular_types_by_commune_polars
+        top_types_by_commune.drop("rank")
     )
 
     if not popular_types_by_commune_pd.empty:
@@ -90,15 +110,8 @@ def display_demographics_page(data_processor, filtered_data):
         # This is already covered by the pie chart above, so let's focus on the per-commune aspect.
 
         # Let's try a more focused bar chart: Number of transactions for top type in each commune
-        top_type_per_commune_polars = (
-            filtered_data.group_by(["nom_commune", "type_local"])
-            .agg(pl.count().alias("transaction_count"))
-            .sort("transaction_count", descending=True)
-            .group_by("nom_commune", maintain_order=True)
-            .head(1)  # Top 1 type per commune
-        )
         top_type_per_commune_pd = data_processor.convert_to_pandas(
-            top_type_per_commune_polars
+            top_types_by_commune.filter(pl.col("rank") == 1).drop("rank")
         )
 
         if not top_type_per_commune_pd.empty:
@@ -0,0 +1,74 @@
+import plotly.express as px
+import plotly.graph_objects as go
+
+
+def summary_box_figure(summary, category, title, labels, category_order=None):
+    """
+    Box plot drawn from precomputed summaries (see analytics.distributions).
+
+    Each box only ships its quartiles, whiskers and capped outlier list to
+    the browser instead of every transaction.
+    """
+    rows = summary.to_dicts()
+    if category_order is not None:
+        rank = {value: idx for idx, value in enumerate(category_order)}
+        rows.sort(key=lambda row: rank.get(row[category], len(rank)))
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for idx, row in enumerate(rows):
+        name = str(row[category])
+        color = colors[idx % len(colors)]
+        fig.add_trace(
+            go.Box(
+                name=name,
+                x=[name],
+                q1=[row["q1"]],
+                median=[row["median"]],
+                q3=[row["q3"]],
+                lowerfence=[row["lower_whisker"]],
+                upperfence=[row["upper_whisker"]],
+                mean=[row["mean"]],
+                marker_color=color,
+                boxpoints=False,
+                hoverinfo="y",
+            )
+        )
+        if row["outliers"]:
+            fig.add_trace(
+                go.Scatter(
+                    x=[name] * len(row["outliers"]),
+                    y=row["outliers"],
+                    mode="markers",
+                    marker=dict(color=color, size=5, opacity=0.6),
+                    name=name,
+                    showlegend=False,
+                    hovertemplate="%{y:,.0f} €/m²<extra></extra>",
+                )
+            )
+    fig.update_layout(
+        title=title,
+        xaxis_title=labels.get(category, category),
+        yaxis_title=labels.get("price_per_sqm", "price_per_sqm"),
+        showlegend=False,
+    )
+    return fig
+
+
+def histogram_bar_figure(histogram, title, labels, color=None):
+    """Bar chart of precomputed fixed-width bin counts (bin_start, bin_end, count)."""
+    plot_data = histogram.with_columns(
+        ((histogram["bin_start"] + histogram["bin_end"]) / 2).alias("bin_center")
+    ).to_pandas()
+    fig = px.bar(
+        plot_data,
+        x="bin_center",
+        y="count",
+        color=color,
+        title=title,
+        labels=labels,
+        barmode="overlay" if color else "relative",
+        opacity=0.7 if color else 1.0,
+    )
+    bin_width = float((histogram["bin_end"] - histogram["bin_start"]).max())
+    fig.update_traces(width=bin_width)
+    return fig
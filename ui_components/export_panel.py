@@ -0,0 +1,95 @@
+import streamlit as st
+
+from exports import EXPORT_DATASETS
+
+DATASET_LABELS = {
+    "transactions": "Transactions filtrées",
+    "communes": "Statistiques par commune",
+    "monthly": "Statistiques mensuelles",
+}
+FORMAT_LABELS = {"csv": "CSV", "parquet": "Parquet", "geojson": "GeoJSON"}
+# Larger files are not read into the session: they download from the query server
+MAX_DOWNLOAD_BUTTON_BYTES = 100 * 2**20
+
+
+@st.fragment
+def display_export_panel(
+    resource,
+    exports,
+    selected_departments,
+    selected_types,
+    include_outliers,
+    download_base_url=None,
+):
+    """
+    Export of the current filter state, rerun on its own as a fragment.
+
+    Exports the current data of resource (the DataResource of the loaded
+    departments). Must be called inside a "with st.sidebar:" block. Small
+    extracts are written before the rerun ends; large ones in the
+    background, with a button to refresh their status.
+    """
+    with st.expander("Exporter les données"):
+        dataset = st.selectbox(
+            "Données",
+            list(EXPORT_DATASETS),
+            format_func=DATASET_LABELS.get,
+            key="export_dataset",
+        )
+        fmt = st.selectbox(
+            "Format",
+            EXPORT_DATASETS[dataset],
+            format_func=FORMAT_LABELS.get,
+            key="export_format",
+        )
+
+        if st.button("Préparer l'export", key="export_prepare"):
+            try:
+                job = exports.submit(
+                    resource,
+                    dataset,
+                    fmt,
+                    selected_departments,
+                    selected_types,
+                    include_outliers,
+                )
+            except Exception as e:
+                print(f"Error preparing export: {e}")
+                st.error(f"L'export n'a pas pu être préparé : {e}")
+                return
+            st.session_state["export_job_id"] = job.id
+
+        job = exports.get(st.session_state.get("export_job_id"))
+        if job is None:
+            return
+        if job.status == "failed":
+            st.error(f"L'export a échoué : {job.error}")
+            return
+        if job.status != "done":
+            st.info(
+                "Export en cours…"
+                if job.rows is None
+                else f"Export de {job.rows:,} lignes en cours…"
+            )
+            st.button("Actualiser", key="export_refresh")
+            return
+
+        st.caption(
+            f"{DATASET_LABELS[job.dataset]} ({FORMAT_LABELS[job.format]}) : "
+            f"{job.rows:,} lignes, {job.size_bytes / 2**20:.1f} Mo"
+        )
+        if job.size_bytes > MAX_DOWNLOAD_BUTTON_BYTES and download_base_url:
+            st.link_button("Télécharger", f"{download_base_url}/export?job={job.id}")
+            return
+        try:
+            with open(job.path, "rb") as f:
+                st.download_button(
+                    "Télécharger",
+                    data=f,
+                    file_name=job.file_name,
+                    mime=job.content_type,
+                    key="export_download",
+                    on_click="ignore",
+                )
+        except OSError:
+            st.warning("Le fichier d'export a expiré, préparez-le à nouveau.")
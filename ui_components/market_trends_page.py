@@ -5,8 +5,81 @@ import plotly.graph_objects as go
 import polars as pl
 import streamlit as st
 
+from analytics.price_index import ALL_TYPES
+from analytics.query_plan import AnalysisPlan
+from ui_components.distribution_charts import (
+    histogram_bar_figure,
+    summary_box_figure,
+)
 
-def display_market_trends_page(data_processor, filtered_data):
+
+def market_trend_aggregations(
+    data_processor,
+    filtered_data,
+    selected_departments=None,
+    selected_types=None,
+    include_outliers=False,
+):
+    """
+    Monthly medians (overall and per type) and monthly volume per type.
+
+    Medians are read from the precomputed distribution store when
+    available; whatever must be aggregated from filtered_data runs as one
+    fused plan.
+    """
+    median_aggs = [
+        pl.median("price_per_sqm").alias("median_price_per_sqm"),
+        pl.len().alias("transaction_count"),
+    ]
+    plan = AnalysisPlan(filtered_data).aggregate(
+        "volume_by_type",
+        ["year", "month", "type_local"],
+        [pl.len().alias("transaction_count")],
+        sort=["year", "month", "type_local"],
+    )
+    store = data_processor.get_distribution_store()
+    if store is None:
+        plan.aggregate("monthly", ["year", "month"], median_aggs)
+        plan.aggregate("monthly_by_type", ["year", "month", "type_local"], median_aggs)
+    results = plan.collect()
+
+    if store is not None:
+        for name, by in (("monthly", []), ("monthly_by_type", ["type_local"])):
+            summary = store.summary(
+                ["year", "month"] + by,
+                selected_departments,
+                selected_types,
+                include_outliers,
+            )
+            if summary.is_empty():
+                results[name] = pl.DataFrame(
+                    schema={
+                        "year": pl.Int32,
+                        "month": pl.Int32,
+                        **{col: pl.String for col in by},
+                        "median_price_per_sqm": pl.Float64,
+                        "transaction_count": pl.Int64,
+                    }
+                )
+                continue
+            results[name] = summary.select(
+                ["year", "month"]
+                + by
+                + [
+                    pl.col("median").alias("median_price_per_sqm"),
+                    pl.col("count").alias("transaction_count"),
+                ]
+            )
+    return results
+
+
+def display_market_trends_page(
+    data_processor,
+    filtered_data,
+    selected_departments=None,
+    selected_types=None,
+    include_outliers=False,
+):
     st.markdown(
         '<div class="section-header">Tendances du Marché Immobilier</div>',
         unsafe_allow_html=True,
@@ -15,23 +88,15 @@ def display_market_trends_page(data_processor, filtered_data):
         st.warning("Aucune donnée à afficher avec les filtres actuels.")
         return
 
-    # Get market trends data using filtered_data
+    aggregations = market_trend_aggregations(
+        data_processor,
+        filtered_data,
+        selected_departments,
+        selected_types,
+        include_outliers,
+    )
     trends_polars = (
-        filtered_data.with_columns(
-            [
-                pl.col("date_mutation").dt.year().alias("year"),
-                pl.col("date_mutation").dt.month().alias("month"),
-            ]
-        )
-        .group_by(["year", "month"])
-        .agg(
-            [
-                pl.median("price_per_sqm").alias("median_price_per_sqm"),
-                pl.count().alias(
-                    "transaction_count"
-                ),  # Use pl.count() for transaction_count
-            ]
-        )
+        aggregations["monthly"]
         .filter(
             pl.col("median_price_per_sqm").is_not_null()
             & (pl.col("transaction_count") > 0)
@@ -94,19 +159,8 @@ def display_market_trends_page(data_processor, filtered_data):
         '<div class="sub-header">Volume de transactions par type de bien</div>',
         unsafe_allow_html=True,
     )
-    volume_by_type_polars = (
-        filtered_data.with_columns(
-            [
-                pl.col("date_mutation").dt.year().alias("year"),
-                pl.col("date_mutation").dt.month().alias("month"),
-            ]
-        )
-        .group_by(["year", "month", "type_local"])
-        .agg(
-            pl.count().alias("transaction_count")  # Corrected aggregation
-        )
-        .filter(pl.col("transaction_count") > 0)  # Ensure there are transactions
-        .sort(["year", "month", "type_local"])
+    volume_by_type_polars = aggregations["volume_by_type"].filter(
+        pl.col("transaction_count") > 0
     )
 
     if volume_by_type_polars.is_empty():
@@ -144,19 +198,7 @@ def display_market_trends_page(data_processor, filtered_data):
         unsafe_allow_html=True,
     )
     type_trends_polars = (
-        filtered_data.with_columns(
-            [
-                pl.col("date_mutation").dt.year().alias("year"),
-                pl.col("date_mutation").dt.month().alias("month"),
-            ]
-        )
-        .group_by(["year", "month", "type_local"])
-        .agg(
-            [
-                pl.median("price_per_sqm").alias("median_price_per_sqm"),
-                pl.count().alias("transaction_count"),  # Use pl.count()
-            ]
-        )
+        aggregations["monthly_by_type"]
         .filter(
             (pl.col("transaction_count") >= 5)  # Added parentheses here
             & pl.col("median_price_per_sqm").is_not_null()
@@ -192,3 +234,533 @@ def display_market_trends_page(data_processor, filtered_data):
             st.warning(
                 "Conversion des données de tendance par type en Pandas a échoué ou est vide."
             )
+
+    display_price_distributions(
+        data_processor, selected_departments, selected_types, include_outliers
+    )
+    display_price_indices(data_processor, selected_departments, selected_types)
+    display_rolling_stats(data_processor, selected_departments, selected_types)
+    display_commune_movers(data_processor, selected_departments, selected_types)
+    display_seasonality(data_processor, selected_departments, selected_types)
+    display_resale_activity(data_processor, selected_departments, selected_types)
+
+
+def display_price_distributions(
+    data_processor, selected_departments, selected_types, include_outliers=False
+):
+    st.markdown(
+        '<div class="sub-header">Distribution des prix au m²</div>',
+        unsafe_allow_html=True,
+    )
+    store = data_processor.get_distribution_store()
+    if store is None:
+        st.info("Distributions de prix indisponibles.")
+        return
+    summary = store.summary(
+        ["type_local"], selected_departments, selected_types, include_outliers
+    )
+    if summary.is_empty():
+        st.info("Pas de données pour les distributions de prix.")
+        return
+
+    labels = {
+        "price_per_sqm": "Prix au m² (€)",
+        "type_local": "Type de bien",
+        "bin_center": "Prix au m² (€)",
+        "count": "Nombre de transactions",
+    }
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(
+            summary_box_figure(
+                summary,
+                "type_local",
+                title="Prix au m² par type de bien",
+                labels=labels,
+            ),
+            use_container_width=True,
+        )
+    with col2:
+        # The long upper tail is cut at the highest whisker
+        histogram = store.histogram(
+            ["type_local"], selected_departments, selected_types, include_outliers
+        ).filter(pl.col("bin_start") <= summary["upper_whisker"].max())
+        st.plotly_chart(
+            histogram_bar_figure(
+                histogram,
+                title="Histogramme des prix au m²",
+                labels=labels,
+                color="type_local",
+            ),
+            use_container_width=True,
+        )
+
+
+def display_price_indices(data_processor, selected_departments, selected_types):
+    st.markdown(
+        '<div class="sub-header">Indices de prix ajustés de la qualité</div>',
+        unsafe_allow_html=True,
+    )
+    st.caption(
+        "Indice hédonique (corrigé de la surface, du nombre de pièces et du type) "
+        "et indice de ventes répétées (mêmes biens revendus), base 100 au premier mois."
+    )
+    engine = data_processor.get_price_index_engine()
+    if engine is None:
+        st.warning("Les indices de prix n'ont pas pu être calculés.")
+        return
+
+    indices_polars = engine.get_indices(
+        level="department",
+        codes=selected_departments,
+        types=(selected_types or []) + [ALL_TYPES],
+    )
+    if indices_polars.is_empty():
+        st.warning("Pas assez de données pour calculer les indices de prix.")
+        return
+
+    indices_pd = data_processor.convert_to_pandas(
+        indices_polars.unpivot(
+            index=["code", "type_local", "year", "month"],
+            on=["hedonic_index", "repeat_sales_index"],
+            variable_name="method",
+            value_name="index_value",
+        ).with_columns(
+            [
+                pl.col("method").replace(
+                    {
+                        "hedonic_index": "Hédonique",
+                        "repeat_sales_index": "Ventes répétées",
+                    }
+                ),
+                pl.format("{} - {}", "code", "type_local").alias("series"),
+            ]
+        )
+    )
+    indices_pd["date"] = pd.to_datetime(indices_pd[["year", "month"]].assign(day=1))
+    fig_indices = px.line(
+        indices_pd.sort_values("date"),
+        x="date",
+        y="index_value",
+        color="series",
+        line_dash="method",
+        title="Indices de prix par département et type de bien (base 100)",
+        labels={
+            "index_value": "Indice",
+            "date": "Date",
+            "series": "Département - Type",
+            "method": "Méthode",
+        },
+    )
+    st.plotly_chart(fig_indices, use_container_width=True)
+
+
+@st.fragment
+def display_rolling_stats(data_processor, selected_departments, selected_types):
+    st.markdown(
+        '<div class="sub-header">Indicateurs glissants sur 12 mois par commune</div>',
+        unsafe_allow_html=True,
+    )
+    engine = data_processor.get_rolling_stats_engine()
+    if engine is None:
+        st.warning("Les indicateurs glissants n'ont pas pu être calculés.")
+        return
+
+    type_options = [ALL_TYPES] + (selected_types or [])
+    type_choice = st.selectbox(
+        "Type de bien", options=type_options, key="rolling_stats_type"
+    )
+    rolling = engine.get(departments=selected_departments, types=[type_choice])
+    if rolling.is_empty():
+        st.warning("Pas de données pour les indicateurs glissants.")
+        return
+
+    latest_month = rolling["month_id"].max()
+    latest = rolling.filter(pl.col("month_id") == latest_month).sort(
+        "rolling_count", descending=True
+    )
+    commune_labels = dict(
+        zip(
+            latest["code_commune"].to_list(),
+            latest.select(pl.format("{} ({})", "nom_commune", "code_commune"))
+            .to_series()
+            .to_list(),
+        )
+    )
+    selected_communes = st.multiselect(
+        "Communes",
+        options=list(commune_labels),
+        default=list(commune_labels)[:5],
+        format_func=commune_labels.get,
+        key="rolling_stats_communes",
+    )
+    if not selected_communes:
+        st.info("Sélectionnez au moins une commune.")
+        return
+
+    rolling_pd = data_processor.convert_to_pandas(
+        rolling.filter(pl.col("code_commune").is_in(selected_communes))
+    )
+    rolling_pd["date"] = pd.to_datetime(rolling_pd[["year", "month"]].assign(day=1))
+    fig_rolling = px.line(
+        rolling_pd.sort_values("date"),
+        x="date",
+        y="rolling_median_price_per_sqm",
+        color="nom_commune",
+        hover_data=["rolling_count", "rolling_mean_price_per_sqm"],
+        title="Prix médian au m² glissant sur 12 mois",
+        labels={
+            "rolling_median_price_per_sqm": "Prix médian/m² (12 mois)",
+            "rolling_mean_price_per_sqm": "Prix moyen/m² (12 mois)",
+            "rolling_count": "Transactions (12 mois)",
+            "nom_commune": "Commune",
+            "date": "Date",
+        },
+    )
+    st.plotly_chart(fig_rolling, use_container_width=True)
+
+    latest_pd = data_processor.convert_to_pandas(
+        latest.select(
+            [
+                "nom_commune",
+                "code_commune",
+                "rolling_count",
+                "rolling_median_price_per_sqm",
+                "rolling_mean_price_per_sqm",
+                (pl.col("yoy_median_change") * 100).round(1),
+                (pl.col("yoy_count_change") * 100).round(1),
+            ]
+        )
+    )
+    latest_pd.columns = [
+        "Commune",
+        "Code commune",
+        "Transactions (12 mois)",
+        "Prix médian/m²",
+        "Prix moyen/m²",
+        "Évolution annuelle du prix médian (%)",
+        "Évolution annuelle du volume (%)",
+    ]
+    st.dataframe(
+        latest_pd.round({"Prix médian/m²": 0, "Prix moyen/m²": 0}),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+@st.fragment
+def display_commune_movers(data_processor, selected_departments, selected_types):
+    st.markdown(
+        '<div class="sub-header">Communes en plus forte hausse / baisse</div>',
+        unsafe_allow_html=True,
+    )
+    st.caption(
+        "Tendance log-linéaire du prix moyen au m² sur la période, pondérée par le "
+        "nombre de ventes mensuelles, avec intervalle de confiance à 95 %. "
+        "L'accélération est la variation annuelle de ce rythme (ajustement quadratique)."
+    )
+    engine = data_processor.get_trend_engine()
+    if engine is None:
+        st.warning("Les tendances par commune n'ont pas pu être calculées.")
+        return
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        type_choice = st.selectbox(
+            "Type de bien",
+            options=[ALL_TYPES] + (selected_types or []),
+            key="movers_type",
+        )
+    with col2:
+        window_years = st.select_slider(
+            "Période (années)", options=[1, 2, 3, 4], value=3, key="movers_window"
+        )
+    with col3:
+        significant_only = st.checkbox(
+            "Tendances significatives uniquement", key="movers_significant"
+        )
+
+    rising, falling = engine.movers(
+        departments=selected_departments,
+        types=[type_choice],
+        n=10,
+        significant_only=significant_only,
+        window_months=window_years * 12,
+    )
+    if rising.is_empty() and falling.is_empty():
+        st.warning("Pas assez de ventes pour estimer des tendances par commune.")
+        return
+
+    columns = {
+        "nom_commune": "Commune",
+        "sales": "Ventes",
+        "annual_change": "Évolution annuelle (%)",
+        "annual_change_low": "IC bas (%)",
+        "annual_change_high": "IC haut (%)",
+        "acceleration": "Accélération (pts/an)",
+        "trend_price_per_sqm": "Prix tendanciel/m²",
+    }
+
+    def movers_table(movers):
+        return data_processor.convert_to_pandas(
+            movers.select(
+                [
+                    "nom_commune",
+                    "sales",
+                    (
+                        pl.col(
+                            [
+                                "annual_change",
+                                "annual_change_low",
+                                "annual_change_high",
+                                "acceleration",
+                            ]
+                        )
+                        * 100
+                    ).round(1),
+                    pl.col("trend_price_per_sqm").round(0),
+                ]
+            ).rename(columns)
+        )
+
+    col_rising, col_falling = st.columns(2)
+    with col_rising:
+        st.markdown("**Plus fortes hausses**")
+        st.dataframe(movers_table(rising), use_container_width=True, hide_index=True)
+    with col_falling:
+        st.markdown("**Plus fortes baisses**")
+        st.dataframe(movers_table(falling), use_container_width=True, hide_index=True)
+
+    movers_pd = data_processor.convert_to_pandas(
+        pl.concat([rising, falling])
+        .sort("annual_change")
+        .with_columns(
+            [
+                (pl.col("annual_change") * 100).alias("change_pct"),
+                ((pl.col("annual_change_high") - pl.col("annual_change")) * 100).alias(
+                    "error_plus"
+                ),
+                ((pl.col("annual_change") - pl.col("annual_change_low")) * 100).alias(
+                    "error_minus"
+                ),
+            ]
+        )
+    )
+    fig_movers = px.bar(
+        movers_pd,
+        x="change_pct",
+        y="nom_commune",
+        orientation="h",
+        error_x="error_plus",
+        error_x_minus="error_minus",
+        color="change_pct",
+        color_continuous_scale="RdYlGn",
+        color_continuous_midpoint=0,
+        title="Évolution annuelle tendancielle du prix au m²",
+        labels={"change_pct": "Évolution annuelle (%)", "nom_commune": "Commune"},
+    )
+    st.plotly_chart(fig_movers, use_container_width=True)
+
+
+@st.fragment
+def display_seasonality(data_processor, selected_departments, selected_types):
+    st.markdown(
+        '<div class="sub-header">Saisonnalité et prévisions</div>',
+        unsafe_allow_html=True,
+    )
+    st.caption(
+        "Décomposition tendance / saisonnalité (moyenne mobile centrée sur 12 mois) "
+        "et prévision à court terme avec intervalle à 95 %."
+    )
+    engine = data_processor.get_seasonality_engine()
+    if engine is None:
+        st.warning("La décomposition saisonnière n'a pas pu être calculée.")
+        return
+
+    decomposition, _ = engine.get(
+        departments=selected_departments, types=[ALL_TYPES], series=["volume"]
+    )
+    if decomposition.is_empty():
+        st.warning("Pas assez de ventes pour analyser la saisonnalité.")
+        return
+    zones = (
+        decomposition.group_by(["code_commune", "nom_commune"])
+        .agg(pl.sum("observed").alias("sales"))
+        .sort(
+            [pl.col("code_commune").is_not_null(), "sales"],
+            descending=[False, True],
+        )
+    )
+    zone_labels = dict(zip(zones["code_commune"].to_list(), zones["nom_commune"]))
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        zone = st.selectbox(
+            "Zone",
+            options=list(zone_labels),
+            format_func=zone_labels.get,
+            key="seasonality_zone",
+        )
+    with col2:
+        type_choice = st.selectbox(
+            "Type de bien",
+            options=[ALL_TYPES] + (selected_types or []),
+            key="seasonality_type",
+        )
+    with col3:
+        series_label = st.radio(
+            "Série",
+            ["Prix au m²", "Volume"],
+            horizontal=True,
+            key="seasonality_series",
+        )
+    series = "price" if series_label == "Prix au m²" else "volume"
+
+    decomposition, forecast = engine.get(
+        departments=selected_departments,
+        communes=[zone],
+        types=[type_choice],
+        series=[series],
+    )
+    if decomposition.is_empty():
+        st.info("Pas assez de ventes pour cette zone et ce type de bien.")
+        return
+    if series == "price":
+        # Back from log prices; seasonal effects become percentages
+        decomposition = decomposition.with_columns(
+            [
+                pl.col("observed").exp(),
+                pl.col("trend").exp(),
+                (pl.col("seasonal").exp() - 1) * 100,
+            ]
+        )
+
+    decomposition_pd = data_processor.convert_to_pandas(decomposition)
+    forecast_pd = data_processor.convert_to_pandas(forecast)
+    for frame in (decomposition_pd, forecast_pd):
+        frame["date"] = pd.to_datetime(frame[["year", "month"]].assign(day=1))
+
+    value_label = "Prix moyen/m²" if series == "price" else "Transactions"
+    fig_forecast = go.Figure()
+    fig_forecast.add_trace(
+        go.Scatter(
+            x=decomposition_pd["date"],
+            y=decomposition_pd["observed"],
+            mode="lines+markers",
+            name="Observé",
+        )
+    )
+    fig_forecast.add_trace(
+        go.Scatter(
+            x=decomposition_pd["date"],
+            y=decomposition_pd["trend"],
+            mode="lines",
+            name="Tendance",
+            line=dict(dash="dash"),
+        )
+    )
+    fig_forecast.add_trace(
+        go.Scatter(
+            x=pd.concat([forecast_pd["date"], forecast_pd["date"][::-1]]),
+            y=pd.concat([forecast_pd["upper"], forecast_pd["lower"][::-1]]),
+            fill="toself",
+            fillcolor="rgba(255, 152, 0, 0.2)",
+            line=dict(color="rgba(255, 152, 0, 0)"),
+            name="Intervalle à 95 %",
+        )
+    )
+    fig_forecast.add_trace(
+        go.Scatter(
+            x=forecast_pd["date"],
+            y=forecast_pd["forecast"],
+            mode="lines+markers",
+            name="Prévision",
+            line=dict(color="#FF9800"),
+        )
+    )
+    fig_forecast.update_layout(
+        title=f"{value_label} : historique, tendance et prévision",
+        xaxis_title="Date",
+        yaxis_title=value_label,
+    )
+    st.plotly_chart(fig_forecast, use_container_width=True)
+
+    seasonal_profile = (
+        decomposition_pd.groupby("month")["seasonal"].first().reset_index()
+    )
+    fig_seasonal = px.bar(
+        seasonal_profile,
+        x="month",
+        y="seasonal",
+        title="Effet saisonnier par mois",
+        labels={
+            "month": "Mois",
+            "seasonal": "Effet saisonnier (%)"
+            if series == "price"
+            else "Effet saisonnier (transactions)",
+        },
+    )
+    st.plotly_chart(fig_seasonal, use_container_width=True)
+
+
+def display_resale_activity(data_processor, selected_departments, selected_types):
+    st.markdown(
+        '<div class="sub-header">Reventes et rotation du parc par commune</div>',
+        unsafe_allow_html=True,
+    )
+    parcel_history = data_processor.get_parcel_history()
+    if parcel_history is None:
+        st.warning("L'historique des parcelles n'a pas pu être construit.")
+        return
+    turnover = parcel_history.turnover(
+        departments=selected_departments, types=selected_types
+    )
+    if turnover.is_empty() or turnover["resales"].sum() == 0:
+        st.info("Aucune revente identifiée avec les filtres actuels.")
+        return
+
+    resales = parcel_history.resales(selected_departments, selected_types)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Reventes identifiées", f"{resales.height:,}")
+    with col2:
+        st.metric(
+            "Durée de détention médiane",
+            f"{resales['holding_years'].median():.1f} ans",
+        )
+    with col3:
+        annualized_gain = resales["annualized_gain"].median()
+        st.metric(
+            "Plus-value annualisée médiane",
+            f"{annualized_gain:.1%}" if annualized_gain is not None else "N/A",
+        )
+
+    turnover_table = (
+        turnover.filter(pl.col("resales") >= 5)
+        .head(30)
+        .select(
+            [
+                pl.col("nom_commune").alias("Commune"),
+                pl.col("sales").alias("Ventes"),
+                pl.col("properties").alias("Biens"),
+                pl.col("resales").alias("Reventes"),
+                (pl.col("turnover_rate") * 100).round(2).alias("Rotation annuelle (%)"),
+                pl.col("median_holding_years")
+                .round(1)
+                .alias("Détention médiane (ans)"),
+                (pl.col("median_resale_gain") * 100)
+                .round(1)
+                .alias("Plus-value médiane (%)"),
+                (pl.col("median_annualized_gain") * 100)
+                .round(1)
+                .alias("Plus-value annualisée (%)"),
+            ]
+        )
+    )
+    if turnover_table.is_empty():
+        st.info(
+            "Aucune commune ne compte au moins 5 reventes avec les filtres actuels."
+        )
+        return
+    turnover_pd = data_processor.convert_to_pandas(turnover_table)
+    st.dataframe(turnover_pd, use_container_width=True, hide_index=True)
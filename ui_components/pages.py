@@ -0,0 +1,106 @@
+"""Page registry: each page module is imported on first navigation.
+
+Page modules pull in folium, plotly, pandas and NumPy; importing them only
+when a page is first displayed keeps them off the startup path. Run
+``python -m ui_components.pages`` for a cold-import profile of every page.
+"""
+
+import importlib
+import subprocess
+import sys
+import time
+
+# Page label -> (module, display function). Every display function takes
+# (data_processor, filtered_data, selected_departments, selected_types,
+# include_outliers).
+PAGES = {
+    "Prix au m²": ("ui_components.price_map_page", "display_price_map_page"),
+    "Tendances du marché": (
+        "ui_components.market_trends_page",
+        "display_market_trends_page",
+    ),
+    "Données démographiques": (
+        "ui_components.demographics_page",
+        "display_demographics_page",
+    ),
+    "Carte des biens": (
+        "ui_components.property_map_page",
+        "display_property_map_page",
+    ),
+}
+PAGE_NAMES = list(PAGES)
+
+# Page label -> {"module", "seconds", "new_modules"} for pages imported by
+# this process, in import order
+import_profile = {}
+
+
+def load_page(name):
+    """Display function of a page, importing its module on first use."""
+    module_name, function_name = PAGES[name]
+    if module_name in sys.modules:
+        # import_module waits if another thread (the warm-up) is mid-import
+        return getattr(importlib.import_module(module_name), function_name)
+    modules_before = len(sys.modules)
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    seconds = time.perf_counter() - start
+    import_profile[name] = {
+        "module": module_name,
+        "seconds": seconds,
+        "new_modules": len(sys.modules) - modules_before,
+    }
+    print(
+        f"Page '{name}' imported in {seconds:.2f} s "
+        f"({import_profile[name]['new_modules']} new modules)."
+    )
+    return getattr(module, function_name)
+
+
+def profile_cold_imports(base_modules=("streamlit", "data_resource")):
+    """
+    Cold import time of each page, measured in a fresh interpreter.
+
+    base_modules are imported first and timed separately, as app.py
+    imports them before any page. Returns a list of dicts (page, module,
+    base_seconds, page_seconds).
+    """
+    script = (
+        "import importlib, sys, time\n"
+        "start = time.perf_counter()\n"
+        "for name in sys.argv[2:]: importlib.import_module(name)\n"
+        "base = time.perf_counter() - start\n"
+        "start = time.perf_counter()\n"
+        "importlib.import_module(sys.argv[1])\n"
+        "print(base, time.perf_counter() - start)\n"
+    )
+    report = []
+    for name, (module_name, _) in PAGES.items():
+        output = subprocess.run(
+            [sys.executable, "-c", script, module_name, *base_modules],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        report.append(
+            {
+                "page": name,
+                "module": module_name,
+                "base_seconds": float(output[-2]),
+                "page_seconds": float(output[-1]),
+            }
+        )
+    return report
+
+
+def main():
+    report = profile_cold_imports()
+    print(f"{'Page':<25} {'Base (s)':>9} {'Page (s)':>9}")
+    for row in report:
+        print(
+            f"{row['page']:<25} {row['base_seconds']:>9.2f} {row['page_seconds']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
-import json  # For handling GeoJSON data
-import os  # For checking file existence
-
 import plotly.express as px
 import polars as pl
 import streamlit as st
 
+from analytics.price_grid import (
+    GRID_CELL_SIZES_M,
+    price_grid_geojson,
+    summarize_price_grid,
+)
+from analytics.query_plan import AnalysisPlan
+from data_processing import COMMUNES_GEOJSON_PATH
+
 
 def display_price_map_page(
-    data_processor, filtered_data, selected_departments, selected_types
+    data_processor,
+    filtered_data,
+    selected_departments,
+    selected_types,
+    include_outliers=False,
 ):
     st.markdown(
         '<div class="section-header">Carte des Prix au m² par Commune</div>',
@@ -33,43 +42,57 @@ def display_price_map_page(
         )
         return
 
-    geo_data_for_map_polars = filtered_data.filter(
+    located = (
         pl.col("latitude").is_not_null()
         & pl.col("longitude").is_not_null()
         & pl.col("code_commune").is_not_null()
     )
-
-    if geo_data_for_map_polars.is_empty():
-        st.warning(
-            "Aucune donnée géographique ou de code commune disponible pour la carte des prix avec les filtres actuels."
+    # Map center, commune medians and type medians share one scan
+    aggregations = (
+        AnalysisPlan(filtered_data)
+        .aggregate(
+            "center",
+            [],
+            [
+                pl.len().alias("located_count"),
+                pl.mean("latitude").alias("center_lat"),
+                pl.mean("longitude").alias("center_lon"),
+            ],
+            where=located,
         )
-        return
-
-    geo_data_pd = data_processor.convert_to_pandas(geo_data_for_map_polars)
-
-    if not geo_data_pd.empty:
-        center_lat = geo_data_pd["latitude"].mean()
-        center_lon = geo_data_pd["longitude"].mean()
-
-        # Aggregate data at commune level using 'code_commune'
-        commune_level_data = (
-            geo_data_pd.groupby("code_commune")
-            .agg(
-                nom_commune=(
-                    "nom_commune",
-                    "first",
-                ),  # Keep for bar chart and potential tooltips
-                price_per_sqm=("price_per_sqm", "median"),
-                transaction_count=(
-                    "id_mutation",
-                    "count",
-                ),
-            )
-            .reset_index()
+        .aggregate(
+            "communes",
+            ["code_commune"],
+            [
+                pl.first("nom_commune"),  # Keep for bar chart and potential tooltips
+                pl.median("price_per_sqm").alias("price_per_sqm"),
+                pl.count("id_mutation").alias("transaction_count"),
+            ],
+            where=located,
         )
-        commune_level_data = commune_level_data[
-            commune_level_data["transaction_count"] >= 5
-        ]  # Filter for communes with enough data
+        .aggregate(
+            "types",
+            ["type_local"],
+            [
+                pl.median("price_per_sqm").alias(
+                    "avg_price_per_sqm"
+                ),  # Using median for robustness
+                pl.len().alias("count"),
+            ],
+            sort="count",
+            descending=True,
+        )
+        .collect()
+    )
+    center = aggregations["center"].row(0, named=True)
+
+    if center["located_count"] > 0:
+        center_lat = center["center_lat"]
+        center_lon = center["center_lon"]
+
+        commune_level_data = data_processor.convert_to_pandas(
+            aggregations["communes"].filter(pl.col("transaction_count") >= 5)
+        )  # Filter for communes with enough data
 
         if commune_level_data.empty:
             st.warning(
@@ -77,19 +100,21 @@ def display_price_map_page(
             )
             return
 
-        # Path to your GeoJSON file
-        geojson_path = "resources/communes-occitanie.geojson"
-
-        if not os.path.exists(geojson_path):
-            st.error(f"Fichier GeoJSON introuvable: {geojson_path}")
-            return
-
-        try:
-            with open(geojson_path, "r", encoding="utf-8") as f:
-                geojson_data_dict = json.load(f)
-        except Exception as e:
-            st.error(f"Erreur lors du chargement du fichier GeoJSON: {e}")
+        # Only the boundaries of the displayed communes are sent to the browser
+        commune_features = data_processor.get_commune_features()
+        if commune_features is None:
+            st.error(
+                f"Fichier GeoJSON introuvable ou illisible: {COMMUNES_GEOJSON_PATH}"
+            )
             return
+        geojson_data_dict = {
+            "type": "FeatureCollection",
+            "features": [
+                commune_features[code]
+                for code in commune_level_data["code_commune"]
+                if code in commune_features
+            ],
+        }
 
         # MAP DISPLAY (Full Width)
         if not commune_level_data.empty:
@@ -134,6 +159,16 @@ def display_price_map_page(
         else:
             st.info("Pas de données à afficher sur la carte.")
 
+        # SUB-COMMUNE GRID HEATMAP (served from the precomputed price grid)
+        display_price_grid_heatmap(
+            data_processor,
+            selected_departments,
+            selected_types,
+            center_lat,
+            center_lon,
+            include_outliers,
+        )
+
         # HORIZONTAL BAR CHARTS SECTION
         charts_col1, charts_col2 = st.columns(2)
 
@@ -165,19 +200,8 @@ def display_price_map_page(
                     "Colonnes 'type_local' ou 'price_per_sqm' manquantes pour l'analyse par type de bien."
                 )
             else:
-                property_types_data_polars = (
-                    filtered_data.group_by("type_local")
-                    .agg(
-                        avg_price_per_sqm=pl.median(
-                            "price_per_sqm"
-                        ),  # Using median for robustness
-                        count=pl.count(),
-                    )
-                    .filter(
-                        pl.col("avg_price_per_sqm").is_not_null()
-                        & (pl.col("count") > 0)
-                    )
-                    .sort("count", descending=True)
+                property_types_data_polars = aggregations["types"].filter(
+                    pl.col("avg_price_per_sqm").is_not_null() & (pl.col("count") > 0)
                 )
 
                 if property_types_data_polars.is_empty():
@@ -213,5 +237,103 @@ def display_price_map_page(
                         )
     else:
         st.warning(
-            "Pas assez de données géolocalisées valides pour afficher la carte des prix avec les filtres actuels."
+            "Aucune donnée géographique ou de code commune disponible pour la carte des prix avec les filtres actuels."
+        )
+
+
+@st.fragment
+def display_price_grid_heatmap(
+    data_processor,
+    selected_departments,
+    selected_types,
+    center_lat,
+    center_lon,
+    include_outliers=False,
+):
+    st.markdown(
+        '<div class="sub-header">Carte de chaleur des prix au m² (grille)</div>',
+        unsafe_allow_html=True,
+    )
+    price_grid = data_processor.get_price_grid()
+    if price_grid is None or price_grid.is_empty():
+        st.info("Grille de prix indisponible.")
+        return
+
+    available_years = sorted(price_grid["year"].drop_nulls().unique().to_list())
+    grid_col1, grid_col2, grid_col3 = st.columns(3)
+    with grid_col1:
+        cell_size = st.select_slider(
+            "Taille des cellules",
+            options=GRID_CELL_SIZES_M,
+            value=1000,
+            format_func=lambda size: f"{size:,} m",
+            key="price_grid_cell_size",
         )
+    with grid_col2:
+        selected_years = st.multiselect(
+            "Années",
+            options=available_years,
+            default=available_years,
+            key="price_grid_years",
+        )
+    with grid_col3:
+        min_count = st.number_input(
+            "Transactions minimum par cellule",
+            min_value=1,
+            value=3,
+            step=1,
+            key="price_grid_min_count",
+        )
+
+    if not selected_years:
+        st.info("Sélectionnez au moins une année pour afficher la grille.")
+        return
+
+    cells = summarize_price_grid(
+        price_grid,
+        cell_size,
+        departments=selected_departments,
+        types=selected_types,
+        years=selected_years,
+        min_count=min_count,
+        include_outliers=include_outliers,
+    )
+    if cells.is_empty():
+        st.info("Pas assez de transactions par cellule pour afficher la grille.")
+        return
+
+    cells_pd = data_processor.convert_to_pandas(cells)
+    fig_grid = px.choropleth_mapbox(
+        cells_pd,
+        geojson=price_grid_geojson(cells, cell_size),
+        locations="cell_id",
+        color="median_price_per_sqm",
+        color_continuous_scale="RdYlGn_r",
+        range_color=(
+            cells_pd["p10_price_per_sqm"].min(),
+            cells_pd["p90_price_per_sqm"].max(),
+        ),
+        mapbox_style="carto-positron",
+        zoom=9,
+        center={"lat": center_lat, "lon": center_lon},
+        opacity=0.6,
+        hover_data={
+            "median_price_per_sqm": ":,.0f",
+            "p25_price_per_sqm": ":,.0f",
+            "p75_price_per_sqm": ":,.0f",
+            "transaction_count": True,
+            "cell_id": False,
+        },
+        labels={
+            "median_price_per_sqm": "Prix médian/m²",
+            "p25_price_per_sqm": "1er quartile/m²",
+            "p75_price_per_sqm": "3e quartile/m²",
+            "transaction_count": "Nb Transactions",
+        },
+    )
+    fig_grid.update_layout(
+        margin={"r": 0, "t": 30, "l": 0, "b": 0},
+        coloraxis_colorbar_title_text="Prix médian au m² (€/m²)",
+        height=700,
+    )
+    st.plotly_chart(fig_grid, use_container_width=True)
@@ -1,41 +1,151 @@
+import json
+import uuid
 from datetime import date, datetime  # Added date and datetime
+from urllib.parse import urlencode
 
 import folium
-import numpy as np
 import pandas as pd
 import plotly.express as px  # Add plotly express
+import polars as pl
 import streamlit as st
-from streamlit_folium import folium_static
-
-
-# Haversine function to calculate distance between two lat/lon points
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Radius of Earth in kilometers
+from folium.plugins import Draw, VectorGridProtobuf
+from streamlit_folium import folium_static, st_folium
+
+from analytics.distributions import summarize_distribution
+from analytics.spatial_query import (
+    geojson_polygons,
+    polygon_area_km2,
+    query_polygon,
+    query_postal_code,
+    query_radius,
+    query_rings,
+    summarize_selection,
+)
+from analytics.valuation import VALUATION_FLAGS
+from tile_server import add_tile_dataset, start_tile_server, tile_url_template
+from ui_components.distribution_charts import summary_box_figure
+from ui_components.sidebar import apply_filters
+
+# Styles the vector tile layers in the browser; clusters have no type_local
+VECTOR_TILE_OPTIONS = """{
+    "vectorTileLayerStyles": {
+        "transactions": function(properties, zoom) {
+            var colors = {
+                "Maison": "blue",
+                "Appartement": "green",
+                "Dépendance": "purple",
+                "Local industriel. commercial ou assimilé": "orange"
+            };
+            var count = properties.point_count || 1;
+            return {
+                radius: count > 1 ? Math.min(14, 3 + 2 * Math.log(count)) : 4,
+                fill: true,
+                fillColor: colors[properties.type_local] || "#555555",
+                fillOpacity: 0.7,
+                weight: 0
+            };
+        },
+        "communes": {weight: 1, color: "#616161", fill: false, opacity: 0.6}
+    },
+    "maxNativeZoom": 18
+}"""
+
+
+@st.cache_resource
+def get_tile_server():
+    """Start the local vector tile server once per process."""
+    try:
+        # Each department selection's data is added as a dataset on first view
+        return start_tile_server()
+    except OSError as e:
+        # The port is taken, most likely by a standalone tile_server.py
+        print(f"Tile server not started: {e}")
+        return None
+
+
+def display_property_map_page(
+    data_processor,
+    filtered_data_polars,
+    selected_departments=None,
+    selected_types=None,
+    include_outliers=False,
+):
+    st.markdown(
+        '<div class="section-header">Carte Interactive des Biens Immobiliers</div>',
+        unsafe_allow_html=True,
+    )
 
-    lat1_rad = np.radians(lat1)
-    lon1_rad = np.radians(lon1)
-    lat2_rad = np.radians(lat2)
-    lon2_rad = np.radians(lon2)
+    # Each section is a fragment: its widgets rerun only that section, with
+    # the arguments of the last full run
+    center_lat = filtered_data_polars["latitude"].mean()
+    center_lon = filtered_data_polars["longitude"].mean()
+    if center_lat is None or center_lon is None:
+        center_lat, center_lon = 46.2276, 2.2137  # Default center (France)
 
-    dlon = lon2_rad - lon1_rad
-    dlat = lat2_rad - lat1_rad
+    display_property_search(
+        data_processor, selected_departments, selected_types, include_outliers
+    )
 
-    a = (
-        np.sin(dlat / 2) ** 2
-        + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2
+    display_area_search(
+        data_processor,
+        (center_lat, center_lon),
+        selected_departments,
+        selected_types,
+        include_outliers,
     )
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
 
-    distance = R * c
-    return distance
+    display_vector_tile_map(
+        data_processor,
+        (center_lat, center_lon),
+        selected_departments,
+        selected_types,
+        include_outliers,
+    )
 
 
-def display_property_map_page(data_processor, filtered_data_polars):
-    st.markdown(
-        '<div class="section-header">Carte Interactive des Biens Immobiliers</div>',
-        unsafe_allow_html=True,
+def search_properties(
+    data_processor,
+    postal_code,
+    radius_km,
+    selected_departments,
+    selected_types,
+    include_outliers,
+):
+    """
+    Sales with a postal code, or within radius_km of its sales' centre.
+
+    Returns (postal code rows, result rows) as polars frames, both filtered
+    like the sidebar. Rows come from the postal code and spatial indexes,
+    so the cost follows the number of matches, not the dataset size.
+    """
+    data = data_processor.data
+    postal_code_rows = apply_filters(
+        query_postal_code(data, data_processor.get_postal_code_index(), postal_code),
+        selected_departments,
+        selected_types,
+        include_outliers,
+    )
+    if postal_code_rows.is_empty() or radius_km <= 0:
+        return postal_code_rows, postal_code_rows
+    radius_rows = apply_filters(
+        query_radius(
+            data,
+            data_processor.get_spatial_index(),
+            postal_code_rows["latitude"].mean(),
+            postal_code_rows["longitude"].mean(),
+            radius_km,
+        ),
+        selected_departments,
+        selected_types,
+        include_outliers,
     )
+    return postal_code_rows, radius_rows
+
 
+@st.fragment
+def display_property_search(
+    data_processor, selected_departments, selected_types, include_outliers
+):
     # Initialize session state for search parameters
     if "search_postal_code" not in st.session_state:
         st.session_state.search_postal_code = ""
@@ -54,60 +164,62 @@ def display_property_map_page(data_processor, filtered_data_polars):
     if "map_display_key" not in st.session_state:  # Used to force map re-render
         st.session_state.map_display_key = 0
 
-    # Search input fields
-    col1, col2, col3 = st.columns([2, 1, 1])
-    with col1:
-        # Use a temporary variable for text_input to manage updates correctly
-        current_postal_code = st.text_input(
-            "Code Postal:",
-            value=st.session_state.search_postal_code,
-            key="postal_code_input",
-        )
-    with col2:
-        current_radius_km = st.number_input(
-            "Rayon de recherche (km):",
-            min_value=0.0,
-            value=st.session_state.search_radius_km,
-            step=0.5,
-            key="radius_input",
-        )
-    with col3:
-        st.markdown("<br>", unsafe_allow_html=True)
-        search_button = st.button("Rechercher")
-
-    # Optional filters for price and surface area
-    st.markdown("##### Filtres optionnels")
-    filter_col1, filter_col2 = st.columns(2)
-    with filter_col1:
-        current_min_price = st.number_input(
-            "Prix minimum (€):",
-            min_value=0,
-            value=st.session_state.min_price,
-            step=10000,
-            key="min_price_input",
-        )
-        current_max_price = st.number_input(
-            "Prix maximum (€) (0 pour ignorer):",
-            min_value=0,
-            value=st.session_state.max_price,
-            step=10000,
-            key="max_price_input",
-        )
-    with filter_col2:
-        current_min_surface = st.number_input(
-            "Surface minimum (m²):",
-            min_value=0,
-            value=st.session_state.min_surface,
-            step=5,
-            key="min_surface_input",
-        )
-        current_max_surface = st.number_input(
-            "Surface maximum (m²) (0 pour ignorer):",
-            min_value=0,
-            value=st.session_state.max_surface,
-            step=5,
-            key="max_surface_input",
-        )
+    # The inputs are only read on "Rechercher": a form keeps typing from
+    # triggering reruns at all
+    with st.form("property_search_form", border=False):
+        # Search input fields
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            current_postal_code = st.text_input(
+                "Code Postal:",
+                value=st.session_state.search_postal_code,
+                key="postal_code_input",
+            )
+        with col2:
+            current_radius_km = st.number_input(
+                "Rayon de recherche (km):",
+                min_value=0.0,
+                value=st.session_state.search_radius_km,
+                step=0.5,
+                key="radius_input",
+            )
+        with col3:
+            st.markdown("<br>", unsafe_allow_html=True)
+            search_button = st.form_submit_button("Rechercher")
+
+        # Optional filters for price and surface area
+        st.markdown("##### Filtres optionnels")
+        filter_col1, filter_col2 = st.columns(2)
+        with filter_col1:
+            current_min_price = st.number_input(
+                "Prix minimum (€):",
+                min_value=0,
+                value=st.session_state.min_price,
+                step=10000,
+                key="min_price_input",
+            )
+            current_max_price = st.number_input(
+                "Prix maximum (€) (0 pour ignorer):",
+                min_value=0,
+                value=st.session_state.max_price,
+                step=10000,
+                key="max_price_input",
+            )
+        with filter_col2:
+            current_min_surface = st.number_input(
+                "Surface minimum (m²):",
+                min_value=0,
+                value=st.session_state.min_surface,
+                step=5,
+                key="min_surface_input",
+            )
+            current_max_surface = st.number_input(
+                "Surface maximum (m²) (0 pour ignorer):",
+                min_value=0,
+                value=st.session_state.max_surface,
+                step=5,
+                key="max_surface_input",
+            )
 
     map_placeholder = st.empty()
 
@@ -119,132 +231,79 @@ def display_property_map_page(data_processor, filtered_data_polars):
         st.session_state.min_surface = current_min_surface
         st.session_state.max_surface = current_max_surface
         st.session_state.map_display_key += 1  # Increment key to help refresh map
+        st.session_state.search_results_df = pd.DataFrame()  # Clear previous results
 
         if not st.session_state.search_postal_code:
             st.warning("Veuillez entrer un code postal pour la recherche.")
-            st.session_state.search_results_df = (
-                pd.DataFrame()
-            )  # Clear previous results
+        elif data_processor.get_spatial_index() is None:
+            st.warning("Aucune donnée de base à filtrer.")
         else:
-            all_properties_pd = data_processor.convert_to_pandas(filtered_data_polars)
-
-            if all_properties_pd.empty:
-                st.warning("Aucune donnée de base à filtrer.")
-                st.session_state.search_results_df = pd.DataFrame()
-                # Early exit if no base data
-                # The map_placeholder logic below will handle showing the "Entrez un code postal..." message
-            elif not all(
-                col in all_properties_pd.columns
-                for col in ["latitude", "longitude", "code_postal"]
-            ):
-                st.error(
-                    "Les colonnes 'latitude', 'longitude', et 'code_postal' sont nécessaires dans les données."
-                )
-                st.session_state.search_results_df = pd.DataFrame()
-            else:
-                # Ensure lat/lon are numeric and no NaNs for distance calculation
-                all_properties_pd["latitude"] = pd.to_numeric(
-                    all_properties_pd["latitude"], errors="coerce"
-                )
-                all_properties_pd["longitude"] = pd.to_numeric(
-                    all_properties_pd["longitude"], errors="coerce"
-                )
-                all_properties_pd.dropna(
-                    subset=["latitude", "longitude", "code_postal"], inplace=True
-                )
-
-                # Filter by postal code
-                pc_matches = all_properties_pd[
-                    all_properties_pd["code_postal"]
-                    == st.session_state.search_postal_code
-                ].copy()
+            postal_code_rows, results = search_properties(
+                data_processor,
+                st.session_state.search_postal_code,
+                st.session_state.search_radius_km,
+                selected_departments,
+                selected_types,
+                include_outliers,
+            )
 
-                if pc_matches.empty:
+            if postal_code_rows.is_empty():
+                st.info(
+                    f"Aucun bien trouvé pour le code postal {st.session_state.search_postal_code}."
+                )
+            elif st.session_state.search_radius_km > 0:
+                if results.is_empty():
                     st.info(
-                        f"Aucun bien trouvé pour le code postal {st.session_state.search_postal_code}."
+                        f"Aucun bien trouvé dans un rayon de {st.session_state.search_radius_km} km autour des biens du code postal {st.session_state.search_postal_code}."
                     )
-                    st.session_state.search_results_df = pd.DataFrame()
                 else:
-                    if st.session_state.search_radius_km > 0:
-                        center_lat_pc = pc_matches["latitude"].mean()
-                        center_lon_pc = pc_matches["longitude"].mean()
-
-                        if pd.isna(center_lat_pc) or pd.isna(center_lon_pc):
-                            st.warning(
-                                "Impossible de déterminer le centre pour la recherche par rayon. Affichage des résultats pour le code postal uniquement."
-                            )
-                            st.session_state.search_results_df = pc_matches
-                        else:
-                            # Calculate distances for all_properties_pd from this centroid
-                            # This ensures we search in the broader dataset around the postal code's center
-                            distances = all_properties_pd.apply(
-                                lambda row: haversine(
-                                    center_lat_pc,
-                                    center_lon_pc,
-                                    row["latitude"],
-                                    row["longitude"],
-                                ),
-                                axis=1,
-                            )
-                            st.session_state.search_results_df = all_properties_pd[
-                                distances <= st.session_state.search_radius_km
-                            ].copy()
-                            if st.session_state.search_results_df.empty:
-                                st.info(
-                                    f"Aucun bien trouvé dans un rayon de {st.session_state.search_radius_km} km autour des biens du code postal {st.session_state.search_postal_code}."
-                                )
-                            else:
-                                st.success(
-                                    f"{len(st.session_state.search_results_df)} biens trouvés."
-                                )
-                    else:  # Only postal code search
-                        st.session_state.search_results_df = pc_matches
-                        st.success(
-                            f"{len(st.session_state.search_results_df)} biens trouvés pour le code postal {st.session_state.search_postal_code}."
-                        )
+                    st.success(f"{results.height} biens trouvés.")
+            else:  # Only postal code search
+                st.success(
+                    f"{results.height} biens trouvés pour le code postal {st.session_state.search_postal_code}."
+                )
 
             # Apply optional filters if results exist
-            if not st.session_state.search_results_df.empty:
-                temp_results_df = st.session_state.search_results_df.copy()
-
+            if not results.is_empty():
+                conditions = []
                 # Price filter
                 if st.session_state.min_price > 0:
-                    temp_results_df = temp_results_df[
-                        temp_results_df["valeur_fonciere"] >= st.session_state.min_price
-                    ]
+                    conditions.append(
+                        pl.col("valeur_fonciere") >= st.session_state.min_price
+                    )
                 if st.session_state.max_price > 0:  # 0 means no upper limit
-                    temp_results_df = temp_results_df[
-                        temp_results_df["valeur_fonciere"] <= st.session_state.max_price
-                    ]
+                    conditions.append(
+                        pl.col("valeur_fonciere") <= st.session_state.max_price
+                    )
 
                 # Surface filter
                 if st.session_state.min_surface > 0:
-                    temp_results_df = temp_results_df[
-                        temp_results_df["surface_reelle_bati"]
-                        >= st.session_state.min_surface
-                    ]
+                    conditions.append(
+                        pl.col("surface_reelle_bati") >= st.session_state.min_surface
+                    )
                 if st.session_state.max_surface > 0:  # 0 means no upper limit
-                    temp_results_df = temp_results_df[
-                        temp_results_df["surface_reelle_bati"]
-                        <= st.session_state.max_surface
-                    ]
+                    conditions.append(
+                        pl.col("surface_reelle_bati") <= st.session_state.max_surface
+                    )
 
-                if (
-                    len(temp_results_df) < len(st.session_state.search_results_df)
-                    and len(temp_results_df) == 0
-                ):
+                filtered_results = results.filter(conditions) if conditions else results
+                if filtered_results.is_empty():
                     st.info(
                         "Aucun bien ne correspond aux filtres de prix/surface supplémentaires."
                     )
-                    st.session_state.search_results_df = (
-                        pd.DataFrame()
-                    )  # Clear results if filters leave nothing
-                elif len(temp_results_df) < len(st.session_state.search_results_df):
+                    results = filtered_results
+                elif filtered_results.height < results.height:
                     st.success(
-                        f"{len(temp_results_df)} biens correspondent également aux filtres de prix/surface."
+                        f"{filtered_results.height} biens correspondent également aux filtres de prix/surface."
                     )
-                    st.session_state.search_results_df = temp_results_df
-                # If no change in length, no message needed, original results are kept or already filtered results are kept.
+                    results = filtered_results
+                # If no change in length, no message needed
+
+            # Only the matching rows are converted for the map and charts
+            if not results.is_empty():
+                st.session_state.search_results_df = data_processor.convert_to_pandas(
+                    results
+                )
 
     # Display map if search results exist
     if not st.session_state.search_results_df.empty:
@@ -303,6 +362,7 @@ def display_property_map_page(data_processor, filtered_data_polars):
                 properties_to_display_pd  # Should be empty, but handles edge case
             )
 
+        parcel_history = data_processor.get_parcel_history()
         for idx, row in sampled_properties.iterrows():
             property_type = row.get("type_local", "N/A")
             marker_color = type_colors.get(property_type, type_colors["default"])
@@ -358,6 +418,8 @@ def display_property_map_page(data_processor, filtered_data_polars):
             <b>Prix/m²:</b> {row.get("price_per_sqm", 0):,.2f} €/m²<br>
             <b>Adresse:</b> {row.get("adresse_numero", "")} {row.get("adresse_nom_voie", "")}, {row.get("nom_commune", "")} ({row.get("code_postal", "")})<br>
             <b>Date Mutation:</b> {str(row.get("date_mutation", "N/A")).split(" ")[0]}<br>
+            {valuation_popup_html(row)}
+            {history_popup_html(parcel_history, row)}
             <a href="{street_view_url}" target="_blank">Voir sur Google Street View</a>
             """
             tooltip = f"{row.get('adresse_numero', '')} {row.get('adresse_nom_voie', '')}, {property_type} - {row.get('valeur_fonciere', 0):,.0f} €"
@@ -456,31 +518,30 @@ def display_property_map_page(data_processor, filtered_data_polars):
                     ]
 
                     if not last_12_months_data_for_plot.empty:
-                        # Sort 'type_local' for consistent order in box plot
-                        type_order = sorted(
-                            last_12_months_data_for_plot["type_local"].unique()
+                        # Quartiles, whiskers and capped outliers per type: the
+                        # browser receives a handful of numbers per box
+                        box_summary = summarize_distribution(
+                            pl.from_pandas(
+                                last_12_months_data_for_plot[
+                                    ["type_local", "price_per_sqm"]
+                                ]
+                            ),
+                            ["type_local"],
                         )
-
-                        fig_box = px.box(
-                            last_12_months_data_for_plot,
-                            x="type_local",
-                            y="price_per_sqm",
+                        fig_box = summary_box_figure(
+                            box_summary,
+                            "type_local",
                             title="Prix au m² par Type de Bien (12 Derniers Mois)",
                             labels={
                                 "price_per_sqm": "Prix au m² (€)",
                                 "type_local": "Type de Bien",
                             },
-                            points="outliers",  # Show outliers
-                            color="type_local",  # Color boxes by type_local
-                            category_orders={
-                                "type_local": type_order
-                            },  # Ensure consistent x-axis order
+                            category_order=sorted(box_summary["type_local"]),
                         )
                         fig_box.update_layout(
                             margin=dict(
                                 l=20, r=20, t=60, b=20
                             ),  # Adjusted top margin for title
-                            showlegend=False,  # Legend is redundant if color is same as x-axis categories
                         )
                         st.plotly_chart(fig_box, use_container_width=True)
                     else:
@@ -573,6 +634,8 @@ def display_property_map_page(data_processor, filtered_data_polars):
                         "Pas de données valides (date, prix/m², type) pour générer le graphique d'évolution."
                     )
 
+        display_valuation_outliers(properties_to_display_pd)
+
     elif (
         search_button and st.session_state.search_postal_code
     ):  # Searched but no results
@@ -585,3 +648,289 @@ def display_property_map_page(data_processor, filtered_data_polars):
             st.info(
                 "Entrez un code postal et cliquez sur 'Rechercher' pour afficher les biens immobiliers."
             )
+
+
+def history_popup_html(parcel_history, row):
+    """Popup lines listing the other recorded sales of the same parcel and lot."""
+    if parcel_history is None or pd.isna(row.get("id_parcelle")):
+        return ""
+    lot = row.get("lot1_numero")
+    key = (row["id_parcelle"], None if pd.isna(lot) else lot, row.get("type_local"))
+    if parcel_history.sale_count(*key) < 2:
+        return ""
+    lines = []
+    for sale in parcel_history.history(*key).iter_rows(named=True):
+        current = (
+            " (cette vente)" if sale["id_mutation"] == row.get("id_mutation") else ""
+        )
+        lines.append(
+            f"{sale['date_mutation']}: {sale['valeur_fonciere']:,.0f} €"
+            f" ({sale['price_per_sqm']:,.0f} €/m²){current}"
+        )
+    return "<b>Historique du bien:</b><br>" + "<br>".join(lines) + "<br>"
+
+
+def valuation_popup_html(row):
+    """Popup lines with the model estimate, empty when the sale was not scored."""
+    predicted = row.get("predicted_price_per_sqm")
+    gap = row.get("valuation_gap")
+    if predicted is None or pd.isna(predicted) or gap is None or pd.isna(gap):
+        return ""
+    return (
+        f"<b>Prix/m² estimé:</b> {predicted:,.0f} €/m² "
+        f"({gap:+.0%}, {row.get('valuation_flag', '')})<br>"
+    )
+
+
+def display_valuation_outliers(properties_pd):
+    """Sales of the search priced well below or above the valuation model."""
+    if "valuation_flag" not in properties_pd.columns:
+        return
+    st.markdown(
+        "<div class='sub-header'>Ventes éloignées de l'estimation du marché</div>",
+        unsafe_allow_html=True,
+    )
+    flag_counts = properties_pd["valuation_flag"].value_counts()
+    col1, col2, col3 = st.columns(3)
+    for col, flag in zip((col1, col2, col3), VALUATION_FLAGS):
+        with col:
+            st.metric(flag, f"{int(flag_counts.get(flag, 0)):,}")
+
+    outliers_pd = properties_pd[properties_pd["valuation_flag"] != "Dans le marché"]
+    outliers_pd = outliers_pd.dropna(subset=["valuation_gap"])
+    if outliers_pd.empty:
+        st.info("Aucune vente nettement sous ou au-dessus du marché dans la recherche.")
+        return
+    outliers_pd = outliers_pd.reindex(
+        outliers_pd["valuation_gap"].abs().sort_values(ascending=False).index
+    )
+    table_pd = outliers_pd[
+        [
+            "date_mutation",
+            "type_local",
+            "nom_commune",
+            "adresse_nom_voie",
+            "surface_reelle_bati",
+            "valeur_fonciere",
+            "price_per_sqm",
+            "predicted_price_per_sqm",
+            "valuation_gap",
+            "valuation_flag",
+        ]
+    ].head(50)
+    st.dataframe(
+        table_pd.assign(
+            price_per_sqm=table_pd["price_per_sqm"].round(0),
+            predicted_price_per_sqm=table_pd["predicted_price_per_sqm"].round(0),
+            valuation_gap=(table_pd["valuation_gap"] * 100).round(1),
+        ).rename(
+            columns={
+                "date_mutation": "Date",
+                "type_local": "Type",
+                "nom_commune": "Commune",
+                "adresse_nom_voie": "Voie",
+                "surface_reelle_bati": "Surface (m²)",
+                "valeur_fonciere": "Prix (€)",
+                "price_per_sqm": "Prix/m²",
+                "predicted_price_per_sqm": "Prix/m² estimé",
+                "valuation_gap": "Écart (%)",
+                "valuation_flag": "Position",
+            }
+        ),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+
+@st.fragment
+def display_area_search(
+    data_processor,
+    center,
+    selected_departments,
+    selected_types,
+    include_outliers=False,
+):
+    st.markdown(
+        "<div class='sub-header'>Recherche par zone</div>",
+        unsafe_allow_html=True,
+    )
+    spatial_index = data_processor.get_spatial_index()
+    if spatial_index is None:
+        st.info("Index spatial indisponible.")
+        return
+
+    tab_polygon, tab_rings = st.tabs(["Polygone", "Anneaux de distance"])
+
+    with tab_polygon:
+        uploaded_file = st.file_uploader(
+            "Importer un polygone GeoJSON (ou dessinez-le sur la carte)",
+            type=["geojson", "json"],
+            key="area_geojson_upload",
+        )
+        m = folium.Map(
+            location=list(center),
+            zoom_start=11,
+            tiles="cartodb positron",
+            scrollWheelZoom=True,
+        )
+        Draw(
+            draw_options={
+                "polyline": False,
+                "circle": False,
+                "marker": False,
+                "circlemarker": False,
+            },
+        ).add_to(m)
+        map_state = st_folium(
+            m,
+            height=500,
+            use_container_width=True,
+            key="area_draw_map",
+            returned_objects=["all_drawings"],
+        )
+
+        area_geojson = None
+        if uploaded_file is not None:
+            try:
+                area_geojson = json.load(uploaded_file)
+            except ValueError as e:
+                st.error(f"Fichier GeoJSON invalide: {e}")
+        elif map_state and map_state.get("all_drawings"):
+            area_geojson = {
+                "type": "FeatureCollection",
+                "features": map_state["all_drawings"],
+            }
+
+        polygons = geojson_polygons(area_geojson)
+        if not polygons:
+            st.info("Dessinez ou importez un polygone pour analyser la zone.")
+        else:
+            area_rows = apply_filters(
+                query_polygon(data_processor.data, spatial_index, area_geojson),
+                selected_departments,
+                selected_types,
+                include_outliers,
+            )
+            area_km2 = sum(polygon_area_km2(polygon) for polygon in polygons)
+            st.write(f"Surface de la zone: {area_km2:,.2f} km²")
+            display_selection_summary(data_processor, area_rows, by="type_local")
+
+    with tab_rings:
+        ring_col1, ring_col2 = st.columns(2)
+        with ring_col1:
+            ring_postal_code = st.text_input(
+                "Code postal du centre:", key="ring_postal_code_input"
+            )
+        with ring_col2:
+            radii_text = st.text_input(
+                "Rayons (km, séparés par des virgules):",
+                value="1, 2, 5",
+                key="ring_radii_input",
+            )
+        try:
+            radii_km = [float(r) for r in radii_text.split(",") if r.strip()]
+        except ValueError:
+            st.error("Les rayons doivent être des nombres séparés par des virgules.")
+            radii_km = []
+
+        if ring_postal_code and radii_km:
+            postal_code_rows = apply_filters(
+                query_postal_code(
+                    data_processor.data,
+                    data_processor.get_postal_code_index(),
+                    ring_postal_code,
+                ),
+                selected_departments,
+                selected_types,
+                include_outliers,
+            )
+            ring_lat = postal_code_rows["latitude"].mean()
+            ring_lon = postal_code_rows["longitude"].mean()
+            if ring_lat is None or ring_lon is None:
+                st.info(f"Aucun bien trouvé pour le code postal {ring_postal_code}.")
+            else:
+                ring_rows = apply_filters(
+                    query_rings(
+                        data_processor.data,
+                        spatial_index,
+                        ring_lat,
+                        ring_lon,
+                        radii_km,
+                    ),
+                    selected_departments,
+                    selected_types,
+                    include_outliers,
+                )
+                display_selection_summary(data_processor, ring_rows, by="ring")
+
+
+def display_selection_summary(data_processor, rows, by):
+    if rows.is_empty():
+        st.info("Aucun bien dans la zone sélectionnée.")
+        return
+
+    overall = summarize_selection(rows).row(0, named=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Transactions", f"{overall['transaction_count']:,}")
+    with col2:
+        st.metric("Prix médian au m²", f"{overall['median_price_per_sqm']:,.0f} €/m²")
+    with col3:
+        st.metric("Prix médian", f"{overall['median_price']:,.0f} €")
+
+    st.dataframe(
+        data_processor.convert_to_pandas(summarize_selection(rows, by=by)),
+        use_container_width=True,
+    )
+
+
+@st.fragment
+def display_vector_tile_map(
+    data_processor, center, selected_departments, selected_types, include_outliers
+):
+    st.markdown(
+        "<div class='sub-header'>Explorer toutes les transactions</div>",
+        unsafe_allow_html=True,
+    )
+    if not st.checkbox(
+        "Afficher toutes les transactions (tuiles vectorielles)",
+        key="show_vector_tiles",
+    ):
+        return
+
+    dataset_query = []
+    server = get_tile_server()
+    if server is not None:
+        # A key per processor, so a reloaded selection gets fresh tile URLs,
+        # and per outlier setting, so points and commune stats follow it
+        dataset = data_processor.processed_data.setdefault(
+            "tile_dataset", uuid.uuid4().hex
+        ) + ("-all" if include_outliers else "-market")
+        add_tile_dataset(
+            server,
+            dataset,
+            data_processor.data if include_outliers else data_processor.market_data(),
+        )
+        dataset_query = [("dataset", dataset)]
+    query = urlencode(
+        dataset_query
+        + [("code_departement", dep) for dep in selected_departments or []]
+        + [("type_local", type_name) for type_name in selected_types or []]
+    )
+    transactions_url = tile_url_template("transactions")
+    if query:
+        transactions_url += f"?{query}"
+    communes_url = tile_url_template("communes")
+    if dataset_query:
+        communes_url += f"?{urlencode(dataset_query)}"
+
+    m = folium.Map(
+        location=list(center),
+        zoom_start=9,
+        tiles="cartodb positron",
+        scrollWheelZoom=True,
+    )
+    VectorGridProtobuf(communes_url, "Communes", VECTOR_TILE_OPTIONS).add_to(m)
+    VectorGridProtobuf(transactions_url, "Transactions", VECTOR_TILE_OPTIONS).add_to(m)
+    folium.LayerControl().add_to(m)
+    folium_static(m, width=None, height=600)
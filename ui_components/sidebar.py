@@ -1,27 +1,70 @@
 import polars as pl
 import streamlit as st
 
+from analytics.summary_stats import SummaryStats
+from ui_components.pages import PAGE_NAMES
 
-def display_sidebar_controls(raw_data):
+
+def department_label(department, description):
+    """Department option label with its years, from DatasetRegistry.describe()."""
+    if description["first_year"] is None:
+        return department
+    if description["first_year"] == description["last_year"]:
+        return f"{department} ({description['first_year']})"
+    return f"{department} ({description['first_year']}–{description['last_year']})"
+
+
+def display_department_selector(registry):
+    """
+    Department filter drawn from the dataset registry, before any data is loaded.
+
+    Only the selected departments are then loaded; by default the first
+    one, so startup does not grow with the number of departments.
+    """
     st.sidebar.markdown(
         '<div class="section-header">Filtres</div>', unsafe_allow_html=True
     )
+    descriptions = {dep: registry.describe(dep) for dep in registry.departments}
+    return st.sidebar.multiselect(
+        "Départements",
+        options=registry.departments,
+        default=registry.default_departments,
+        format_func=lambda dep: department_label(dep, descriptions[dep]),
+        help="Les données d'un département sont chargées à sa première sélection.",
+    )
 
-    # Ensure 'code_departement' and 'type_local' columns exist
-    if "code_departement" not in raw_data.columns:
-        st.sidebar.error("Colonne 'code_departement' manquante dans les données.")
-        # Provide default empty list or handle error as appropriate
-        available_departments = []
-    else:
-        available_departments = sorted(raw_data["code_departement"].unique().to_list())
 
-    selected_departments = st.sidebar.multiselect(
-        "Départements", options=available_departments, default=available_departments
-    )
+def display_sidebar_controls(raw_data, filter_index=None, selected_departments=None):
+    # Precomputed options spare a unique() over the frame on every rerun
+    options = filter_index.options if filter_index is not None else {}
+
+    if selected_departments is None:
+        st.sidebar.markdown(
+            '<div class="section-header">Filtres</div>', unsafe_allow_html=True
+        )
+        # Ensure 'code_departement' and 'type_local' columns exist
+        if "code_departement" not in raw_data.columns:
+            st.sidebar.error("Colonne 'code_departement' manquante dans les données.")
+            # Provide default empty list or handle error as appropriate
+            available_departments = []
+        elif "code_departement" in options:
+            available_departments = options["code_departement"]
+        else:
+            available_departments = sorted(
+                raw_data["code_departement"].unique().to_list()
+            )
+
+        selected_departments = st.sidebar.multiselect(
+            "Départements",
+            options=available_departments,
+            default=available_departments,
+        )
 
     if "type_local" not in raw_data.columns:
         st.sidebar.error("Colonne 'type_local' manquante dans les données.")
         available_types = []
+    elif "type_local" in options:
+        available_types = options["type_local"]
     else:
         available_types = sorted(raw_data["type_local"].unique().to_list())
 
@@ -29,23 +72,42 @@ def display_sidebar_controls(raw_data):
         "Types de biens", options=available_types, default=available_types
     )
 
+    include_outliers = st.sidebar.checkbox(
+        "Inclure les prix aberrants",
+        value=False,
+        help="Prix au m² hors des bornes robustes (médiane ± écarts absolus "
+        "médians) de leur commune et type de bien.",
+    )
+
     st.sidebar.markdown(
         '<div class="section-header">Navigation</div>', unsafe_allow_html=True
     )
     page = st.sidebar.radio(
         "Sélectionnez une visualisation",
-        [
-            "Prix au m²",
-            "Tendances du marché",
-            "Données démographiques",
-            "Carte des biens",
-        ],
+        PAGE_NAMES,
     )
-    return page, selected_departments, selected_types
+    return page, selected_departments, selected_types, include_outliers
 
 
-def apply_filters(raw_data, selected_departments, selected_types):
+def apply_filters(
+    raw_data,
+    selected_departments,
+    selected_types,
+    include_outliers=False,
+    filter_index=None,
+):
+    if filter_index is not None:
+        # One bitmap selection instead of a filter pass per condition;
+        # filter_index must be built on raw_data
+        return filter_index.select(
+            raw_data,
+            departments=selected_departments,
+            types=selected_types,
+            include_outliers=include_outliers,
+        )
     filtered_data = raw_data
+    if not include_outliers and "is_outlier" in raw_data.columns:
+        filtered_data = filtered_data.filter(~pl.col("is_outlier"))
     if selected_departments and "code_departement" in raw_data.columns:
         filtered_data = filtered_data.filter(
             pl.col("code_departement").is_in(selected_departments)
@@ -55,19 +117,54 @@ def apply_filters(raw_data, selected_departments, selected_types):
     return filtered_data
 
 
-def create_sidebar(raw_data):
-    page, selected_departments, selected_types = display_sidebar_controls(raw_data)
-    filtered_data = apply_filters(raw_data, selected_departments, selected_types)
-
+def display_summary_statistics(summary):
+    """Sidebar KPIs of the filtered data, from a SummaryStats.get() dict."""
     st.sidebar.markdown(
-        '<div class="sub-header">Statistiques</div>', unsafe_allow_html=True
+        '<div class="sub-header">Statistiques (Données Filtrées)</div>',
+        unsafe_allow_html=True,
     )
-    st.sidebar.info(f"Nombre de transactions: {filtered_data.shape[0]:,}")
-    if filtered_data.shape[0] > 0:
-        avg_price = filtered_data["valeur_fonciere"].mean()
-        st.sidebar.info(f"Prix moyen: {avg_price:,.2f} €")
+    st.sidebar.info(f"Nombre de transactions: {summary['transaction_count']:,}")
+    if not summary["transaction_count"]:
+        st.sidebar.info("Aucune transaction après filtrage.")
+        return
+    if summary["avg_price"] is not None:
+        st.sidebar.info(f"Prix moyen: {summary['avg_price']:,.2f} €")
+    if summary["avg_price_per_sqm"] is not None:
+        st.sidebar.info(f"Prix moyen au m²: {summary['avg_price_per_sqm']:,.2f} €/m²")
+    if summary["median_price_per_sqm"] is not None:
+        st.sidebar.info(
+            f"Prix médian au m²: {summary['median_price_per_sqm']:,.0f} €/m²"
+        )
+    if summary["yoy_change"] is not None:
+        st.sidebar.info(
+            f"Évolution du prix moyen au m² en {summary['latest_year']}: "
+            f"{summary['yoy_change']:+.1%}"
+        )
+
 
-        avg_price_sqm = filtered_data["price_per_sqm"].mean()
-        st.sidebar.info(f"Prix moyen au m²: {avg_price_sqm:,.2f} €/m²")
+def create_sidebar(
+    raw_data, filter_index=None, summary_stats=None, selected_departments=None
+):
+    """
+    Filters, navigation and statistics of the sidebar.
+
+    selected_departments comes from display_department_selector when the
+    departments are chosen before loading; the selector is drawn here
+    otherwise.
+    """
+    page, selected_departments, selected_types, include_outliers = (
+        display_sidebar_controls(raw_data, filter_index, selected_departments)
+    )
+    filtered_data = apply_filters(
+        raw_data, selected_departments, selected_types, include_outliers, filter_index
+    )
+    if summary_stats is None:
+        # No shared service: sum the filtered rows once, already filtered
+        summary = SummaryStats(filtered_data).get(include_outliers=True)
+    else:
+        summary = summary_stats.get(
+            selected_departments, selected_types, include_outliers
+        )
+    display_summary_statistics(summary)
 
-    return page, filtered_data, selected_departments, selected_types
+    return page, filtered_data, selected_departments, selected_types, include_outliers
@@ -0,0 +1,183 @@
+"""Background warm-up of indexes, engines and default-filter results."""
+
+import threading
+import time
+import traceback
+
+from analytics.price_index import ALL_TYPES
+from ui_components.pages import PAGE_NAMES, load_page
+
+
+def default_filters(data_processor):
+    """The sidebar's initial selection: every department and type, no outliers."""
+    data = data_processor.data
+    return (
+        sorted(data["code_departement"].unique().to_list()),
+        sorted(data["type_local"].unique().to_list()),
+        False,
+    )
+
+
+def _import_pages(data_processor):
+    for name in PAGE_NAMES:
+        load_page(name)
+
+
+def _price_indices(data_processor):
+    departments, types, _ = default_filters(data_processor)
+    data_processor.get_price_index_engine().get_indices(
+        level="department", codes=departments, types=types + [ALL_TYPES]
+    )
+
+
+def _commune_trends(data_processor):
+    departments, _, _ = default_filters(data_processor)
+    data_processor.get_trend_engine().movers(departments=departments, types=[ALL_TYPES])
+
+
+def _distributions(data_processor):
+    departments, types, include_outliers = default_filters(data_processor)
+    store = data_processor.get_distribution_store()
+    for by in (["type_local"], ["year", "month"], ["year", "month", "type_local"]):
+        store.summary(by, departments, types, include_outliers)
+
+
+def _breakdowns(data_processor):
+    data_processor.get_transaction_breakdowns().get(*default_filters(data_processor))
+
+
+def _parcel_history(data_processor):
+    departments, types, _ = default_filters(data_processor)
+    data_processor.get_parcel_history().turnover(departments=departments, types=types)
+
+
+# (label, step) in the order pages need them; labels are shown in the UI
+WARMUP_STEPS = [
+    ("Pages", _import_pages),
+    ("Communes (GeoJSON)", lambda dp: dp.get_commune_features()),
+    ("Grille de prix", lambda dp: dp.get_price_grid()),
+    ("Distributions de prix", _distributions),
+    ("Cube mensuel", lambda dp: dp.get_monthly_cube()),
+    ("Indices de prix", _price_indices),
+    ("Statistiques glissantes", lambda dp: dp.get_rolling_stats_engine()),
+    ("Tendances par commune", _commune_trends),
+    ("Saisonnalité", lambda dp: dp.get_seasonality_engine()),
+    ("Historique des parcelles", _parcel_history),
+    ("Répartitions", _breakdowns),
+    ("Index spatial", lambda dp: dp.get_spatial_index()),
+    ("Comparables", lambda dp: dp.get_comparables_engine()),
+]
+
+
+class Warmup:
+    """
+    Builds every lazily cached structure of a processor ahead of users.
+
+    Attached to a DataResource, it warms the first processor in a
+    background thread as soon as it is loaded, and warms refreshed
+    processors in the refresh thread before they are swapped in, so
+    sessions only ever see warm data after the first load. A failing step
+    is logged and skipped; the page then builds it on demand as before.
+    It can be attached to several resources: processors loaded while one is
+    being warmed wait their turn, the most recently loaded first.
+    """
+
+    def __init__(self, steps=None):
+        self.steps = steps if steps is not None else WARMUP_STEPS
+        # Progress of each run, so overlapping runs (refresh thread and
+        # pending thread) never overwrite each other's
+        self._runs = []
+        self._thread = None
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def attach(self, resource):
+        resource.prepare_hooks.append(self.run)
+        resource.loaded_hooks.append(self.start)
+        if resource.current is not None:
+            self.start(resource.current)
+        return self
+
+    def start(self, data_processor):
+        """Warm data_processor in a background thread unless already warm."""
+        if data_processor.processed_data.get("warmed_up"):
+            return None
+        with self._lock:
+            if data_processor not in self._pending:
+                self._pending.append(data_processor)
+            if self._thread is not None and self._thread.is_alive():
+                return self._thread
+            self._thread = threading.Thread(
+                target=self._run_pending, name="warmup", daemon=True
+            )
+            self._thread.start()
+            return self._thread
+
+    def _run_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    # Under the lock, so start() cannot queue behind a finished thread
+                    self._thread = None
+                    return
+                data_processor = self._pending.pop()
+            if not data_processor.processed_data.get("warmed_up"):
+                self.run(data_processor)
+
+    def run(self, data_processor):
+        """Run every step on data_processor in the calling thread."""
+        state = {
+            "completed": 0,
+            "current_step": None,
+            "errors": {},
+            "started_at": time.time(),
+            "finished_at": None,
+        }
+        with self._lock:
+            # Only running runs and the last finished one are reported
+            self._runs = [run for run in self._runs if run["finished_at"] is None] + [
+                state
+            ]
+        for label, step in self.steps:
+            state["current_step"] = label
+            step_start = time.perf_counter()
+            try:
+                step(data_processor)
+            except Exception as e:
+                print(f"Warm-up step '{label}' failed: {e}")
+                traceback.print_exc()
+                state["errors"][label] = str(e)
+            print(f"Warm-up: {label} in {time.perf_counter() - step_start:.2f} s.")
+            state["completed"] += 1
+        state["current_step"] = None
+        state["finished_at"] = time.time()
+        data_processor.processed_data["warmed_up"] = True
+        print(
+            f"Warm-up finished in {state['finished_at'] - state['started_at']:.1f} s."
+        )
+
+    def progress(self):
+        """
+        Dict with total, completed, current_step, running and errors.
+
+        Reports the most recently started run still in progress, else the
+        last finished one.
+        """
+        with self._lock:
+            running = [run for run in self._runs if run["finished_at"] is None]
+            state = (running or self._runs or [None])[-1]
+        if state is None:
+            return {
+                "total": len(self.steps),
+                "completed": 0,
+                "current_step": None,
+                "running": False,
+                "errors": {},
+            }
+        return {
+            "total": len(self.steps),
+            "completed": state["completed"],
+            "current_step": state["current_step"],
+            "running": state["finished_at"] is None,
+            "errors": dict(state["errors"]),
+        }